@@ -0,0 +1,301 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from data_processor import DataProcesser
+from data_reader import DataReader
+from query_processor import QueryProcessor
+from schedule_index import ScheduleIndex
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+# Name parts never contain a day abbreviation, so rows without a comma still split on the first day
+NAME_PREFIXES = ["Golden", "Little", "Blue", "Royal", "Happy", "Old", "Green", "Red", "Lucky", "Grand", "Spicy", "Wild"]
+NAME_WORDS = ["Dragon", "Garden", "Kitchen", "Bistro", "Palace", "Grill", "Noodle", "Taqueria", "Pizza", "Curry", "Deli",
+              "Oyster", "Crab", "Bakery", "Cantina", "Diner", "Izakaya", "Ramen", "Pho", "Lounge", "Bar", "Cafe"]
+NAME_SUFFIXES = ["Restaurant", "House", "Express", "& Bar", "Co.", "Place", "Corner", ""]
+
+# Day lists covering the week, split into 1 - 3 "/" separated segments
+WEEK_LAYOUTS = [
+    ["Mon-Sun"],
+    ["Mon-Fri", "Sat-Sun"],
+    ["Mon-Thu, Sun", "Fri-Sat"],
+    ["Mon, Wed-Sun"],
+    ["Tue-Sat"],
+    ["Fri-Mon"],
+    ["Mon-Thu", "Fri", "Sat-Sun"],
+    ["Sat-Tue", "Wed-Fri"],
+    ["Mon-Sat", "Sun"],
+]
+OPEN_TIMES = ["6 am", "7 am", "7:30 am", "8 am", "9 am", "10 am", "10:30 am", "11 am", "11:30 am", "12 pm", "4 pm", "5 pm", "5:30 pm"]
+CLOSE_TIMES = ["2 pm", "3 pm", "9 pm", "9:30 pm", "10 pm", "10:30 pm", "11 pm", "12 am", "1 am", "2 am", "3:30 am"]
+
+# Cold start of a worker that loads the schedule and answers one query, run in a fresh interpreter.
+# argv: input file, day, time
+STARTUP_SCRIPTS = {
+    'startup_lite': '''
+import json, sys, time
+started = time.perf_counter()
+from lite_schedule import LiteSchedule
+imported = time.perf_counter()
+schedule = LiteSchedule.from_files([sys.argv[1]])
+loaded = time.perf_counter()
+schedule.open_restaurants(sys.argv[2], sys.argv[3])
+print(json.dumps({'import_seconds': imported - started, 'load_seconds': loaded - imported, 'first_query_seconds': time.perf_counter() - loaded}))
+''',
+    'startup_pandas': '''
+import json, sys, time
+started = time.perf_counter()
+from data_processor import DataProcesser
+from data_reader import DataReader
+from query_processor import QueryProcessor
+imported = time.perf_counter()
+df = DataProcesser.build_restaurant_df(DataReader([sys.argv[1]]).get_restaurants_df())
+loaded = time.perf_counter()
+QueryProcessor.get_open_restaurants(df, sys.argv[2], sys.argv[3])
+print(json.dumps({'import_seconds': imported - started, 'load_seconds': loaded - imported, 'first_query_seconds': time.perf_counter() - loaded}))
+''',
+}
+
+
+def generate_timings(rng: random.Random) -> str:
+    """ Random timings string with 1 - 3 segments, wrapping day ranges and past-midnight closes """
+    segments = []
+    for days in rng.choice(WEEK_LAYOUTS):
+        open_time, close_time = rng.choice(OPEN_TIMES), rng.choice(CLOSE_TIMES)
+        if rng.random() < 0.2:
+            open_time, close_time = open_time.upper(), close_time.upper()
+        segments.append(f"{days} {open_time} - {close_time}")
+    return "  / ".join(segments)
+
+
+def generate_line(rng: random.Random, i: int) -> str:
+    """ Random CSV line in one of the layouts found in real feeds """
+    name = " ".join(part for part in [rng.choice(NAME_PREFIXES), rng.choice(NAME_WORDS), rng.choice(NAME_SUFFIXES)] if part)
+    name = f"{name} #{i}"
+    timings = generate_timings(rng)
+    layout = rng.random()
+    if layout < 0.7:
+        return f'"{name}","{timings}"'
+    if layout < 0.85:
+        return f"{name},{timings}"
+    if layout < 0.95 or "," in timings:
+        return f'"{name}, {timings}",'
+    # Missing comma between the name and the timings. Only used when the timings have no comma of
+    # their own, the reader would split on that one instead
+    return f"{name} {timings}"
+
+
+def generate_schedule_file(file_path: str, restaurants: int, seed: int = 0):
+    """
+    Writes a synthetic schedule CSV
+
+    Args:
+        file_path (str): Output path
+        restaurants (int): Number of restaurants (lines)
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    with open(file_path, 'w') as file:
+        for i in range(restaurants):
+            file.write(generate_line(rng, i) + "\n")
+
+
+def measure(function: Callable, track_memory: bool) -> Dict:
+    """ Wall time of one call and, in a second call under tracemalloc, its peak allocation """
+    started = time.perf_counter()
+    result = function()
+    stats = {'seconds': time.perf_counter() - started}
+    if track_memory:
+        tracemalloc.start()
+        function()
+        stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    stats['result'] = result
+    return stats
+
+
+def measure_startup(file_path: str, day: str = 'Mon', input_time: str = '11:30 AM') -> Dict[str, Dict]:
+    """
+    Import time, load time and first query latency of the standard library path (LiteSchedule) and
+    the pandas path (DataProcesser + QueryProcessor), each in a fresh interpreter
+
+    Args:
+        file_path (str): Input CSV file
+        day (str, optional): Day of the query. Defaults to 'Mon'.
+        input_time (str, optional): Time of the query. Defaults to '11:30 AM'.
+
+    Returns:
+        Dict[str, Dict]: seconds (total) and the import / load / first query split per path
+    """
+    stages = {}
+    for stage, script in STARTUP_SCRIPTS.items():
+        output = subprocess.run([sys.executable, '-c', script, file_path, day, input_time], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        stats = json.loads(output.splitlines()[-1])
+        stages[stage] = dict(seconds=sum(stats.values()), **stats)
+    return stages
+
+
+def run_benchmark(restaurants: int, queries: int = 1000, track_memory: bool = True, seed: int = 0, startup: bool = True) -> Dict[str, Dict]:
+    """
+    Times every stage on a synthetic schedule of the given size
+
+    Args:
+        restaurants (int): Number of restaurants
+        queries (int, optional): Number of point queries. Defaults to 1000.
+        track_memory (bool, optional): Measure peak memory of every stage. Defaults to True.
+        seed (int, optional): Random seed. Defaults to 0.
+        startup (bool, optional): Measure cold start of the lite and pandas paths. Defaults to True.
+
+    Returns:
+        Dict[str, Dict]: seconds (and peak_bytes) per stage
+    """
+    rng = random.Random(seed)
+    days = [rng.choice(ParserUtils.days) for _ in range(queries)]
+    times = [f"{rng.randint(1, 12)}:{rng.choice(['00', '15', '30', '45'])} {rng.choice(['AM', 'PM'])}" for _ in range(queries)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, f"synthetic_{restaurants}.csv")
+        generate_schedule_file(file_path, restaurants, seed)
+
+        stages = {}
+        stages['read'] = measure(lambda: DataReader([file_path]).get_restaurants_df(), track_memory)
+        raw_df = stages['read']['result']
+
+        def process():
+            DataProcesser.clear_parse_cache()
+            return DataProcesser.build_restaurant_df(raw_df)
+        stages['process'] = measure(process, track_memory)
+        df = stages['process']['result']
+
+        names = rng.sample(df['restaurant_name'].unique().tolist(), min(100, df['restaurant_name'].nunique()))
+        stages['index'] = measure(lambda: ScheduleIndex.from_df(df), track_memory)
+        ScheduleIndex.register(df, stages['index']['result'])
+        stages['get_open_restaurants'] = measure(
+            lambda: [QueryProcessor.get_open_restaurants(df, day, input_time) for day, input_time in zip(days, times)], track_memory)
+        stages['get_open_restaurants_batch'] = measure(
+            lambda: QueryProcessor.get_open_restaurants_batch(df, days, times, as_pairs=True), track_memory)
+        stages['get_restaurant_open_timings'] = measure(
+            lambda: QueryProcessor.get_restaurant_open_timings(df, names), track_memory)
+        stages['generate_insights'] = measure(lambda: QueryProcessor.generate_insights(df), track_memory)
+        startup_stages = measure_startup(file_path, days[0], times[0]) if startup else {}
+
+    for stats in stages.values():
+        stats.pop('result')
+    stages['get_open_restaurants']['queries'] = queries
+    stages['get_open_restaurants_batch']['queries'] = queries
+    stages['get_restaurant_open_timings']['queries'] = len(names)
+    stages.update(startup_stages)
+    return stages
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Stages that got slower than the baseline run by more than the threshold
+
+    Args:
+        results (Dict): Current benchmark output
+        baseline (Dict): Previous benchmark output
+        threshold (float): Allowed relative slowdown (0.2 = 20%)
+
+    Returns:
+        List[str]: Description of every regression
+    """
+    regressions = []
+    for size, stages in results['sizes'].items():
+        for stage, stats in stages.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if previous and stats['seconds'] > previous['seconds'] * (1 + threshold):
+                regressions.append(f"{size} {stage}: {previous['seconds']:.4f}s -> {stats['seconds']:.4f}s")
+    return regressions
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark reading, processing and querying synthetic schedules")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Number of restaurants per run")
+    parser.add_argument('--queries', type=int, default=1000, help="Point queries per run")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc peak memory pass")
+    parser.add_argument('--no-startup', action='store_true', help="Skip the cold start measurement of the lite and pandas paths")
+    parser.add_argument('--output', help="Write the JSON results to this file")
+    parser.add_argument('--compare', help="Previous JSON results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative slowdown against --compare")
+    options = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(name)s - %(levelname)s - %(message)s')
+
+    results = {
+        'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+        'sizes': {},
+    }
+    for size in options.sizes:
+        logger.info(f"Benchmarking {size} restaurants")
+        results['sizes'][str(size)] = run_benchmark(size, options.queries, not options.no_memory, startup=not options.no_startup)
+
+    output = json.dumps(results, indent=2)
+    if options.output:
+        with open(options.output, 'w') as file:
+            file.write(output)
+    print(output)
+
+    if options.compare:
+        with open(options.compare) as file:
+            regressions = compare(results, json.load(file), options.threshold)
+        for regression in regressions:
+            logger.error(f"Regression {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_generated_rows_parse(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "synthetic.csv")
+            generate_schedule_file(file_path, 300, seed=1)
+            raw_df = DataReader([file_path]).get_restaurants_df()
+            self.assertEqual(len(raw_df), 300)
+            self.assertTrue(raw_df['Restaurant'].str.match(r".* #\d+$").all())
+
+            df = DataProcesser.build_restaurant_df(raw_df)
+            self.assertEqual(df['restaurant_name'].nunique(), 300)
+
+    def test_run_benchmark(self):
+        stages = run_benchmark(200, queries=20, track_memory=False, startup=False)
+        self.assertEqual(list(stages), ['read', 'process', 'index', 'get_open_restaurants', 'get_open_restaurants_batch',
+                                        'get_restaurant_open_timings', 'generate_insights'])
+        self.assertTrue(all(stats['seconds'] >= 0 for stats in stages.values()))
+
+        results = {'sizes': {'200': stages}}
+        slower = {'sizes': {'200': {stage: {'seconds': stats['seconds'] / 10} for stage, stats in stages.items()}}}
+        self.assertEqual(compare(results, results, 0.2), [])
+        self.assertEqual(len(compare(results, slower, 0.2)), len(stages))
+
+    def test_measure_startup(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "synthetic.csv")
+            generate_schedule_file(file_path, 50)
+            stages = measure_startup(file_path)
+        self.assertEqual(list(stages), ['startup_lite', 'startup_pandas'])
+        for stats in stages.values():
+            self.assertAlmostEqual(stats['seconds'], stats['import_seconds'] + stats['load_seconds'] + stats['first_query_seconds'])
+
+if __name__ == '__main__':
+    sys.exit(main())
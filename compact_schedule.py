@@ -0,0 +1,139 @@
+import logging
+import os
+from datetime import datetime
+from typing import Iterable, Tuple
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+DAY_IDS = {day: i for i, day in enumerate(ParserUtils.days)}
+
+
+class CompactSchedule:
+    """
+    Columnar form of the processed restaurant schedule. Every row of build_restaurant_df output is
+    stored as a restaurant id into a name dictionary, a uint8 day of the week and int16 open / close
+    minutes of the day, instead of Python strings and datetime objects.
+    """
+
+    def __init__(self, names: np.ndarray, restaurant_id: np.ndarray, day: np.ndarray, open_minute: np.ndarray, close_minute: np.ndarray):
+        self.names = names
+        self.restaurant_id = restaurant_id
+        self.day = day
+        self.open_minute = open_minute
+        self.close_minute = close_minute
+
+    def __len__(self):
+        return len(self.restaurant_id)
+
+    @staticmethod
+    def _from_columns(names: Iterable[str], days: Iterable[str], open_minutes: Iterable[int], close_minutes: Iterable[int]) -> 'CompactSchedule':
+        codes, uniques = pd.factorize(pd.Series(list(names), dtype=object))
+        return CompactSchedule(
+            names=np.asarray(uniques, dtype=object),
+            restaurant_id=codes.astype(np.uint32),
+            day=np.fromiter((DAY_IDS[day] for day in days), dtype=np.uint8),
+            open_minute=np.asarray(open_minutes, dtype=np.int16),
+            close_minute=np.asarray(close_minutes, dtype=np.int16),
+        )
+
+    @staticmethod
+    def from_records(records: Iterable[Tuple[str, str, datetime, datetime]]) -> 'CompactSchedule':
+        """
+        Build from (restaurant, day, open time, close time) records
+
+        Args:
+            records (Iterable[Tuple[str, str, datetime, datetime]]): Records collected by build_restaurant_df
+
+        Returns:
+            CompactSchedule: Columnar schedule
+        """
+        records = list(records)
+        return CompactSchedule._from_columns(
+            (record[0] for record in records),
+            (record[1] for record in records),
+            [ParserUtils.to_minutes(record[2]) for record in records],
+            [ParserUtils.to_minutes(record[3]) for record in records],
+        )
+
+    @staticmethod
+    def from_df(df: pd.DataFrame) -> 'CompactSchedule':
+        """
+        Build from the output of DataProcesser.build_restaurant_df
+
+        Args:
+            df (pd.DataFrame): Processed dataframe with restaurant schedule
+
+        Returns:
+            CompactSchedule: Columnar schedule
+        """
+        open_time = pd.to_datetime(df['open_time'])
+        close_time = pd.to_datetime(df['close_time'])
+        return CompactSchedule._from_columns(
+            df['restaurant_name'].tolist(),
+            df['day'].tolist(),
+            (open_time.dt.hour * 60 + open_time.dt.minute).to_numpy(),
+            (close_time.dt.hour * 60 + close_time.dt.minute).to_numpy(),
+        )
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        Expands back to the build_restaurant_df layout
+
+        Returns:
+            pd.DataFrame: DataFrame with restaurants, day of week, open and close timings
+        """
+        base = pd.Timestamp(1900, 1, 1)
+        return pd.DataFrame({
+            'restaurant_name': self.names[self.restaurant_id].tolist() if len(self) else [],
+            'day': np.asarray(ParserUtils.days, dtype=object)[self.day].tolist() if len(self) else [],
+            'open_time': base + pd.to_timedelta(self.open_minute.astype(np.int64), unit='m'),
+            'close_time': base + pd.to_timedelta(self.close_minute.astype(np.int64), unit='m'),
+        })
+
+    @property
+    def nbytes(self) -> int:
+        """ Size of the arrays and the name dictionary in bytes """
+        names_bytes = sum(len(name.encode()) for name in self.names)
+        return names_bytes + self.restaurant_id.nbytes + self.day.nbytes + self.open_minute.nbytes + self.close_minute.nbytes
+
+
+class TestCompactSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.sample_data = {
+            'restaurant_name': ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse'],
+            'day': ['Mon', 'Mon', 'Tue', 'Tue', 'Wed'],
+            'open_time': [datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("12:00 AM", "%I:%M %p"), datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("12:00 AM", "%I:%M %p")],
+            'close_time': [datetime.strptime("10:00 PM", "%I:%M %p"), datetime.strptime("11:59 PM", "%I:%M %p"), datetime.strptime("01:00 AM", "%I:%M %p"), datetime.strptime("11:59 PM", "%I:%M %p"), datetime.strptime("01:00 AM", "%I:%M %p")]
+        }
+        self.df = pd.DataFrame(self.sample_data)
+
+    def test_from_df(self):
+        schedule = CompactSchedule.from_df(self.df)
+        self.assertEqual(schedule.names.tolist(), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        self.assertEqual(schedule.restaurant_id.tolist(), [0, 1, 1, 1, 1])
+        self.assertEqual(schedule.day.tolist(), [0, 0, 1, 1, 2])
+        self.assertEqual(schedule.open_minute.tolist(), [660, 660, 0, 660, 0])
+        self.assertEqual(schedule.close_minute.tolist(), [1320, 1439, 60, 1439, 60])
+
+    def test_round_trip(self):
+        result_df = CompactSchedule.from_df(self.df).to_df()
+        self.assertEqual(result_df[['restaurant_name', 'day']].values.tolist(), self.df[['restaurant_name', 'day']].values.tolist())
+        self.assertTrue((result_df['open_time'] == self.df['open_time']).all())
+        self.assertTrue((result_df['close_time'] == self.df['close_time']).all())
+
+    def test_from_records(self):
+        records = list(self.df.itertuples(index=False, name=None))
+        schedule = CompactSchedule.from_records(records)
+        self.assertEqual(schedule.close_minute.tolist(), CompactSchedule.from_df(self.df).close_minute.tolist())
+
+if __name__ == '__main__':
+    unittest.main()
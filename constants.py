@@ -0,0 +1,18 @@
+import re
+from datetime import datetime, timedelta
+
+# Splits a line into restaurant name and timings when the comma separator is missing
+NAME_TIMINGS_PATTERN = re.compile(r"(.*?)((?:mon|tue|wed|thu|fri|sat|sun).*?(?:am|pm).*$)", re.IGNORECASE)
+
+# Boundaries used to split timings that go past midnight
+DAY_START_TIME = datetime(1900, 1, 1, 0, 0)
+DAY_END_TIME = datetime(1900, 1, 1, 23, 59)
+
+# Time of day for every minute, parsed minutes turn into datetime values with a list lookup
+DAY_TIMES = [DAY_START_TIME + timedelta(minutes=minute) for minute in range(24 * 60)]
+
+# "12:00 AM" ... "11:59 PM" for every minute of the day, so formatting a schedule row is two list lookups
+TIME_LABELS = [f"{(minute // 60) % 12 or 12:02d}:{minute % 60:02d} {'AM' if minute < 720 else 'PM'}" for minute in range(24 * 60)]
+
+# Maximum number of distinct timings strings kept in the parse cache
+PARSE_CACHE_SIZE = 65536
@@ -1,73 +1,214 @@
+from __future__ import annotations
+
 import logging
 import os
-import pandas as pd
-import re
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple, Union
 import unittest
-from utils import ParserUtils
+from constants import DAY_TIMES
+from instrumentation import metrics
+from schedule_parser import ScheduleParser
+from utils import LazyModule, ParserUtils
+
+if TYPE_CHECKING:
+    from compact_schedule import CompactSchedule
+
+# pandas and NumPy are only imported once a DataFrame is asked for, the lite path never does
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
 
 filename = os.path.basename(__file__)
 
-logging.basicConfig(level=logging.DEBUG, format='%(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(filename)
 
+RECORD_COLUMNS = ['restaurant_name', 'day', 'open_time', 'close_time']
+
 class DataProcesser:
         
-    def build_restaurant_df(df: pd.DataFrame) -> pd.DataFrame:
+    def build_restaurant_df(df: pd.DataFrame, compact: bool = False, quarantine: Optional[list] = None) -> Union[pd.DataFrame, CompactSchedule]:
         """
         1. Read the dataframe with restaurant names and timings
-        2. Iterate through timings separated by /
-        3. Split the timing string to day of the week and the time range
-        4. Iterate over the days of the week and and store timings for each day
-        5. Handle 24 hour boundary to capture open timings after 12:00 AM. 
+        2. Factorize the timings column, every distinct timings string is parsed once (ScheduleParser):
+           segments separated by /, day lists and ranges, and the time range in minutes
+        3. Handle 24 hour boundary to capture open timings after 12:00 AM. 
            Create new entry for next day starting at 12:00AM
+        4. Expand the (day, open, close) entries of every distinct string to the rows using it with
+           array arithmetic (np.repeat over flat entry offsets) instead of a loop over the rows
+        5. Put rows with segments that do not parse in the quarantine with the reasons, their valid
+           segments are still kept
         6. Returns a dataframe with multiple rows (if restaurant is open for multiple time windows) 
            for restaurant names, day of week, open and close timings
 
         Args:
             df (pd.DataFrame): DataFrame with restaurant name and timings  
+            compact (bool, optional): Return a CompactSchedule (restaurant ids, uint8 days and
+                int16 minutes) instead of a DataFrame. Defaults to False.
+            quarantine (Optional[list], optional): Receives {'restaurant', 'timings', 'reasons'}
+                for every row with rejected segments. Defaults to None.
 
         Returns:
             pd.DataFrame: DataFrame with restaurants, day of week, open and close timings 
         """            
-        records = []
+        rows = skipped = quarantined = records = 0
         try:
-            for _, row in df.iterrows():
-                restaurant, timings = row['Restaurant'], row['Timings']
-                logger.debug(f"Building {restaurant} {timings}")
-                restaurant = restaurant.strip()
-                for timing in timings.split('/'):
-                    weektimings = re.match(r"(.*?)\s+(?=\d+)(.*)", timing.strip()) # TODO Consider moving to constants?
-                    days_str = weektimings.group(1)
-                    times_str = weektimings.group(2)
-
-                    start_time, end_time = ParserUtils.extract_time(times_str)
-                   
-                    # check if start_time or end_time is None
-                    if not start_time or not end_time:
-                        logger.debug(f"Invalid time format {times_str}: Skipping restaurant {restaurant}")
-                        continue
-                    # check if days_str is None or not parsed
-                    if not days_str or not ParserUtils.extract_days(days_str):
-                        logger.debug(f"Invalid days format {days_str}: Skipping restaurant {restaurant}")
-                        continue
-                    
-                    # If end_time < start_time, means the time is beyond 24 hours and flows to the next day
-                    if end_time and start_time and end_time < start_time:
-                        for day in ParserUtils.extract_days(days_str):
-                            records.append((restaurant, day, start_time, datetime.strptime("11:59 PM", "%I:%M %p")))
-                            next_day = ParserUtils.days[(ParserUtils.days.index(day) + 1) % 7]
-                            records.append((restaurant, next_day, datetime.strptime("12:00 AM", "%I:%M %p"), end_time))
-                    else:
-                        for day in ParserUtils.extract_days(days_str):
-                            records.append((restaurant, day, start_time, end_time))
-
-            df = pd.DataFrame(records, columns=['restaurant_name', 'day', 'open_time', 'close_time'])
-            logger.debug(df)
+            with metrics.timer('processor.build_restaurant_df'):
+                name_codes, names = pd.factorize(df['Restaurant'])
+                timing_codes, timings = pd.factorize(df['Timings'])
+                if (name_codes < 0).any() or (timing_codes < 0).any():
+                    raise ValueError("Missing restaurant name or timings")
+                names = np.array([name.strip() for name in names.tolist()], dtype=object)
+                timings = timings.tolist()
+                rows = len(timing_codes)
+
+                # Distinct timings strings are split into "/" segments and every distinct segment is parsed once
+                segment_ids, segments, segment_codes, segment_counts = {}, [], [], []
+                for value in timings:
+                    parts = " ".join(value.split()).lower().split('/')
+                    segment_counts.append(len(parts))
+                    for part in parts:
+                        part = part.strip()
+                        parsed = ScheduleParser.parse(part)
+                        code = segment_ids.setdefault(part, len(segments))
+                        if code == len(segments):
+                            segments.append(parsed)
+                        segment_codes.append(code)
+                segment_codes = np.array(segment_codes, dtype=np.int64)
+                segment_counts = np.array(segment_counts, dtype=np.int64)
+                entry_counts = np.array([len(entries) for entries, _ in segments], dtype=np.int64)
+                entries = np.array([entry for segment_entries, _ in segments for entry in segment_entries], dtype=np.int64).reshape(-1, 3)
+
+                # Entries of every distinct timings string, then of every row, gathered with array arithmetic
+                string_entries = DataProcesser._gather(entry_counts, segment_codes)
+                string_counts = DataProcesser._group_sums(entry_counts[segment_codes], segment_counts)
+                day, open_minute, close_minute = entries[string_entries[DataProcesser._gather(string_counts, timing_codes)]].T
+                row_counts = string_counts[timing_codes]
+                records = int(row_counts.sum())
+                restaurant = names[np.repeat(name_codes, row_counts)]
+                day = np.array(ParserUtils.days, dtype=object)[day]
+
+                reason_counts = DataProcesser._group_sums(np.array([len(reasons) for _, reasons in segments], dtype=np.int64)[segment_codes], segment_counts)[timing_codes]
+                bad_rows = np.flatnonzero(reason_counts)
+                skipped, quarantined = int(reason_counts.sum()), len(bad_rows)
+                if quarantine is not None:
+                    segment_offsets = np.cumsum(segment_counts) - segment_counts
+                    for i in bad_rows.tolist():
+                        string = timing_codes[i]
+                        codes = segment_codes[segment_offsets[string]:segment_offsets[string] + segment_counts[string]].tolist()
+                        quarantine.append({'restaurant': names[name_codes[i]], 'timings': timings[string],
+                                           'reasons': [reason for code in codes for reason in segments[code][1]]})
+
+                if compact:
+                    from compact_schedule import CompactSchedule
+                    return CompactSchedule._from_columns(restaurant.tolist(), day.tolist(), open_minute, close_minute)
+
+                if not records:
+                    return pd.DataFrame([], columns=RECORD_COLUMNS)
+                # Times are built in the datetime unit pandas infers for the records, so no column is converted twice
+                dtypes = DataProcesser._record_dtypes()
+                base = np.datetime64('1900-01-01T00:00')
+                df = pd.DataFrame({
+                    'restaurant_name': restaurant,
+                    'day': day,
+                    'open_time': (base + open_minute.astype('timedelta64[m]')).astype(dtypes['open_time']),
+                    'close_time': (base + close_minute.astype('timedelta64[m]')).astype(dtypes['close_time']),
+                }).astype(dtypes)
+                logger.debug("Built %s", df)
         except Exception as e:
+            metrics.increment('processor.parse_failures')
             logger.error(e)
+        finally:
+            metrics.increment('processor.rows_processed', rows)
+            metrics.increment('processor.segments_skipped', skipped)
+            metrics.increment('processor.rows_quarantined', quarantined)
+            metrics.increment('processor.records_emitted', records)
         return df
 
+    @staticmethod
+    def _gather(counts: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """ Indices of the items of groups `codes`, in order, from items stored back to back in groups of `counts` """
+        offsets = np.cumsum(counts) - counts
+        sizes = counts[codes]
+        return np.repeat(offsets[codes] - (np.cumsum(sizes) - sizes), sizes) + np.arange(int(sizes.sum()))
+
+    @staticmethod
+    def _group_sums(values: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        """ Sums of consecutive groups of `sizes` values """
+        return np.bincount(np.repeat(np.arange(len(sizes)), sizes), weights=values, minlength=len(sizes)).astype(np.int64)
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _record_dtypes() -> dict:
+        """ Column dtypes pandas infers for (name, day, datetime, datetime) records, the columnar build is cast to them """
+        return pd.DataFrame([("", ParserUtils.days[0], DAY_TIMES[0], DAY_TIMES[0])], columns=RECORD_COLUMNS).dtypes.to_dict()
+
+    def build_restaurant_df_chunks(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        Streaming version of build_restaurant_df. Processes one chunk of restaurants at a time
+        (see DataReader.iter_chunks) so only a single chunk is held in memory
+
+        Args:
+            chunks (Iterable[pd.DataFrame]): DataFrames with restaurant name and timings
+
+        Yields:
+            pd.DataFrame: DataFrame with restaurants, day of week, open and close timings
+        """
+        for chunk in chunks:
+            yield DataProcesser.build_restaurant_df(chunk)
+
+    def build_restaurant_dfs(dfs: List[pd.DataFrame], workers: Optional[int] = None, executor: str = 'process') -> pd.DataFrame:
+        """
+        Runs build_restaurant_df on every DataFrame concurrently (see DataReader.get_file_dfs)
+        and merges the results in input order
+
+        Args:
+            dfs (List[pd.DataFrame]): DataFrames with restaurant name and timings, one per file
+            workers (Optional[int], optional): Pool size. Defaults to the executor default.
+            executor (str, optional): 'process' or 'thread'. Defaults to 'process'.
+
+        Returns:
+            pd.DataFrame: DataFrame with restaurants, day of week, open and close timings
+        """
+        if executor not in ('process', 'thread'):
+            raise ValueError(f"Unknown executor {executor}, expected 'process' or 'thread'")
+        if not dfs:
+            return pd.DataFrame([], columns=RECORD_COLUMNS)
+
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_class(max_workers=workers) as pool:
+            frames = list(pool.map(DataProcesser.build_restaurant_df, dfs))
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def expand_timings(timings: str) -> Tuple[Tuple[str, datetime, datetime], ...]:
+        """
+        Expands a timings string into (day, open time, close time) entries. Segments that do not
+        parse are left out, see ScheduleParser.parse for the reasons
+
+        Args:
+            timings (str): Timings string (Mon-Thu, Sun 11:30 am - 10 pm  / Fri-Sat 11:30 am - 11 pm)
+
+        Returns:
+            Tuple[Tuple[str, datetime, datetime], ...]: Day of week, open and close timings
+        """
+        entries, _ = ScheduleParser.parse(" ".join(timings.split()))
+        return tuple((ParserUtils.days[day], DAY_TIMES[open_minute], DAY_TIMES[close_minute]) for day, open_minute, close_minute in entries)
+
+    @staticmethod
+    def parse_cache_info():
+        """
+        Hit / miss statistics of the timings parse cache
+
+        Returns:
+            CacheInfo: hits, misses, maxsize and currsize of the cache
+        """
+        return ScheduleParser.parse.cache_info()
+
+    @staticmethod
+    def clear_parse_cache():
+        ScheduleParser.parse.cache_clear()
+
 class TestQueryProcessor(unittest.TestCase):
 
     def setUp(self):
@@ -124,6 +265,72 @@ class TestQueryProcessor(unittest.TestCase):
             (result_df['day'] == 'Tue')]['open_time'].iloc[0] 
         self.assertEqual(tuesday_open_time, datetime.strptime("12:00 AM", "%I:%M %p"))
 
+    def test_build_restaurant_df_chunks(self):
+        df = pd.DataFrame(self.sample_data)
+        chunks = [df.iloc[i:i + 3] for i in range(0, len(df), 3)]
+        result_df = pd.concat(DataProcesser.build_restaurant_df_chunks(chunks), ignore_index=True)
+        self.assertTrue(result_df.equals(DataProcesser.build_restaurant_df(df)))
+
+    def test_build_restaurant_dfs(self):
+        df = pd.DataFrame(self.sample_data)
+        dfs = [df.iloc[:3], df.iloc[3:]]
+        for executor in ('thread', 'process'):
+            result_df = DataProcesser.build_restaurant_dfs(dfs, workers=2, executor=executor)
+            self.assertTrue(result_df.equals(DataProcesser.build_restaurant_df(df)))
+
+    def test_build_compact_schedule(self):
+        df = pd.DataFrame(self.sample_data)
+        schedule = DataProcesser.build_restaurant_df(df, compact=True)
+        result_df = DataProcesser.build_restaurant_df(df)
+        self.assertEqual(len(schedule), len(result_df))
+        self.assertEqual(schedule.to_df()['restaurant_name'].tolist(), result_df['restaurant_name'].tolist())
+        self.assertTrue((schedule.to_df()['close_time'] == result_df['close_time']).all())
+
+    def test_metrics(self):
+        metrics.reset()
+        df = pd.DataFrame(self.sample_data)
+        result_df = DataProcesser.build_restaurant_df(df)
+        self.assertEqual(metrics.counter('processor.rows_processed'), len(df))
+        self.assertEqual(metrics.counter('processor.records_emitted'), len(result_df))
+        self.assertEqual(metrics.counter('processor.parse_failures'), 0)
+        self.assertEqual(metrics.histogram('processor.build_restaurant_df')['count'], 1)
+
+    def test_quarantine(self):
+        metrics.reset()
+        df = pd.DataFrame({
+            'Restaurant': ["Kushi Tsuru", "Mifune Restaurant", "Bow Hon Restaurant"],
+            'Timings': ["Mon-Sun 11 am - 10 pm", "Mon 11:30 ma - 9:00 pm / Tue 11 am - 10 pm", "Mo-Fri 11 am - 1 am"]
+        })
+        quarantine = []
+        result_df = DataProcesser.build_restaurant_df(df, quarantine=quarantine)
+        self.assertEqual(result_df['restaurant_name'].tolist(), ["Kushi Tsuru"] * 7 + ["Mifune Restaurant"])
+        self.assertEqual([row['restaurant'] for row in quarantine], ["Mifune Restaurant", "Bow Hon Restaurant"])
+        self.assertIn("invalid time '11:30 ma'", quarantine[0]['reasons'][0])
+        self.assertIn("unknown day 'mo'", quarantine[1]['reasons'][0])
+        self.assertEqual(metrics.counter('processor.rows_quarantined'), 2)
+        self.assertEqual(metrics.counter('processor.segments_skipped'), 2)
+
+    def test_matches_row_expansion(self):
+        df = pd.DataFrame({
+            'Restaurant': self.sample_data['Restaurant'] + ["Kushi Tsuru", "Mifune Restaurant"],
+            'Timings': self.sample_data['Timings'] + ["Mon-Sun 11 am - 10:30 pm", "Mon 11:30 ma - 9:00 pm / Tue 11 am - 10 pm /"]
+        })
+        expected = [(restaurant.strip(), day, open_time, close_time) for restaurant, timings in zip(df['Restaurant'], df['Timings'])
+                    for day, open_time, close_time in DataProcesser.expand_timings(timings)]
+        result_df = DataProcesser.build_restaurant_df(df)
+        self.assertTrue(result_df.equals(pd.DataFrame(expected, columns=RECORD_COLUMNS)))
+        self.assertTrue(DataProcesser.build_restaurant_df(df.iloc[:0]).empty)
+
+    def test_parse_cache(self):
+        DataProcesser.clear_parse_cache()
+        df = pd.DataFrame({
+            'Restaurant': ["Mifune Restaurant", "Kushi Tsuru", "Bow Hon Restaurant"],
+            'Timings': ["Mon-Sun 11 am - 10 pm", "Mon-Sun  11 am - 10 pm ", "Mon-Sun 11 am - 1 am"]
+        })
+        result_df = DataProcesser.build_restaurant_df(df)
+        self.assertEqual(len(result_df), 28)
+        info = DataProcesser.parse_cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
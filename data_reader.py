@@ -1,70 +1,230 @@
+from __future__ import annotations
+
 import os
 import tempfile
 import unittest
-import pandas as pd
 import logging
-import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from constants import NAME_TIMINGS_PATTERN
+from instrumentation import metrics
+from utils import LazyModule, ParserUtils
 
-from utils import ParserUtils
+# pandas is only imported once a DataFrame is asked for, the lite path never does
+pd = LazyModule('pandas')
 
 filename = os.path.basename(__file__)
 
-logging.basicConfig(level=logging.DEBUG, format='%(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(filename)
 
 class DataReader:
-    def __init__(self, filenames):
+    columns = ['Restaurant', 'Timings']
+
+    def __init__(self, filenames, chunk_size: Optional[int] = None, workers: Optional[int] = None, executor: str = 'process',
+                 quarantine: Optional[list] = None):
         self.filenames = filenames
-        self.df = self._parse_files()
+        # Receives {'file', 'line', 'text', 'reasons'} for every line that cannot be split into name and timings
+        self.quarantine = quarantine
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.executor = executor
+        self.file_dfs = []
+        self.df = None
+        # Streaming readers hand out chunks through iter_chunks instead of loading everything up front
+        if chunk_size is None:
+            self.df = self._parse_files_parallel() if workers else self._parse_files()
 
-    def _parse_files(self):
+    @staticmethod
+    def _read_file(filename: str, stats: Optional[Dict[str, int]] = None, quarantine: Optional[list] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Reads restaurant name and timings string from every line of a file.
+        Lines without a comma separator are split on the first day of the week, lines that cannot
+        be split are skipped and quarantined
+
+        Args:
+            filename (str): Path of the csv file
+            stats (Optional[Dict[str, int]], optional): Receives the lines read and skipped.
+                Defaults to None, which adds them to the reader metrics.
+            quarantine (Optional[list], optional): Receives the skipped lines with the reason. Defaults to None.
+
+        Yields:
+            Tuple[str, str]: Restaurant name and timings string
+        """
+        lines_read = rows_skipped = 0
+        try:
+            with open(filename, 'r') as file:
+                for line in file:
+                    lines_read += 1
+                    line = line.strip()
+
+                    parts = line.split(',', 1)
+                    if len(parts) == 1:
+                        match = NAME_TIMINGS_PATTERN.search(line)
+                        if match:
+                            start_index = match.start(2)
+                            yield ParserUtils.clean_string(line[:start_index]), ParserUtils.clean_string(line[start_index:])
+                        else:
+                            rows_skipped += 1
+                            if quarantine is not None and line:
+                                quarantine.append({'file': filename, 'line': lines_read, 'text': line,
+                                                   'reasons': ["no comma and no day / time range to split the restaurant name from"]})
+                    else:
+                        yield ParserUtils.clean_string(parts[0]), ParserUtils.clean_string(parts[1])
+        finally:
+            # Counted once per file so the per-line loop stays free of locking
+            if stats is None:
+                DataReader._record_stats({'lines_read': lines_read, 'rows_skipped': rows_skipped})
+            else:
+                stats.update(lines_read=lines_read, rows_skipped=rows_skipped)
+
+    @staticmethod
+    def _record_stats(stats: Dict[str, int]):
+        metrics.increment('reader.files_read')
+        metrics.increment('reader.lines_read', stats['lines_read'])
+        metrics.increment('reader.rows_skipped', stats['rows_skipped'])
+        metrics.increment('reader.rows_emitted', stats['lines_read'] - stats['rows_skipped'])
+
+    @staticmethod
+    def _iter_files(filenames, quarantine: Optional[list] = None) -> Iterator[Tuple[str, str]]:
+        for filename in filenames:
+            if(ParserUtils.is_valid_csv(filename)):
+                logger.debug("%s validated", filename)
+                yield from DataReader._read_file(filename, quarantine=quarantine)
+            else:
+                raise Exception("Invalid file")
+
+    @staticmethod
+    def stream_rows(filenames, quarantine: Optional[list] = None) -> Iterator[Tuple[str, str]]:
         """ 
         1. Loop through input files
         2. Open file and read line
         3. Check if comma separated - clean up string if not
-        4. Append data in a list 
-        5. Create Dataframe with restaurant name and timings string
+        4. Yield restaurant name and timings string one line at a time
 
-        Returns:
-            dataframe: Name of Restaurants and their timings
+        Nothing is loaded up front and no DataFrame is built, so streaming the rows never imports pandas
+
+        Args:
+            filenames: Input CSV files
+            quarantine (Optional[list], optional): Receives the lines that cannot be split. Defaults to None.
+
+        Yields:
+            Tuple[str, str]: Restaurant name and timings string
         """
-        rows = []
+        found = False
+        debug = logger.isEnabledFor(logging.DEBUG)
         try:
-            for filename in self.filenames:
-                if(ParserUtils.is_valid_csv(filename)):
-                    logger.debug(f"{filename} validated")
-                    with open(filename, 'r') as file:
-                        for line in file:
-                            line = line.strip()
-            
-                            parts = line.split(',', 1)
-                            if len(parts) == 1:
-                                match = re.search(r"(.*?)((?:mon|tue|wed|thu|fri|sat|sun).*?(?:am|pm).*$)", line, re.IGNORECASE)
-                                if match:
-                                    start_index = match.start()
-                                    rows.append(ParserUtils.clean_string(line[:start_index]), ParserUtils.clean_string(line[start_index:]))
-                            else:    
-                                rows.append((ParserUtils.clean_string(parts[0]), ParserUtils.clean_string(parts[1])))
-                            logger.debug(rows)
-                else:
-                    raise Exception("Invalid file")
+            for row in DataReader._iter_files(filenames, quarantine):
+                if debug:
+                    logger.debug("Read %s", row)
+                found = True
+                yield row
         except FileNotFoundError as f:
             logger.error(f)
             raise f
         except Exception as e:
             logger.error(e)
 
+        # check if no rows were read
+        if not found:
+            raise Exception(f"No data found in the {filenames}")
+
+    def iter_rows(self) -> Iterator[Tuple[str, str]]:
+        """ Restaurant name and timings string of every input line, see DataReader.stream_rows """
+        return DataReader.stream_rows(self.filenames, self.quarantine)
+
+    def iter_chunks(self, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Streams the input files as DataFrames of at most chunk_size rows, so memory is bounded
+        by the chunk size and not the file size
+
+        Args:
+            chunk_size (Optional[int], optional): Rows per chunk. Defaults to the reader chunk size.
+
+        Yields:
+            pd.DataFrame: Name of Restaurants and their timings
+        """
+        chunk_size = chunk_size or self.chunk_size or 10000
+        rows = []
+        for row in self.iter_rows():
+            rows.append(row)
+            if len(rows) == chunk_size:
+                yield pd.DataFrame(rows, columns=self.columns)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows, columns=self.columns)
+
+    def _parse_files(self):
+        """ 
+        Reads every input file into a single DataFrame
+
+        Returns:
+            dataframe: Name of Restaurants and their timings
+        """
+        with metrics.timer('reader.read'):
+            return pd.DataFrame(list(self.iter_rows()), columns=self.columns)
+
+    @staticmethod
+    def _load_file(filename: str) -> Tuple[pd.DataFrame, Dict[str, int], list]:
+        if not ParserUtils.is_valid_csv(filename):
+            raise Exception("Invalid file")
+        logger.debug("%s validated", filename)
+        # Worker processes have their own metrics, so the counts and quarantined lines travel back with the rows
+        stats = {}
+        quarantine = []
+        df = pd.DataFrame(list(DataReader._read_file(filename, stats, quarantine)), columns=DataReader.columns)
+        return df, stats, quarantine
+
+    def _parse_files_parallel(self):
+        """
+        Reads the input files concurrently on a process pool (or a thread pool for I/O bound inputs).
+        Results are merged in the order of self.filenames and reading stops at the first invalid
+        file, same as the sequential reader
+
+        Returns:
+            dataframe: Name of Restaurants and their timings
+        """
+        if self.executor not in ('process', 'thread'):
+            raise ValueError(f"Unknown executor {self.executor}, expected 'process' or 'thread'")
+
+        pool_class = ProcessPoolExecutor if self.executor == 'process' else ThreadPoolExecutor
+        with metrics.timer('reader.read'), pool_class(max_workers=self.workers) as pool:
+            futures = [pool.submit(DataReader._load_file, filename) for filename in self.filenames]
+            try:
+                for future in futures:
+                    file_df, stats, quarantine = future.result()
+                    DataReader._record_stats(stats)
+                    if self.quarantine is not None:
+                        self.quarantine.extend(quarantine)
+                    self.file_dfs.append(file_df)
+            except FileNotFoundError as f:
+                logger.error(f)
+                raise f
+            except Exception as e:
+                logger.error(e)
+            finally:
+                for future in futures:
+                    future.cancel()
+
         # check if the list is empty
-        if not rows:
+        if not any(len(file_df) for file_df in self.file_dfs):
             raise Exception(f"No data found in the {self.filenames}")
-        
-        return pd.DataFrame(rows, columns=['Restaurant', 'Timings'])
+
+        return pd.concat(self.file_dfs, ignore_index=True)
+
+    def get_file_dfs(self):
+        """ Per file DataFrames, in input order, loaded by the parallel reader """
+        return self.file_dfs
 
     def get_restaurants_df(self):
+        if self.df is None:
+            self.df = pd.concat(self.iter_chunks(), ignore_index=True)
         return self.df
 
     def get_timings(self, restaurant_name):
-        timing = self.df[self.df['Restaurant'] == restaurant_name]['Timings']
+        # Streaming readers have no DataFrame until one is asked for
+        df = self.get_restaurants_df()
+        timing = df[df['Restaurant'] == restaurant_name]['Timings']
         return timing.values[0] if not timing.empty else None
 
 class TestDataReader(unittest.TestCase):
@@ -95,6 +255,46 @@ class TestDataReader(unittest.TestCase):
         self.assertEqual(reader.get_timings("Sapporo-Ya Japanese Restaurant"), "Mon-Sat 11 am - 11 pm  / Sun 11 am - 10:30 pm")
         self.assertEqual(reader.get_timings("Santorini's Mediterranean Cuisine"), "Mon-Sun 8 am - 10:30 pm")
 
+    def test_iter_chunks(self):
+        files = [self.sample1_path, self.sample2_path]
+        reader = DataReader(files, chunk_size=1)
+        self.assertIsNone(reader.df)
+
+        chunks = list(reader.iter_chunks())
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1])
+        self.assertTrue(pd.concat(chunks, ignore_index=True).equals(DataReader(files).get_restaurants_df()))
+        self.assertEqual(DataReader(files, chunk_size=1).get_timings("Santorini's Mediterranean Cuisine"), "Mon-Sun 8 am - 10:30 pm")
+
+    def test_parallel_read(self):
+        files = [self.sample1_path, self.sample2_path]
+        expected = DataReader(files).get_restaurants_df()
+        for executor in ('thread', 'process'):
+            reader = DataReader(files, workers=2, executor=executor)
+            self.assertTrue(reader.get_restaurants_df().equals(expected))
+            self.assertEqual([len(file_df) for file_df in reader.get_file_dfs()], [1, 1])
+
+        # Reading stops at the first invalid file, keeping the files before it
+        reader = DataReader([self.sample1_path, "missing.csv", self.sample2_path], workers=2, executor='thread')
+        self.assertEqual(reader.get_restaurants_df()['Restaurant'].tolist(), ["Sapporo-Ya Japanese Restaurant"])
+
+    def test_metrics(self):
+        metrics.reset()
+        DataReader([self.sample1_path, self.sample2_path])
+        self.assertEqual(metrics.counter('reader.files_read'), 2)
+        self.assertEqual(metrics.counter('reader.lines_read'), 2)
+        self.assertEqual(metrics.counter('reader.rows_emitted'), 2)
+        self.assertEqual(metrics.histogram('reader.read')['count'], 1)
+
+    def test_quarantine(self):
+        bad_path = os.path.join(self.temp_dir.name, "bad.csv")
+        with open(bad_path, "w") as f:
+            f.write("Kushi Tsuru Mon-Sun 11:30 am - 9 pm\nNo schedule at all\n")
+        for workers in (None, 2):
+            quarantine = []
+            df = DataReader([bad_path], workers=workers, executor='thread', quarantine=quarantine).get_restaurants_df()
+            self.assertEqual(df['Restaurant'].tolist(), ["Kushi Tsuru"])
+            self.assertEqual([(row['line'], row['text']) for row in quarantine], [(2, "No schedule at all")])
+
     def tearDown(self):
         # Cleanup temporary directory after the test completes
         self.temp_dir.cleanup()
@@ -0,0 +1,234 @@
+import logging
+import os
+from typing import List, Optional, Tuple, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from constants import TIME_LABELS
+from schedule_index import MINUTES_PER_DAY, MINUTES_PER_WEEK, ScheduleIndex, cached_for_df
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+# Event index cache keyed on id() of the processed dataframe, see cached_for_df
+_EVENT_INDEX_CACHE = {}
+
+
+class EventIndex:
+    """
+    Sorted open and close events over minute-of-week.
+
+    Rows of a restaurant that touch or overlap are merged first, so the 11:59 PM / 12:00 AM rows
+    build_restaurant_df creates for timings past midnight, including Sun -> Mon, give one opening and
+    one closing. Every query is then a binary search on an event array plus a slice.
+    """
+
+    def __init__(self, schedule: CompactSchedule):
+        self.names = schedule.names
+        restaurant_id = np.asarray(schedule.restaurant_id, dtype=np.int64)
+        starts = np.asarray(schedule.day, dtype=np.int64) * MINUTES_PER_DAY + np.asarray(schedule.open_minute, dtype=np.int64)
+        ends = np.asarray(schedule.day, dtype=np.int64) * MINUTES_PER_DAY + np.asarray(schedule.close_minute, dtype=np.int64)
+
+        run_restaurant, run_start, run_end = EventIndex.merge_runs(restaurant_id, starts, ends)
+
+        # A restaurant open through Sun 11:59 PM and from Mon 12:00 AM neither opens on Monday nor
+        # closes on Sunday, its last run carries on into its first one
+        first_run = np.ones(len(run_start), dtype=bool)
+        first_run[1:] = run_restaurant[1:] != run_restaurant[:-1]
+        last_run = np.ones(len(run_start), dtype=bool)
+        last_run[:-1] = first_run[1:]
+        wraps = np.zeros(len(self.names), dtype=bool)
+        wraps[run_restaurant[first_run]] = run_start[first_run] == 0
+        wraps[run_restaurant[last_run]] &= run_end[last_run] == MINUTES_PER_WEEK - 1
+
+        opens = ~(first_run & wraps[run_restaurant])
+        closes = ~(last_run & wraps[run_restaurant])
+        open_order = np.argsort(run_start[opens], kind='stable')
+        self._open_minutes = run_start[opens][open_order]
+        self._open_restaurants = run_restaurant[opens][open_order]
+        close_order = np.argsort(run_end[closes], kind='stable')
+        self._close_minutes = run_end[closes][close_order]
+        self._close_restaurants = run_restaurant[closes][close_order]
+
+        # Openings grouped by restaurant (already sorted by minute within each) for next_open
+        self._restaurant_opens = run_start[opens]
+        self._restaurant_offsets = np.searchsorted(run_restaurant[opens], np.arange(len(self.names) + 1))
+        self._ids = {name: i for i, name in enumerate(self.names.tolist())}
+
+    @staticmethod
+    def merge_runs(restaurant_id: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Merges the rows of every restaurant that touch or overlap into runs
+
+        Args:
+            restaurant_id (np.ndarray): Restaurant id of every row
+            starts (np.ndarray): First open minute-of-week of every row
+            ends (np.ndarray): Last open minute-of-week of every row
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Restaurant id, first and last minute of every
+            run, sorted by restaurant and start
+        """
+        order = np.lexsort((starts, restaurant_id))
+        restaurant_id, starts, ends = restaurant_id[order], starts[order], ends[order]
+
+        # Running max of the end within each restaurant, offsetting by restaurant keeps groups apart
+        running_end = np.maximum.accumulate(restaurant_id * 2 * MINUTES_PER_WEEK + ends) - restaurant_id * 2 * MINUTES_PER_WEEK
+        new_run = np.ones(len(starts), dtype=bool)
+        new_run[1:] = (restaurant_id[1:] != restaurant_id[:-1]) | (starts[1:] > running_end[:-1] + 1)
+
+        run_index = np.flatnonzero(new_run)
+        run_end = np.maximum.reduceat(ends, run_index) if len(run_index) else ends
+        return restaurant_id[run_index], starts[run_index], run_end
+
+    @staticmethod
+    def from_df(df: Union[pd.DataFrame, CompactSchedule]) -> 'EventIndex':
+        """
+        Build an event index from the output of DataProcesser.build_restaurant_df
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+
+        Returns:
+            EventIndex: Open and close events over the schedule
+        """
+        return EventIndex(df if isinstance(df, CompactSchedule) else CompactSchedule.from_df(df))
+
+    @staticmethod
+    def for_df(df: Union[pd.DataFrame, CompactSchedule]) -> 'EventIndex':
+        """
+        Returns the event index for a processed schedule, building it on first use and reusing it afterwards
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+
+        Returns:
+            EventIndex: Cached event index over the schedule
+        """
+        return cached_for_df(_EVENT_INDEX_CACHE, df, lambda: EventIndex.from_df(df))
+
+    @staticmethod
+    def _window(minutes: np.ndarray, point: int, within: int) -> List[slice]:
+        """ Slices of a sorted event array falling in [point, point + within], wrapping past Sun 11:59 PM """
+        within = min(within, MINUTES_PER_WEEK - 1)
+        end = point + within
+        if end < MINUTES_PER_WEEK:
+            return [slice(np.searchsorted(minutes, point, 'left'), np.searchsorted(minutes, end, 'right'))]
+        return [slice(np.searchsorted(minutes, point, 'left'), len(minutes)),
+                slice(0, np.searchsorted(minutes, end - MINUTES_PER_WEEK, 'right'))]
+
+    def _events(self, minutes: np.ndarray, restaurants: np.ndarray, day: str, minute: int, within: int) -> List[str]:
+        if day not in ParserUtils.days:
+            return []
+        ids = [restaurants[window] for window in self._window(minutes, ScheduleIndex.minute_of_week(day, minute), within)]
+        return list(dict.fromkeys(self.names[np.concatenate(ids)].tolist()))
+
+    def opening_within(self, day: str, minute: int, within: int) -> List[str]:
+        """
+        Restaurants opening between the given minute and `within` minutes later
+
+        Args:
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            minute (int): Minute of the day
+            within (int): Window length in minutes
+
+        Returns:
+            List[str]: Restaurant names, earliest opening first
+        """
+        return self._events(self._open_minutes, self._open_restaurants, day, minute, within)
+
+    def closing_within(self, day: str, minute: int, within: int) -> List[str]:
+        """
+        Restaurants whose last open minute falls between the given minute and `within` minutes later
+
+        Args:
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            minute (int): Minute of the day
+            within (int): Window length in minutes
+
+        Returns:
+            List[str]: Restaurant names, earliest closing first
+        """
+        return self._events(self._close_minutes, self._close_restaurants, day, minute, within)
+
+    def next_open(self, name: str, day: str, minute: int) -> Optional[Tuple[str, str]]:
+        """
+        Next opening of a restaurant at or after the given time, wrapping into the next week
+
+        Args:
+            name (str): Exact restaurant name
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            minute (int): Minute of the day
+
+        Returns:
+            Optional[Tuple[str, str]]: Day and 12 hour time of the opening. None for an unknown
+            restaurant or one that is open around the clock
+        """
+        restaurant_id = self._ids.get(name)
+        if restaurant_id is None:
+            return None
+        opens = self._restaurant_opens[self._restaurant_offsets[restaurant_id]:self._restaurant_offsets[restaurant_id + 1]]
+        if not len(opens):
+            return None
+
+        position = np.searchsorted(opens, ScheduleIndex.minute_of_week(day, minute), 'left')
+        opening = int(opens[position % len(opens)])
+        return ParserUtils.days[opening // MINUTES_PER_DAY], TIME_LABELS[opening % MINUTES_PER_DAY]
+
+
+class TestEventIndex(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        A-1 Cafe Restaurant     Mon 11 am - 10 pm
+        Nick's Lighthouse       Mon-Tue 11 am - 1 am
+        Night Owl               Sun 8 pm - 2 am, Mon 12 am - 2 am overlaps the carried over row
+        Always Open             Mon-Sun 12 am - 11:59 pm
+        '''
+        rows = [
+            ('A-1 Cafe Restaurant', 'Mon', '11:00', '22:00'),
+            ('Nick\'s Lighthouse', 'Mon', '11:00', '23:59'), ('Nick\'s Lighthouse', 'Tue', '00:00', '01:00'),
+            ('Nick\'s Lighthouse', 'Tue', '11:00', '23:59'), ('Nick\'s Lighthouse', 'Wed', '00:00', '01:00'),
+            ('Night Owl', 'Sun', '20:00', '23:59'), ('Night Owl', 'Mon', '00:00', '02:00'),
+        ] + [('Always Open', day, '00:00', '23:59') for day in ParserUtils.days]
+        self.df = pd.DataFrame({
+            'restaurant_name': [row[0] for row in rows],
+            'day': [row[1] for row in rows],
+            'open_time': pd.to_datetime([f"1900-01-01 {row[2]}" for row in rows]),
+            'close_time': pd.to_datetime([f"1900-01-01 {row[3]}" for row in rows]),
+        })
+        self.index = EventIndex.from_df(self.df)
+
+    def test_split_rows_merged(self):
+        # Nick's opens twice and closes twice, Always Open never opens or closes
+        self.assertEqual(self.index.opening_within('Mon', 0, MINUTES_PER_WEEK), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse', 'Night Owl'])
+        self.assertEqual(self.index.opening_within('Tue', 0, 23 * 60), ['Nick\'s Lighthouse'])
+        self.assertEqual(self.index.closing_within('Mon', 23 * 60, 30), [])
+        self.assertEqual(self.index.closing_within('Tue', 0, 60), ['Nick\'s Lighthouse'])
+
+    def test_opening_and_closing_within(self):
+        self.assertEqual(self.index.opening_within('Mon', 10 * 60 + 30, 30), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        self.assertEqual(self.index.opening_within('Mon', 10 * 60 + 30, 29), [])
+        self.assertEqual(self.index.closing_within('Mon', 21 * 60 + 45, 15), ['A-1 Cafe Restaurant'])
+        self.assertEqual(self.index.opening_within('Funday', 0, 30), [])
+
+    def test_sunday_wrap(self):
+        self.assertEqual(self.index.opening_within('Sun', 19 * 60 + 45, 30), ['Night Owl'])
+        self.assertEqual(self.index.closing_within('Sun', 23 * 60 + 30, 3 * 60), ['Night Owl'])
+        self.assertEqual(self.index.closing_within('Sun', 23 * 60 + 30, 60), [])
+
+    def test_next_open(self):
+        self.assertEqual(self.index.next_open('Nick\'s Lighthouse', 'Mon', 12 * 60), ('Tue', '11:00 AM'))
+        self.assertEqual(self.index.next_open('Nick\'s Lighthouse', 'Mon', 11 * 60), ('Mon', '11:00 AM'))
+        self.assertEqual(self.index.next_open('Nick\'s Lighthouse', 'Wed', 0), ('Mon', '11:00 AM'))
+        self.assertEqual(self.index.next_open('Night Owl', 'Mon', 0), ('Sun', '08:00 PM'))
+        self.assertIsNone(self.index.next_open('Always Open', 'Mon', 0))
+        self.assertIsNone(self.index.next_open('Unknown', 'Mon', 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Tuple
+import unittest
+
+import pandas as pd
+
+from data_processor import DataProcesser
+from query_processor import QueryProcessor
+from schedule_index import ScheduleIndex
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+COLUMNS = ['restaurant_name', 'day', 'open_time', 'close_time']
+
+
+class IncrementalProcessor:
+    """
+    Keeps the processed schedule between runs and only re-parses restaurants whose timings changed.
+    Every update builds a new processed DataFrame, patches the ScheduleIndex in place and reports which
+    restaurants were added, removed or changed.
+    """
+
+    def __init__(self):
+        self.df = pd.DataFrame([], columns=COLUMNS)
+        self.index = None
+        self._digests = {}
+
+    @staticmethod
+    def _digest(timings: List[str]) -> str:
+        return hashlib.blake2b("\n".join(timings).encode(), digest_size=16).hexdigest()
+
+    def update(self, df: pd.DataFrame) -> Dict[str, List[str]]:
+        """
+        1. Hash the timings of every restaurant in the new input
+        2. Compare with the hashes of the previous update to find added, removed and changed restaurants
+        3. Parse the timings of added and changed restaurants only
+        4. Drop their old rows and append the new ones to the processed schedule and the index
+
+        Args:
+            df (pd.DataFrame): DataFrame with restaurant name and timings (DataReader output)
+
+        Returns:
+            Dict[str, List[str]]: Added, removed and changed restaurant names
+        """
+        timings_by_restaurant = {}
+        for restaurant, timings in zip(df['Restaurant'], df['Timings']):
+            timings_by_restaurant.setdefault(restaurant.strip(), []).append(timings)
+        digests = {restaurant: self._digest(timings) for restaurant, timings in timings_by_restaurant.items()}
+
+        diff = {
+            'added': [restaurant for restaurant in digests if restaurant not in self._digests],
+            'removed': [restaurant for restaurant in self._digests if restaurant not in digests],
+            'changed': [restaurant for restaurant, digest in digests.items()
+                        if restaurant in self._digests and self._digests[restaurant] != digest],
+        }
+
+        # Parse everything before touching the state so a bad row leaves the previous schedule intact
+        try:
+            records = [(restaurant, day, start_time, end_time)
+                       for restaurant in diff['added'] + diff['changed']
+                       for timings in timings_by_restaurant[restaurant]
+                       for day, start_time, end_time in DataProcesser.expand_timings(timings)]
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+        self._patch(diff['removed'] + diff['changed'], records)
+        self._digests = digests
+        logger.info(f"Incremental update: {len(diff['added'])} added, {len(diff['removed'])} removed, {len(diff['changed'])} changed")
+        return diff
+
+    def _patch(self, stale: List[str], records: List[Tuple[str, str, datetime, datetime]]):
+        new_rows = pd.DataFrame(records, columns=COLUMNS)
+        if self.index is None:
+            self.df = new_rows
+            self.index = ScheduleIndex.from_df(self.df)
+        else:
+            # The index is patched in place, so the previous frame must stop resolving to it: queries on
+            # a frame taken before the update build an index over its own rows instead
+            ScheduleIndex.unregister(self.df)
+            kept = self.df[~self.df['restaurant_name'].isin(stale)]
+            self.df = pd.concat([kept, new_rows], ignore_index=True) if len(new_rows) else kept.reset_index(drop=True)
+
+            for restaurant in stale:
+                self.index.remove_restaurant(restaurant)
+            entries = {}
+            for restaurant, day, start_time, end_time in records:
+                entries.setdefault(restaurant, []).append((day, ParserUtils.to_minutes(start_time), ParserUtils.to_minutes(end_time)))
+            for restaurant, restaurant_entries in entries.items():
+                self.index.add_restaurant(restaurant, restaurant_entries)
+
+        # QueryProcessor calls on the patched schedule reuse the patched index
+        ScheduleIndex.register(self.df, self.index)
+
+
+class TestIncrementalProcessor(unittest.TestCase):
+
+    def setUp(self):
+        self.sample_data = {
+            'Restaurant': ["A-1 Cafe Restaurant", "Nick's Lighthouse", "Thai Stick Restaurant"],
+            'Timings': ["Mon, Wed-Sun 11 am - 10 pm", "Mon-Sun 11 am - 10:30 pm", "Mon-Sun 11 am - 1 am"]
+        }
+
+    def assertMatchesRebuild(self, processor, df):
+        expected_df = DataProcesser.build_restaurant_df(df)
+        self.assertEqual(sorted(map(tuple, processor.df.values.tolist())), sorted(map(tuple, expected_df.values.tolist())))
+        for day in ParserUtils.days:
+            for input_time in ['12:30 AM', '10:15 PM', '10:45 PM']:
+                self.assertEqual(set(QueryProcessor.get_open_restaurants(processor.df, day, input_time)),
+                                 set(QueryProcessor.get_open_restaurants(expected_df, day, input_time)))
+
+    def test_update(self):
+        processor = IncrementalProcessor()
+        df = pd.DataFrame(self.sample_data)
+        diff = processor.update(df)
+        self.assertEqual(diff, {'added': ["A-1 Cafe Restaurant", "Nick's Lighthouse", "Thai Stick Restaurant"], 'removed': [], 'changed': []})
+        self.assertMatchesRebuild(processor, df)
+
+        df = pd.DataFrame({
+            'Restaurant': ["A-1 Cafe Restaurant", "Thai Stick Restaurant", "Bow Hon Restaurant"],
+            'Timings': ["Mon, Wed-Sun 11 am - 10 pm", "Mon-Sat 11 am - 11 pm", "Mon-Sun 11 am - 10:30 pm"]
+        })
+        DataProcesser.clear_parse_cache()
+        diff = processor.update(df)
+        self.assertEqual(diff, {'added': ["Bow Hon Restaurant"], 'removed': ["Nick's Lighthouse"], 'changed': ["Thai Stick Restaurant"]})
+        self.assertEqual(DataProcesser.parse_cache_info().misses, 2)
+        self.assertIs(ScheduleIndex.for_df(processor.df), processor.index)
+        self.assertMatchesRebuild(processor, df)
+
+    def test_previous_frame_keeps_its_schedule(self):
+        processor = IncrementalProcessor()
+        processor.update(pd.DataFrame({'Restaurant': ["A", "B"], 'Timings': ["Mon 11 am - 10 pm", "Mon 11 am - 10 pm"]}))
+        previous_df = processor.df
+        self.assertEqual(QueryProcessor.get_open_restaurants(previous_df, 'Mon', '12:00 PM'), ["A", "B"])
+        processor.update(pd.DataFrame({'Restaurant': ["A", "C"], 'Timings': ["Mon 11 am - 10 pm", "Mon 11 am - 10 pm"]}))
+        self.assertEqual(QueryProcessor.get_open_restaurants(processor.df, 'Mon', '12:00 PM'), ["A", "C"])
+        self.assertEqual(QueryProcessor.get_open_restaurants(previous_df, 'Mon', '12:00 PM'), ["A", "B"])
+
+    def test_unchanged(self):
+        processor = IncrementalProcessor()
+        processor.update(pd.DataFrame(self.sample_data))
+        self.assertEqual(processor.update(pd.DataFrame(self.sample_data)), {'added': [], 'removed': [], 'changed': []})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator
+import unittest
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+# Histogram bucket upper bounds in seconds: 1 microsecond doubling up to ~18 minutes
+BUCKET_BOUNDS = [1e-6 * 2 ** i for i in range(31)]
+
+
+class Histogram:
+    """ Fixed log-scale buckets, so memory stays constant however many values are observed """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction: float) -> float:
+        """ Upper bound of the bucket holding the given fraction of the values """
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> Dict:
+        return {
+            'count': self.count, 'sum': self.total, 'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max, 'p50': self.percentile(0.5), 'p95': self.percentile(0.95), 'p99': self.percentile(0.99),
+            'buckets': [[BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else None, count] for i, count in enumerate(self.counts) if count],
+        }
+
+
+class Metrics:
+    """
+    Counters, gauges and timing histograms that callers can read programmatically.
+    Stages add their counts once per file / call, not once per row, so the hot paths stay cheap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """ Records the current value of `name`, replacing the previous one """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """ Records the duration of the block in the histogram `name` """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name: str) -> Callable:
+        """ Decorator recording the duration of every call in the histogram `name` """
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def gauge(self, name: str) -> float:
+        with self._lock:
+            return self._gauges.get(name, 0)
+
+    def histogram(self, name: str) -> Dict:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            return histogram.summary() if histogram else Histogram().summary()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Current value of every counter and gauge and a summary of every histogram
+
+        Returns:
+            Dict[str, Dict]: {'counters': {...}, 'gauges': {...}, 'timers': {name: count / sum / mean / max / p50 / p95 / p99 / buckets}}
+        """
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timers': {name: histogram.summary() for name, histogram in self._histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+# Process wide registry used by the reader, the processor and the query functions
+metrics = Metrics()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counters(self):
+        registry = Metrics()
+        registry.increment('reader.lines_read', 3)
+        registry.increment('reader.lines_read')
+        self.assertEqual(registry.counter('reader.lines_read'), 4)
+        self.assertEqual(registry.counter('reader.rows_skipped'), 0)
+        registry.set_gauge('watcher.staleness_seconds', 2.5)
+        registry.set_gauge('watcher.staleness_seconds', 0.5)
+        self.assertEqual(registry.gauge('watcher.staleness_seconds'), 0.5)
+        registry.reset()
+        self.assertEqual(registry.snapshot(), {'counters': {}, 'gauges': {}, 'timers': {}})
+
+    def test_histogram(self):
+        registry = Metrics()
+        for value in [0.001] * 90 + [0.1] * 10:
+            registry.observe('query.get_open_restaurants', value)
+        with registry.timer('processor.build_restaurant_df'):
+            pass
+
+        summary = registry.histogram('query.get_open_restaurants')
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['mean'], 0.0109)
+        self.assertTrue(0.001 <= summary['p50'] < 0.002)
+        self.assertTrue(0.1 <= summary['p99'] < 0.2)
+        self.assertEqual(registry.snapshot()['timers']['processor.build_restaurant_df']['count'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import logging
+import os
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import unittest
+
+from constants import TIME_LABELS
+from data_processor import DataProcesser
+from data_reader import DataReader
+from schedule_parser import ScheduleParser
+from utils import LazyModule, ParserUtils
+
+# Only to_df needs pandas, it is imported on first use
+pd = LazyModule('pandas')
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+
+class LiteSchedule:
+    """
+    Standard library only schedule for short lived workers that answer a few queries and exit.
+
+    Rows are kept in compact `array` columns (restaurant id, day, open and close minute) with the
+    row numbers of every day, so loading never imports pandas or NumPy and a query scans the rows
+    of one day. pandas is imported only when to_df is called.
+    """
+
+    def __init__(self):
+        self.names = []
+        self._ids = {}
+        self._restaurant_id = array('I')
+        self._day = array('B')
+        self._open_minute = array('H')
+        self._close_minute = array('H')
+        self._day_rows = [array('I') for _ in ParserUtils.days]
+
+    def __len__(self):
+        return len(self._restaurant_id)
+
+    def add(self, restaurant: str, day: str, open_minute: int, close_minute: int):
+        """
+        Appends one schedule row
+
+        Args:
+            restaurant (str): Restaurant name
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            open_minute (int): Open minute of the day
+            close_minute (int): Close minute of the day
+        """
+        restaurant_id = self._ids.get(restaurant)
+        if restaurant_id is None:
+            restaurant_id = self._ids[restaurant] = len(self.names)
+            self.names.append(restaurant)
+        day_id = ParserUtils.days.index(day)
+        self._day_rows[day_id].append(len(self._restaurant_id))
+        self._restaurant_id.append(restaurant_id)
+        self._day.append(day_id)
+        self._open_minute.append(open_minute)
+        self._close_minute.append(close_minute)
+
+    @staticmethod
+    def from_rows(rows: Iterable[Tuple[str, str]]) -> 'LiteSchedule':
+        """
+        Builds the schedule from (restaurant, timings) rows, expanding timings like DataProcesser.build_restaurant_df
+
+        Args:
+            rows (Iterable[Tuple[str, str]]): Restaurant name and timings string (DataReader.stream_rows)
+
+        Returns:
+            LiteSchedule: Schedule with one row per restaurant, day and time window
+        """
+        schedule = LiteSchedule()
+        try:
+            for restaurant, timings in rows:
+                restaurant = restaurant.strip()
+                entries, _ = ScheduleParser.parse(" ".join(timings.split()))
+                for day, open_minute, close_minute in entries:
+                    schedule.add(restaurant, ParserUtils.days[day], open_minute, close_minute)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return schedule
+
+    @staticmethod
+    def from_files(filenames: List[str]) -> 'LiteSchedule':
+        """
+        Reads and expands the input CSV files
+
+        Args:
+            filenames (List[str]): Input CSV files
+
+        Returns:
+            LiteSchedule: Schedule over every file
+        """
+        # DataReader() would load the files into a DataFrame, streaming the rows keeps pandas out
+        return LiteSchedule.from_rows(DataReader.stream_rows(filenames))
+
+    def open_restaurants(self, day: str, input_time: Optional[str] = None) -> List[str]:
+        """
+        Finds open restaurants during a given day of the week and time, see QueryProcessor.get_open_restaurants
+
+        Args:
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            input_time (Optional[str], optional): 12 hour time format. Defaults to None.
+
+        Returns:
+            List[str]: Unique restaurant names in schedule order
+        """
+        if day not in ParserUtils.days:
+            return []
+        rows = self._day_rows[ParserUtils.days.index(day)]
+        restaurant_ids, open_minutes, close_minutes = self._restaurant_id, self._open_minute, self._close_minute
+        if input_time is None:
+            open_ids = [restaurant_ids[row] for row in rows]
+        else:
+            minute = ScheduleParser.parse_time(input_time)
+            open_ids = [restaurant_ids[row] for row in rows if open_minutes[row] <= minute <= close_minutes[row]]
+        return [self.names[restaurant_id] for restaurant_id in dict.fromkeys(open_ids)]
+
+    def _iter_records(self) -> Iterable[Tuple[int, int, int, int]]:
+        """ (restaurant id, day id, open minute, close minute) of every row in schedule order """
+        return zip(self._restaurant_id, self._day, self._open_minute, self._close_minute)
+
+    def restaurant_open_timings(self, restaurant_names: Union[str, list]) -> Dict[str, List[str]]:
+        """
+        Finds open timing for a list of restaurants, see QueryProcessor.get_restaurant_open_timings
+
+        Args:
+            restaurant_names (Union[str, list]): A List of restaurants
+
+        Returns:
+            Dict[str, List[str]]: Name of restaurant and a list of open-close timings
+        """
+        if isinstance(restaurant_names, str):
+            restaurant_names = [restaurant_names]
+        wanted = {self._ids[name]: [] for name in restaurant_names if name in self._ids}
+        for restaurant_id, day_id, open_minute, close_minute in self._iter_records():
+            if restaurant_id in wanted:
+                wanted[restaurant_id].append(f"{ParserUtils.days[day_id]}: {TIME_LABELS[open_minute]} - {TIME_LABELS[close_minute]}")
+        return {name: list(wanted.get(self._ids.get(name), [])) for name in restaurant_names}
+
+    def to_df(self):
+        """
+        Expands to the build_restaurant_df layout. This is the only method importing pandas
+
+        Returns:
+            pd.DataFrame: DataFrame with restaurants, day of week, open and close timings
+        """
+        return pd.DataFrame([(self.names[restaurant_id], ParserUtils.days[day_id],
+                              datetime(1900, 1, 1, open_minute // 60, open_minute % 60),
+                              datetime(1900, 1, 1, close_minute // 60, close_minute % 60))
+                             for restaurant_id, day_id, open_minute, close_minute in self._iter_records()],
+                            columns=['restaurant_name', 'day', 'open_time', 'close_time'])
+
+
+class TestLiteSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            ("A-1 Cafe Restaurant", "Mon, Wed-Sun 11 am - 10 pm"),
+            ("Nick's Lighthouse", "Mon-Sun 11 am - 10:30 pm"),
+            ("Thai Stick Restaurant ", "Mon-Sun 11 am - 1 am"),
+            ("Paragon Restaurant & Bar", "Mon-Fri 11:30 am - 10 pm  / Sat 5:30 pm - 10 pm"),
+        ]
+        self.schedule = LiteSchedule.from_rows(self.rows)
+
+    def test_matches_query_processor(self):
+        from query_processor import QueryProcessor
+        df = DataProcesser.build_restaurant_df(pd.DataFrame(self.rows, columns=['Restaurant', 'Timings']))
+        for day in ParserUtils.days + ['Funday']:
+            for input_time in [None, '12:30 AM', '11:15 AM', '10:15 PM', '10:45 PM']:
+                self.assertEqual(self.schedule.open_restaurants(day, input_time), QueryProcessor.get_open_restaurants(df, day, input_time))
+        names = ["Thai Stick Restaurant", "Unknown", "Paragon Restaurant & Bar"]
+        self.assertEqual(self.schedule.restaurant_open_timings(names), QueryProcessor.get_restaurant_open_timings(df, names))
+        self.assertTrue(self.schedule.to_df().equals(df))
+
+    def test_imports_stay_lightweight(self):
+        import subprocess
+        import sys
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "schedule.csv")
+            with open(path, 'w') as schedule_file:
+                schedule_file.write("".join(f'"{name}","{timings}"\n' for name, timings in self.rows))
+            # Loading and querying must not import them either, not only importing the module
+            check = ("import sys, lite_schedule; schedule = lite_schedule.LiteSchedule.from_files(sys.argv[1:]); "
+                     "print(schedule.open_restaurants('Mon', '11:15 AM'), sorted(m for m in ('pandas', 'numpy') if m in sys.modules))")
+            output = subprocess.run([sys.executable, '-c', check, path], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertEqual(output.strip(), str(self.schedule.open_restaurants('Mon', '11:15 AM')) + ' []')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,50 +1,323 @@
+import argparse
+import glob
+import io
+import json
 import os
+import sys
+import time
 import traceback
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+import unittest
 from data_processor import DataProcesser
 from data_reader import DataReader
 from query_processor import QueryProcessor
+from snapshot import ScheduleSnapshot
+from utils import to_json
 import logging
 
 filename = os.path.basename(__file__)
 
-logging.basicConfig(level=logging.DEBUG, format='%(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(filename)
 
-def main():
+DEFAULT_FILES = [os.path.join("input_files", "dining_places_open_hrs_1.csv"), os.path.join("input_files", "dining_places_open_hrs_2.csv")]
+
+# Query type -> QueryProcessor call answering one query
+QUERY_TYPES = {
+    'open': lambda df, query: QueryProcessor.get_open_restaurants(df, query['day'], query.get('time')),
+    'timings': lambda df, query: QueryProcessor.get_restaurant_open_timings(df, query['names'] if 'names' in query else query['name']),
+    'insights': lambda df, query: QueryProcessor.generate_insights(df),
+    'search': lambda df, query: QueryProcessor.search_restaurants(df, query['q'], query.get('limit', 10)),
+    'opening_soon': lambda df, query: QueryProcessor.get_opening_soon(df, query['day'], query['time'], query.get('within', 30)),
+    'closing_soon': lambda df, query: QueryProcessor.get_closing_soon(df, query['day'], query['time'], query.get('within', 15)),
+    'next_open': lambda df, query: QueryProcessor.get_next_open(df, query['name'], query['day'], query['time']),
+    'open_throughout': lambda df, query: QueryProcessor.get_open_throughout(df, query['day'], query['start'], query['end'], query.get('end_day')),
+    'open_any_time': lambda df, query: QueryProcessor.get_open_any_time(df, query['day'], query['start'], query['end'], query.get('end_day')),
+    'open_together': lambda df, query: QueryProcessor.get_open_together(df, query['names'], query.get('limit', 5)),
+}
+
+
+def expand_files(patterns: List[str]) -> List[str]:
+    """ Input files in argument order, globs expanded and sorted """
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.error(f"No files match {pattern}")
+        filenames.extend(matches)
+    return filenames
+
+
+def read_queries(stream: IO[str]) -> Iterator[Tuple[object, Dict]]:
+    """
+    Reads JSONL queries one line at a time, e.g.
+        {"type": "open", "day": "Mon", "time": "11:30 AM"}
+        {"id": "q2", "type": "timings", "names": ["Kushi Tsuru"]}
+        {"type": "insights"}
+
+    Yields:
+        Tuple[object, Dict]: Query id (the "id" field or the line number) and the query. Lines that are
+        not a JSON object are yielded as {'error': ...}
+    """
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                raise ValueError("Query is not a JSON object")
+        except ValueError as e:
+            yield line_number, {'error': f"Invalid query: {e}"}
+            continue
+        yield query.get('id', line_number), query
+
+
+def answer(df, query_id: object, query: Dict) -> Dict:
+    """ Result line for one query, errors are reported in the line instead of stopping the run """
+    if 'error' in query:
+        return {'id': query_id, 'error': query['error']}
+    query_type = query.get('type')
+    try:
+        if query_type not in QUERY_TYPES:
+            raise ValueError(f"Unknown query type {query_type}")
+        return {'id': query_id, 'type': query_type, 'result': QUERY_TYPES[query_type](df, query)}
+    except Exception as e:
+        return {'id': query_id, 'type': query_type, 'error': f"{type(e).__name__}: {e}"}
+
+
+def run_streaming(df, queries: Iterator[Tuple[object, Dict]], output: IO[str]) -> Tuple[int, int]:
+    """
+    Answers queries in input order, writing every result as soon as it is ready
+
+    Returns:
+        Tuple[int, int]: Number of queries and number of errors
+    """
+    count = errors = 0
+    for query_id, query in queries:
+        result = answer(df, query_id, query)
+        output.write(to_json(result) + "\n")
+        output.flush()
+        count += 1
+        errors += 'error' in result
+    return count, errors
+
+
+def _answer_open_batch(df, batch: List[Tuple[object, Dict]]) -> List[Dict]:
+    try:
+        results = QueryProcessor.get_open_restaurants_batch(df, [query['day'] for _, query in batch], [query['time'] for _, query in batch])
+    except Exception:
+        # One bad day or time fails the whole batch, answer one by one to report it on its own line
+        return [answer(df, query_id, query) for query_id, query in batch]
+    return [{'id': query_id, 'type': 'open', 'result': result} for (query_id, _), result in zip(batch, results)]
+
+
+def _answer_timings_batch(df, batch: List[Tuple[object, Dict]]) -> List[Dict]:
+    try:
+        names = [query['names'] if 'names' in query else query['name'] for _, query in batch]
+        names = [[name] if isinstance(name, str) else name for name in names]
+        timings = QueryProcessor.get_restaurant_open_timings(df, list(dict.fromkeys(name for group in names for name in group)))
+    except Exception:
+        return [answer(df, query_id, query) for query_id, query in batch]
+    return [{'id': query_id, 'type': 'timings', 'result': {name: timings[name] for name in group}}
+            for (query_id, _), group in zip(batch, names)]
+
+
+def run_throughput(df, queries: Iterator[Tuple[object, Dict]], output: IO[str]) -> Tuple[int, int]:
+    """
+    Groups the queries by type and answers every group in one pass: timed open queries through the
+    batch API, all timings queries with one lookup and insights once. Results are written one group
+    at a time, matched to their query by id
+
+    Returns:
+        Tuple[int, int]: Number of queries and number of errors
+    """
+    groups = {}
+    for query_id, query in queries:
+        key = query.get('type') if 'error' not in query else 'error'
+        if key == 'open' and query.get('time') is None:
+            key = 'open_day'
+        groups.setdefault(key, []).append((query_id, query))
+
+    count = errors = 0
+    for key, batch in groups.items():
+        if key == 'open':
+            results = _answer_open_batch(df, batch)
+        elif key == 'timings':
+            results = _answer_timings_batch(df, batch)
+        elif key == 'insights':
+            insights = answer(df, None, batch[0][1])
+            results = [dict(insights, id=query_id) for query_id, _ in batch]
+        else:
+            results = [answer(df, query_id, query) for query_id, query in batch]
+
+        output.write("".join(to_json(result) + "\n" for result in results))
+        output.flush()
+        count += len(results)
+        errors += sum('error' in result for result in results)
+    return count, errors
+
+
+def write_quarantine(quarantine: List[Dict], path: str):
+    """ Writes the quarantined rows, one JSON object per line """
+    with open(path, 'w') as quarantine_file:
+        quarantine_file.write("".join(json.dumps(row) + "\n" for row in quarantine))
+
+
+def demo(processed_data):
+    # Query
+    day = 'Mon'
+    time = '11:30 am'
+    logger.info(f"Restaurans open during {day} {time}")
+    logger.info(QueryProcessor.get_open_restaurants(df=processed_data, day = 'Mon', input_time = '11:30 AM'))
+
+    day = 'Sat'
+    logger.info(f"Restaurans open during {day}")
+    logger.info(QueryProcessor.get_open_restaurants(df = processed_data, day = 'Sat'))
+
+    # Query restaurant timings
+    rest = ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse']
+    logger.info("Restaurant Schedule")
+    logger.info(QueryProcessor.get_restaurant_open_timings(df = processed_data, restaurant_names=rest))
+
+    #insights
+    logger.info("Restaurant Schedule Insights")
+    logger.info(QueryProcessor.generate_insights(processed_data))
+
+
+def main(args: Optional[List[str]] = None, stdin: IO[str] = None, stdout: IO[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Answer restaurant schedule queries from a JSONL file or stdin, one JSON result per line")
+    parser.add_argument('files', nargs='*', default=DEFAULT_FILES, help="Input CSV files or glob patterns")
+    parser.add_argument('--queries', help="JSONL query file, '-' for stdin (default when stdin is not a terminal)")
+    parser.add_argument('--output', help="Write results to this file instead of stdout")
+    parser.add_argument('--throughput', action='store_true', help="Read all queries, then answer them grouped by type")
+    parser.add_argument('--quarantine', help="Write rows that could not be parsed, with the reasons, to this JSONL file")
+    parser.add_argument('--snapshot', metavar='DIR', help="Load the processed schedule from this snapshot directory, rebuilding it when the files changed")
+    parser.add_argument('--demo', action='store_true', help="Log the demo queries instead of reading queries")
+    parser.add_argument('--debug', action='store_true', help="Enable debug logging")
+    options = parser.parse_args(args)
+    if options.snapshot and options.quarantine:
+        parser.error("--quarantine needs the files parsed, it cannot be combined with --snapshot")
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+
+    logging.basicConfig(level=logging.DEBUG if options.debug else logging.INFO, format='%(name)s - %(levelname)s - %(message)s')
     try:
         # 1. Read the data
-        filenames = ["input_files\dining_places_open_hrs_1.csv", "input_files\dining_places_open_hrs_2.csv"]
-        logger.info("Reading files {}".format(filenames))
-        reader = DataReader(filenames)
+        filenames = expand_files(options.files)
+        if options.snapshot:
+            # 1-2. Memory-map the processed schedule, the files are only read and parsed when they changed
+            logger.info("Loading snapshot {} of files {}".format(options.snapshot, filenames))
+            processed_data = ScheduleSnapshot.load_or_build(filenames, options.snapshot)
+        else:
+            logger.info("Reading files {}".format(filenames))
+            quarantine = []
+            reader = DataReader(filenames, quarantine=quarantine)
 
-        # Fetching the DataFrame
-        logger.info("Processing data into Data Frame")
-        df = reader.get_restaurants_df()
+            # Fetching the DataFrame
+            logger.info("Processing data into Data Frame")
+            df = reader.get_restaurants_df()
 
-        # 2. Process the data
-        logger.info("Parsing the resturant schedules")
-        processed_data = DataProcesser.build_restaurant_df(df)
+            # 2. Process the data
+            logger.info("Parsing the resturant schedules")
+            processed_data = DataProcesser.build_restaurant_df(df, quarantine=quarantine)
+            if quarantine:
+                logger.warning(f"Quarantined {len(quarantine)} rows that could not be parsed")
+            if options.quarantine:
+                write_quarantine(quarantine, options.quarantine)
 
         # 3. Query
-        day = 'Mon'
-        time = '11:30 am'
-        logger.info(f"Restaurans open during {day} {time}")
-        logger.info(QueryProcessor.get_open_restaurants(df=processed_data, day = 'Mon', input_time = '11:30 AM'))
-
-        day = 'Sat'
-        logger.info(f"Restaurans open during {day}")
-        logger.info(QueryProcessor.get_open_restaurants(df = processed_data, day = 'Sat'))
-
-        # Query restaurant timings
-        rest = ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse']
-        logger.info("Restaurant Schedule")
-        logger.info(QueryProcessor.get_restaurant_open_timings(df = processed_data, restaurant_names=rest))
-
-        #insights
-        logger.info("Restaurant Schedule Insights")
-        logger.info(QueryProcessor.generate_insights(processed_data))
+        if options.demo or (options.queries is None and stdin.isatty()):
+            demo(processed_data)
+            return 0
+
+        query_file = stdin if options.queries in (None, '-') else open(options.queries)
+        output = open(options.output, 'w') if options.output else stdout
+        try:
+            started = time.perf_counter()
+            run = run_throughput if options.throughput else run_streaming
+            count, errors = run(processed_data, read_queries(query_file), output)
+            elapsed = time.perf_counter() - started
+            # The summary is the last line of the result stream, it has no id
+            output.write(to_json({'summary': {'queries': count, 'errors': errors, 'seconds': elapsed,
+                                              'queries_per_sec': count / elapsed if elapsed else 0.0}}) + "\n")
+        finally:
+            if query_file is not stdin:
+                query_file.close()
+            if output is not stdout:
+                output.close()
+        logger.info(f"Answered {count} queries ({errors} errors) in {elapsed:.3f}s: {count / elapsed if elapsed else 0:.1f} queries/sec")
+        return 1 if errors else 0
     except Exception as e:
         logger.error(e)
+        logger.debug(traceback.format_exc())
+        return 1
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        self.files = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "input_files", "dining_places_open_hrs_1.csv")]
+        self.queries = "\n".join([
+            '{"type": "open", "day": "Mon", "time": "11:30 PM"}',
+            '{"id": "t", "type": "timings", "name": "Kushi Tsuru"}',
+            '{"type": "open", "day": "Mon", "time": "25:00 PM"}',
+            '{"type": "open", "day": "Sun", "time": "8 pm"}',
+            '',
+            'not json',
+            '{"type": "insights"}',
+        ])
+
+    def run_main(self, *args) -> Tuple[int, List[Dict]]:
+        output = io.StringIO()
+        status = main(self.files + list(args), stdin=io.StringIO(self.queries), stdout=output)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(set(results[-1]['summary']), {'queries', 'errors', 'seconds', 'queries_per_sec'})
+        self.assertEqual((results[-1]['summary']['queries'], results[-1]['summary']['errors']), (6, 2))
+        return status, results[:-1]
+
+    def test_streaming(self):
+        status, results = self.run_main('--queries', '-')
+        self.assertEqual(status, 1)
+        self.assertEqual([result['id'] for result in results], [1, 't', 3, 4, 6, 7])
+        self.assertEqual(results[1]['result'], {'Kushi Tsuru': ['Mon: 11:30 AM - 09:00 PM', 'Tue: 11:30 AM - 09:00 PM', 'Wed: 11:30 AM - 09:00 PM',
+                                                                'Thu: 11:30 AM - 09:00 PM', 'Fri: 11:30 AM - 09:00 PM', 'Sat: 11:30 AM - 09:00 PM',
+                                                                'Sun: 11:30 AM - 09:00 PM']})
+        self.assertIn('error', results[2])
+        self.assertIn('Kushi Tsuru', results[3]['result'])
+        self.assertIn('error', results[4])
+        self.assertEqual(results[5]['result']['total_restaurants'], QueryProcessor.generate_insights(
+            DataProcesser.build_restaurant_df(DataReader(self.files).get_restaurants_df()))['total_restaurants'])
+
+    def test_quarantine(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bad.csv")
+            with open(path, 'w') as bad_file:
+                bad_file.write('"Kushi Tsuru","Mon-Sun 11:30 am - 9 pm"\n"Mifune","Mon 11:30 ma - 9 pm"\nno timings here\n')
+            quarantine_path = os.path.join(directory, "quarantine.jsonl")
+            status = main([path, '--queries', '-', '--quarantine', quarantine_path], stdin=io.StringIO(''), stdout=io.StringIO())
+            self.assertEqual(status, 0)
+            with open(quarantine_path) as quarantine_file:
+                rows = [json.loads(line) for line in quarantine_file]
+        self.assertEqual([row.get('restaurant', row.get('text')) for row in rows], ['no timings here', 'Mifune'])
+        self.assertTrue(all(row['reasons'] for row in rows))
+
+    def test_snapshot(self):
+        import tempfile
+        _, expected = self.run_main('--queries', '-')
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_dir = os.path.join(directory, "snapshot")
+            _, built = self.run_main('--queries', '-', '--snapshot', snapshot_dir)
+            self.assertTrue(os.path.exists(os.path.join(snapshot_dir, "manifest.json")))
+            with self.assertLogs('snapshot.py', 'INFO') as logs:
+                _, loaded = self.run_main('--queries', '-', '--snapshot', snapshot_dir)
+        self.assertIn("Loaded schedule snapshot", "\n".join(logs.output))
+        self.assertEqual(built, expected)
+        self.assertEqual(loaded, expected)
+
+    def test_throughput_matches_streaming(self):
+        _, streamed = self.run_main('--queries', '-')
+        _, grouped = self.run_main('--queries', '-', '--throughput')
+        self.assertEqual(sorted(grouped, key=lambda result: str(result['id'])), sorted(streamed, key=lambda result: str(result['id'])))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
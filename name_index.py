@@ -0,0 +1,175 @@
+import logging
+import os
+from bisect import bisect_left
+from typing import Dict, List, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from constants import TIME_LABELS
+from schedule_index import cached_for_df
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+# Name index cache keyed on id() of the processed dataframe, see cached_for_df
+_NAME_INDEX_CACHE = {}
+
+
+class NameIndex:
+    """
+    Restaurant name index over the processed schedule.
+
+    Rows are grouped by restaurant once, so the timings of a restaurant are a slice of a sorted row
+    order and are formatted on the first lookup only. Search is case-insensitive: prefixes are found
+    by bisecting the sorted lower-case names and substrings through a trigram posting list.
+    """
+
+    def __init__(self, schedule: CompactSchedule):
+        self._schedule = schedule
+        # Stable sort keeps the rows of every restaurant in schedule order
+        self._order = np.argsort(schedule.restaurant_id, kind='stable')
+        self._offsets = np.searchsorted(schedule.restaurant_id[self._order], np.arange(len(schedule.names) + 1))
+        self._ids = {name: i for i, name in enumerate(schedule.names.tolist())}
+        self._timings = {}
+
+        self._lower = [name.lower() for name in schedule.names.tolist()]
+        self._sorted = sorted((name, i) for i, name in enumerate(self._lower))
+        self._sorted_names = [name for name, _ in self._sorted]
+        self._trigrams = None
+
+    @staticmethod
+    def from_df(df: Union[pd.DataFrame, CompactSchedule]) -> 'NameIndex':
+        """
+        Build a name index from the output of DataProcesser.build_restaurant_df
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+
+        Returns:
+            NameIndex: Index over the restaurant names
+        """
+        return NameIndex(df if isinstance(df, CompactSchedule) else CompactSchedule.from_df(df))
+
+    @staticmethod
+    def for_df(df: Union[pd.DataFrame, CompactSchedule]) -> 'NameIndex':
+        """
+        Returns the name index for a processed schedule, building it on first use and reusing it afterwards
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+
+        Returns:
+            NameIndex: Cached index over the restaurant names
+        """
+        return cached_for_df(_NAME_INDEX_CACHE, df, lambda: NameIndex.from_df(df))
+
+    def timings(self, name: str) -> List[str]:
+        """
+        Formatted open timings of a restaurant, in schedule order
+
+        Args:
+            name (str): Exact restaurant name
+
+        Returns:
+            List[str]: "Day: open - close" strings, empty for an unknown restaurant
+        """
+        restaurant_id = self._ids.get(name)
+        if restaurant_id is None:
+            return []
+
+        timings = self._timings.get(restaurant_id)
+        if timings is None:
+            schedule = self._schedule
+            rows = self._order[self._offsets[restaurant_id]:self._offsets[restaurant_id + 1]]
+            timings = [f"{ParserUtils.days[day]}: {TIME_LABELS[open_minute]} - {TIME_LABELS[close_minute]}"
+                       for day, open_minute, close_minute in zip(schedule.day[rows].tolist(), schedule.open_minute[rows].tolist(),
+                                                                 schedule.close_minute[rows].tolist())]
+            self._timings[restaurant_id] = timings
+        return list(timings)
+
+    @staticmethod
+    def _ngrams(text: str) -> set:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _trigram_index(self) -> Dict[str, List[int]]:
+        # Built on the first substring search, prefix search and lookups never need it
+        if self._trigrams is None:
+            trigrams = {}
+            for i, name in enumerate(self._lower):
+                for trigram in self._ngrams(name):
+                    trigrams.setdefault(trigram, []).append(i)
+            self._trigrams = trigrams
+        return self._trigrams
+
+    def search(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Case-insensitive name search. Names starting with the query come first in alphabetical order,
+        followed by names containing it elsewhere
+
+        Args:
+            query (str): Partial restaurant name
+            limit (int, optional): Maximum number of names returned. Defaults to 10.
+
+        Returns:
+            List[str]: Matching restaurant names
+        """
+        query = " ".join(query.lower().split())
+        if not query or limit <= 0:
+            return []
+
+        matches = []
+        position = bisect_left(self._sorted_names, query)
+        while position < len(self._sorted) and len(matches) < limit and self._sorted_names[position].startswith(query):
+            matches.append(self._sorted[position][1])
+            position += 1
+
+        if len(matches) < limit:
+            if len(query) >= 3:
+                # Only names holding every trigram of the query can contain it
+                postings = sorted((self._trigram_index().get(trigram, []) for trigram in self._ngrams(query)), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = range(len(self._lower))
+            found = set(matches)
+            contained = sorted((i for i in candidates if i not in found and query in self._lower[i]), key=lambda i: self._lower[i])
+            matches.extend(contained[:limit - len(matches)])
+
+        return [self._schedule.names[i] for i in matches]
+
+
+class TestNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'restaurant_name': ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse', 'Nickies', 'Blue Nick Cafe'],
+            'day': ['Mon', 'Mon', 'Tue', 'Sun', 'Sat'],
+            'open_time': pd.to_datetime(['1900-01-01 11:00', '1900-01-01 11:00', '1900-01-01 00:00', '1900-01-01 12:00', '1900-01-01 09:30']),
+            'close_time': pd.to_datetime(['1900-01-01 22:00', '1900-01-01 23:59', '1900-01-01 01:00', '1900-01-01 12:45', '1900-01-01 17:00']),
+        })
+
+    def test_timings(self):
+        index = NameIndex.from_df(self.df)
+        self.assertEqual(index.timings('Nick\'s Lighthouse'), ['Mon: 11:00 AM - 11:59 PM', 'Tue: 12:00 AM - 01:00 AM'])
+        self.assertEqual(index.timings('Nickies'), ['Sun: 12:00 PM - 12:45 PM'])
+        self.assertEqual(index.timings('Unknown'), [])
+
+    def test_search(self):
+        index = NameIndex.from_df(self.df)
+        self.assertEqual(index.search("nick's"), ['Nick\'s Lighthouse'])
+        self.assertEqual(index.search("NICK"), ['Nick\'s Lighthouse', 'Nickies', 'Blue Nick Cafe'])
+        self.assertEqual(index.search("nick", limit=1), ['Nick\'s Lighthouse'])
+        self.assertEqual(index.search("cafe"), ['A-1 Cafe Restaurant', 'Blue Nick Cafe'])
+        self.assertEqual(index.search("ca"), ['A-1 Cafe Restaurant', 'Blue Nick Cafe'])
+        self.assertEqual(index.search("zzz"), [])
+        self.assertEqual(index.search("  "), [])
+
+    def test_for_df(self):
+        self.assertIs(NameIndex.for_df(self.df), NameIndex.for_df(self.df))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from instrumentation import metrics
+from query_processor import QueryProcessor
+from snapshot import MANIFEST, begin_save, save_names, write_manifest
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+STORE_VERSION = 1
+# Position of the row in the full schedule, restaurant id and open / close minute of the day
+PARTITION_ARRAYS = ['row', 'restaurant_id', 'open_minute', 'close_minute']
+
+
+class PartitionedStore:
+    """
+    Processed schedule on disk, partitioned by day. Every day is a directory of .npy columns
+    (day=Mon/open_minute.npy ...) sharing one name table, and the manifest keeps the row count and
+    min / max open and close minute of every partition.
+
+    A day / time query reads the manifest, skips the partition when the time falls outside its
+    stats and otherwise memory-maps the columns of that one day only.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as file:
+            manifest = json.load(file)
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported store version {manifest.get('version')} in {directory}")
+        self.rows = manifest['rows']
+        self.partitions = manifest['partitions']
+        self._names = None
+
+    @staticmethod
+    def partition_stats(open_minute: np.ndarray, close_minute: np.ndarray) -> Dict:
+        """ Row count and min / max open and close minute of a partition, None for an empty one """
+        if not len(open_minute):
+            return {'rows': 0, 'min_open': None, 'max_open': None, 'min_close': None, 'max_close': None}
+        return {'rows': len(open_minute), 'min_open': int(open_minute.min()), 'max_open': int(open_minute.max()),
+                'min_close': int(close_minute.min()), 'max_close': int(close_minute.max())}
+
+    @staticmethod
+    def save(schedule: Union[pd.DataFrame, CompactSchedule], directory: str) -> 'PartitionedStore':
+        """
+        Writes the schedule partitioned by day, the manifest last (see snapshot.begin_save)
+
+        Args:
+            schedule (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            directory (str): Store directory
+
+        Returns:
+            PartitionedStore: The written store
+        """
+        if not isinstance(schedule, CompactSchedule):
+            schedule = CompactSchedule.from_df(schedule)
+
+        begin_save(directory)
+        save_names(directory, schedule)
+        day = np.asarray(schedule.day)
+        partitions = {}
+        for day_id, day_name in enumerate(ParserUtils.days):
+            rows = np.flatnonzero(day == day_id)
+            columns = {
+                'row': rows.astype(np.uint32),
+                'restaurant_id': np.asarray(schedule.restaurant_id)[rows],
+                'open_minute': np.asarray(schedule.open_minute)[rows],
+                'close_minute': np.asarray(schedule.close_minute)[rows],
+            }
+            partition_dir = os.path.join(directory, f"day={day_name}")
+            os.makedirs(partition_dir, exist_ok=True)
+            for name in PARTITION_ARRAYS:
+                np.save(os.path.join(partition_dir, f"{name}.npy"), columns[name])
+            partitions[day_name] = PartitionedStore.partition_stats(columns['open_minute'], columns['close_minute'])
+
+        write_manifest(directory, {'version': STORE_VERSION, 'rows': len(schedule), 'partitions': partitions})
+        logger.info(f"Saved {len(schedule)} schedule rows to {directory}")
+        return PartitionedStore(directory)
+
+    @property
+    def names(self) -> np.ndarray:
+        """ Memory-mapped name table, only the names a query returns are read """
+        if self._names is None:
+            self._names = np.load(os.path.join(self.directory, "names.npy"), mmap_mode='r')
+        return self._names
+
+    def load_partition(self, day: str) -> Dict[str, np.ndarray]:
+        """
+        Memory-maps the columns of one day
+
+        Args:
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+
+        Returns:
+            Dict[str, np.ndarray]: row, restaurant_id, open_minute and close_minute columns
+        """
+        partition_dir = os.path.join(self.directory, f"day={day}")
+        metrics.increment('store.partitions_loaded')
+        return {name: np.load(os.path.join(partition_dir, f"{name}.npy"), mmap_mode='r') for name in PARTITION_ARRAYS}
+
+    def can_skip(self, day: str, minutes: Optional[int] = None) -> bool:
+        """ The partition has no row open at the given minute according to its stats alone """
+        stats = self.partitions.get(day)
+        if stats is None or not stats['rows']:
+            return True
+        return minutes is not None and (minutes < stats['min_open'] or minutes > stats['max_close'])
+
+    def get_open_restaurants(self, day: str, input_time: Optional[str] = None) -> List[str]:
+        """
+        Finds open restaurants during a given day of the week and time, see QueryProcessor.get_open_restaurants.
+        Reads only the partition of the day, and nothing when its stats rule the time out
+
+        Args:
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            input_time (Optional[str], optional): 12 hour time format. Defaults to None.
+
+        Returns:
+            List[str]: Unique restaurant names in schedule order
+        """
+        try:
+            minutes = ParserUtils.to_minutes(ParserUtils.parse_time(input_time)) if input_time else None
+            if self.can_skip(day, minutes):
+                metrics.increment('store.partitions_skipped')
+                return []
+
+            partition = self.load_partition(day)
+            restaurant_id = np.asarray(partition['restaurant_id'])
+            if minutes is not None:
+                restaurant_id = restaurant_id[(partition['open_minute'] <= minutes) & (partition['close_minute'] >= minutes)]
+            restaurant_id = pd.unique(restaurant_id)
+            open_restaurants = self.names[restaurant_id].tolist() if len(restaurant_id) else []
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return open_restaurants
+
+    def to_schedule(self, days: Optional[List[str]] = None) -> CompactSchedule:
+        """
+        Reads the partitions of some or all days back into one schedule, rows in their original order
+
+        Args:
+            days (Optional[List[str]], optional): Days to read. Defaults to None, every day.
+
+        Returns:
+            CompactSchedule: Rows of the chosen days
+        """
+        days = ParserUtils.days if days is None else days
+        partitions = [(ParserUtils.days.index(day), self.load_partition(day)) for day in days if not self.can_skip(day)]
+        columns = {name: np.concatenate([np.asarray(partition[name]) for _, partition in partitions])
+                   if partitions else np.empty(0, dtype=np.uint32) for name in PARTITION_ARRAYS}
+        day = np.concatenate([np.full(len(partition['row']), day_id, dtype=np.uint8) for day_id, partition in partitions]) \
+            if partitions else np.empty(0, dtype=np.uint8)
+        order = np.argsort(columns['row'], kind='stable')
+        return CompactSchedule(
+            names=np.asarray(self.names.tolist(), dtype=object),
+            restaurant_id=columns['restaurant_id'][order].astype(np.uint32),
+            day=day[order],
+            open_minute=columns['open_minute'][order].astype(np.int16),
+            close_minute=columns['close_minute'][order].astype(np.int16),
+        )
+
+
+class TestPartitionedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        rows = [
+            ('A-1 Cafe Restaurant', 'Mon', '11:00', '22:00'),
+            ('Nick\'s Lighthouse', 'Mon', '11:00', '23:59'), ('Nick\'s Lighthouse', 'Tue', '00:00', '01:00'),
+            ('Kushi Tsuru', 'Mon', '11:30', '21:00'), ('Kushi Tsuru', 'Sat', '11:30', '21:00'),
+            ('A-1 Cafe Restaurant', 'Tue', '11:00', '22:00'),
+        ]
+        self.df = pd.DataFrame({
+            'restaurant_name': [row[0] for row in rows],
+            'day': [row[1] for row in rows],
+            'open_time': pd.to_datetime([f"1900-01-01 {row[2]}" for row in rows]),
+            'close_time': pd.to_datetime([f"1900-01-01 {row[3]}" for row in rows]),
+        })
+        self.store = PartitionedStore.save(self.df, self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_partition_stats(self):
+        self.assertEqual(self.store.partitions['Mon'], {'rows': 3, 'min_open': 660, 'max_open': 690, 'min_close': 1260, 'max_close': 1439})
+        self.assertEqual(self.store.partitions['Wed']['rows'], 0)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, "day=Sat", "open_minute.npy")))
+
+    def test_matches_query_processor(self):
+        for day in ParserUtils.days + ['Funday']:
+            for input_time in [None, '12:30 AM', '11:15 AM', '09:30 PM', '11:59 PM']:
+                self.assertEqual(self.store.get_open_restaurants(day, input_time), QueryProcessor.get_open_restaurants(self.df, day, input_time))
+
+    def test_loads_one_partition(self):
+        metrics.reset()
+        self.assertEqual(self.store.get_open_restaurants('Mon', '11:15 AM'), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        self.assertEqual(metrics.counter('store.partitions_loaded'), 1)
+        # Before the first opening of Saturday, and a day without rows: nothing is read
+        self.assertEqual(self.store.get_open_restaurants('Sat', '09:00 AM'), [])
+        self.assertEqual(self.store.get_open_restaurants('Wed', '12:00 PM'), [])
+        self.assertEqual(metrics.counter('store.partitions_loaded'), 1)
+        self.assertEqual(metrics.counter('store.partitions_skipped'), 2)
+
+    def test_to_schedule(self):
+        expected = CompactSchedule.from_df(self.df)
+        schedule = PartitionedStore(self.temp_dir.name).to_schedule()
+        self.assertTrue(schedule.to_df().equals(expected.to_df()))
+        self.assertEqual(schedule.day.tolist(), expected.day.tolist())
+        self.assertEqual(PartitionedStore(self.temp_dir.name).to_schedule(['Tue']).to_df()['restaurant_name'].tolist(),
+                         ['Nick\'s Lighthouse', 'A-1 Cafe Restaurant'])
+
+if __name__ == '__main__':
+    unittest.main()
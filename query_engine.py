@@ -0,0 +1,298 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Hashable, List, Optional, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from event_index import EventIndex
+from instrumentation import metrics
+from name_index import NameIndex
+from query_processor import QueryProcessor
+from schedule_index import ScheduleIndex
+from utils import ParserUtils
+from week_bitmap import WeekBitmap
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of query results. Keys start with the data version of the schedule they
+    were computed on, so a new version never reads the results of an old one and the old entries
+    age out. One cache can be shared by the engines of successive versions.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_or_compute(self, key: Hashable, compute: Callable):
+        """
+        Cached value of `key`, computing and storing it on a miss. compute runs outside the lock, so
+        a slow query never blocks the others; two threads missing together may both compute it
+
+        Args:
+            key (Hashable): (version, query, arguments...) key
+            compute (Callable): Computes the value on a miss
+
+        Returns:
+            The cached or computed value
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def get(self, key: Hashable):
+        """ Cached value of `key`, None on a miss. Counts the hit or miss """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                metrics.increment('engine.cache_hits')
+                return self._entries[key]
+        metrics.increment('engine.cache_misses')
+        return None
+
+    def put(self, key: Hashable, value):
+        """ Stores a computed value, evicting the least recently used entries past maxsize """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard_version(self, version: str):
+        """ Drops the entries of a data version right away instead of letting them age out """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == version]:
+                del self._entries[key]
+
+
+class QueryEngine:
+    """
+    Immutable query engine over one processed schedule, safe to share between threads.
+
+    The schedule is copied into a CompactSchedule with read-only arrays, and the interval tree, name
+    index, event index and week bitmaps are built and fully warmed up front, so no query builds or
+    fills anything shared. Results are cached per data version: open queries on the (day, minute)
+    they resolve to, the schedule has minute resolution so "11:30 AM" and "11:30 am" share an
+    entry, and insights once. Callers get copies of cached lists.
+    """
+
+    def __init__(self, df: Union[pd.DataFrame, CompactSchedule], version: Optional[str] = None, cache: Optional[QueryCache] = None):
+        schedule = CompactSchedule.from_df(df) if not isinstance(df, CompactSchedule) else CompactSchedule(
+            names=np.array(df.names, dtype=object), restaurant_id=np.array(df.restaurant_id), day=np.array(df.day),
+            open_minute=np.array(df.open_minute), close_minute=np.array(df.close_minute))
+        for array in (schedule.names, schedule.restaurant_id, schedule.day, schedule.open_minute, schedule.close_minute):
+            array.setflags(write=False)
+        self.schedule = schedule
+        self.version = version or QueryEngine.data_version(schedule)
+        self.cache = cache if cache is not None else QueryCache()
+
+        with metrics.timer('engine.build'):
+            ScheduleIndex.for_df(schedule)._batch_arrays()
+            name_index = NameIndex.for_df(schedule)
+            name_index._trigram_index()
+            for name in schedule.names.tolist():
+                name_index.timings(name)
+            EventIndex.for_df(schedule)
+            WeekBitmap.for_df(schedule)
+
+    @staticmethod
+    def data_version(schedule: CompactSchedule) -> str:
+        """ Content hash of a schedule, equal schedules get equal versions """
+        digest = hashlib.sha256()
+        digest.update("\0".join(schedule.names.tolist()).encode())
+        for array in (schedule.restaurant_id, schedule.day, schedule.open_minute, schedule.close_minute):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:16]
+
+    def _cached(self, key: tuple, compute: Callable):
+        return self.cache.get_or_compute((self.version,) + key, compute)
+
+    def get_open_restaurants(self, day: str, input_time: Optional[str] = None) -> list:
+        """ Open restaurants at a day and time, see QueryProcessor.get_open_restaurants """
+        minutes = ParserUtils.to_minutes(ParserUtils.parse_time(input_time)) if input_time else None
+        index = ScheduleIndex.for_df(self.schedule)
+        return list(self._cached(('open', day, minutes), lambda: tuple(index.open_restaurants(day, minutes))))
+
+    def get_open_restaurants_batch(self, days: List[str], input_times: List[str]) -> List[list]:
+        """
+        Open restaurants for many day and time pairs, see QueryProcessor.get_open_restaurants_batch.
+        Cached pairs are answered from the cache and all the others in one ScheduleIndex batch pass,
+        sharing cache entries with get_open_restaurants
+
+        Args:
+            days (List[str]): Day of the week for each query in %a format: Mon / Tue / Wed etc
+            input_times (List[str]): 12 hour time for each query
+
+        Returns:
+            List[list]: A list of open restaurants per query
+        """
+        if len(days) != len(input_times):
+            raise ValueError(f"Got {len(days)} days and {len(input_times)} times")
+        minutes = {value: ParserUtils.to_minutes(ParserUtils.parse_time(value)) for value in set(input_times)}
+        keys = [(self.version, 'open', day, minutes[input_time]) for day, input_time in zip(days, input_times)]
+
+        results, misses = {}, []
+        for key in dict.fromkeys(keys):
+            value = self.cache.get(key)
+            if value is None:
+                misses.append(key)
+            else:
+                results[key] = value
+        if misses:
+            pairs, names = ScheduleIndex.for_df(self.schedule).open_restaurants_batch([key[2] for key in misses], [key[3] for key in misses])
+            groups = [[] for _ in misses]
+            for query_id, restaurant_id in pairs.tolist():
+                groups[query_id].append(names[restaurant_id])
+            for key, group in zip(misses, groups):
+                results[key] = tuple(group)
+                self.cache.put(key, results[key])
+        return [list(results[key]) for key in keys]
+
+    def get_restaurant_open_timings(self, restaurant_names: Union[str, list]) -> dict:
+        """ Open timings of restaurants, see QueryProcessor.get_restaurant_open_timings """
+        return QueryProcessor.get_restaurant_open_timings(self.schedule, restaurant_names)
+
+    def search_restaurants(self, query: str, limit: int = 10) -> list:
+        """ Restaurants by partial name, see QueryProcessor.search_restaurants """
+        return QueryProcessor.search_restaurants(self.schedule, query, limit)
+
+    def get_opening_soon(self, day: str, input_time: str, within_minutes: int = 30) -> list:
+        """ Restaurants opening soon, see QueryProcessor.get_opening_soon """
+        return QueryProcessor.get_opening_soon(self.schedule, day, input_time, within_minutes)
+
+    def get_closing_soon(self, day: str, input_time: str, within_minutes: int = 15) -> list:
+        """ Restaurants closing soon, see QueryProcessor.get_closing_soon """
+        return QueryProcessor.get_closing_soon(self.schedule, day, input_time, within_minutes)
+
+    def get_next_open(self, restaurant_name: str, day: str, input_time: str) -> Optional[tuple]:
+        """ Next opening of a restaurant, see QueryProcessor.get_next_open """
+        return QueryProcessor.get_next_open(self.schedule, restaurant_name, day, input_time)
+
+    def get_open_throughout(self, day: str, start_time: str, end_time: str, end_day: Optional[str] = None) -> list:
+        """ Restaurants open for a whole window, see QueryProcessor.get_open_throughout """
+        return QueryProcessor.get_open_throughout(self.schedule, day, start_time, end_time, end_day)
+
+    def get_open_any_time(self, day: str, start_time: str, end_time: str, end_day: Optional[str] = None) -> list:
+        """ Restaurants open at some point of a window, see QueryProcessor.get_open_any_time """
+        return QueryProcessor.get_open_any_time(self.schedule, day, start_time, end_time, end_day)
+
+    def get_open_together(self, restaurant_names: list, limit: int = 5) -> list:
+        """ First windows when restaurants are open together, see QueryProcessor.get_open_together """
+        return QueryProcessor.get_open_together(self.schedule, restaurant_names, limit)
+
+    def generate_insights(self) -> dict:
+        """
+        Insights of the schedule, computed once per data version, see QueryProcessor.generate_insights
+
+        Returns:
+            dict: Dictionary of insights, the per-minute open count arrays are read-only
+        """
+        def compute() -> dict:
+            insights = QueryProcessor.generate_insights(self.schedule)
+            for counts in insights['open_count_per_minute'].values():
+                counts.setflags(write=False)
+            return insights
+
+        insights = self._cached(('insights',), compute)
+        return dict(insights, open_count_per_minute=dict(insights['open_count_per_minute']))
+
+
+class TestQueryEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'restaurant_name': ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse'],
+            'day': ['Mon', 'Mon', 'Tue', 'Tue', 'Wed'],
+            'open_time': [datetime(1900, 1, 1, 11), datetime(1900, 1, 1, 11), datetime(1900, 1, 1, 0), datetime(1900, 1, 1, 11), datetime(1900, 1, 1, 0)],
+            'close_time': [datetime(1900, 1, 1, 22), datetime(1900, 1, 1, 23, 59), datetime(1900, 1, 1, 1), datetime(1900, 1, 1, 23, 59), datetime(1900, 1, 1, 1)]
+        })
+        self.engine = QueryEngine(self.df)
+
+    def test_matches_query_processor(self):
+        for day, input_time in [('Mon', '11:30 AM'), ('Mon', '10:45 PM'), ('Tue', '12:30 AM'), ('Sat', None), ('Mon', None)]:
+            self.assertEqual(self.engine.get_open_restaurants(day, input_time), QueryProcessor.get_open_restaurants(self.df, day, input_time))
+        self.assertEqual(self.engine.get_restaurant_open_timings('Nick\'s Lighthouse'), QueryProcessor.get_restaurant_open_timings(self.df, 'Nick\'s Lighthouse'))
+        self.assertEqual(self.engine.get_open_throughout('Mon', '10 PM', '1 AM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(self.engine.generate_insights()['total_restaurants'], 2)
+        days, times = ['Mon', 'Tue', 'Sat'], ['11:30 AM', '1 AM', '11:30 AM']
+        self.assertEqual(self.engine.get_open_restaurants_batch(days, times), QueryProcessor.get_open_restaurants_batch(self.df, days, times))
+
+    def test_batch_uses_cache_and_batch_index(self):
+        engine = QueryEngine(self.df)
+        engine.get_open_restaurants('Mon', '11:30 AM')
+        metrics.reset()
+        days, times = ['Mon', 'Tue', 'Mon', 'Funday', 'Wed'], ['11:30 am', '12:30 AM', '10:45 PM', '1 AM', '12:30 AM']
+        self.assertEqual(engine.get_open_restaurants_batch(days, times), QueryProcessor.get_open_restaurants_batch(self.df, days, times))
+        self.assertEqual((metrics.counter('engine.cache_hits'), metrics.counter('engine.cache_misses')), (1, 4))
+        self.assertEqual(engine.get_open_restaurants('Wed', '12:30 AM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(metrics.counter('engine.cache_hits'), 2)
+        self.assertEqual(engine.get_open_restaurants_batch([], []), [])
+
+    def test_immutable(self):
+        with self.assertRaises(ValueError):
+            self.engine.schedule.open_minute[0] = 0
+        result = self.engine.get_open_restaurants('Mon', '11:30 AM')
+        result.append('Mutated')
+        self.assertEqual(self.engine.get_open_restaurants('Mon', '11:30 am'), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        with self.assertRaises(ValueError):
+            self.engine.generate_insights()['open_count_per_minute']['Mon'][0] = 5
+        self.assertEqual(list(self.df.columns), ['restaurant_name', 'day', 'open_time', 'close_time'])
+
+    def test_cache_versions(self):
+        cache = QueryCache()
+        engine = QueryEngine(self.df, cache=cache)
+        self.assertEqual(engine.version, QueryEngine(self.df).version)
+        metrics.reset()
+        engine.get_open_restaurants('Mon', '11:30 AM')
+        engine.get_open_restaurants('Mon', '11:30 am')
+        engine.generate_insights()
+        engine.generate_insights()
+        self.assertEqual((metrics.counter('engine.cache_hits'), metrics.counter('engine.cache_misses')), (2, 2))
+
+        # A new schedule gets a new version and never sees the results of the old one
+        changed = QueryEngine(self.df[self.df['restaurant_name'] != 'A-1 Cafe Restaurant'], cache=cache)
+        self.assertNotEqual(changed.version, engine.version)
+        self.assertEqual(changed.get_open_restaurants('Mon', '11:30 AM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(changed.generate_insights()['total_restaurants'], 1)
+        cache.discard_version(engine.version)
+        self.assertEqual(len(cache), 2)
+
+        small = QueryCache(maxsize=2)
+        engine = QueryEngine(self.df, cache=small)
+        for day in ['Mon', 'Tue', 'Wed']:
+            engine.get_open_restaurants(day, '12:30 AM')
+        self.assertEqual(len(small), 2)
+
+    def test_thread_pool(self):
+        queries = [(day, f"{hour:02d}:{minute:02d} {half}") for day in ParserUtils.days for hour in range(1, 13)
+                   for minute in (0, 30) for half in ('AM', 'PM')]
+        expected = [QueryProcessor.get_open_restaurants(self.df, day, input_time) for day, input_time in queries]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda query: self.engine.get_open_restaurants(*query), queries * 4))
+            insights = list(pool.map(lambda _: self.engine.generate_insights()['total_restaurants'], range(16)))
+        self.assertEqual(results, expected * 4)
+        self.assertEqual(insights, [2] * 16)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,23 +1,35 @@
 import logging
 import os
+import numpy as np
 import pandas as pd
 import re
 from datetime import datetime, time
 from typing import List, Dict, Optional, Union
 import unittest
 
+from compact_schedule import CompactSchedule
+from event_index import EventIndex
+from instrumentation import metrics
+from name_index import NameIndex
+from schedule_index import MINUTES_PER_DAY, MINUTES_PER_WEEK, ScheduleIndex, cached_for_df
+from utils import ParserUtils
+from week_bitmap import WeekBitmap
+
 filename = os.path.basename(__file__)
 
-logging.basicConfig( level=logging.DEBUG, format='%(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(filename)
 
+# Compact form of the processed dataframes queried for insights, keyed on id() of the dataframe, see cached_for_df
+_COMPACT_CACHE = {}
+
 class QueryProcessor:
 
-    def get_open_restaurants(df: pd.DataFrame, day: str, input_time: Optional[str] = None) -> list:
+    @metrics.timed('query.get_open_restaurants')
+    def get_open_restaurants(df: Union[pd.DataFrame, CompactSchedule], day: str, input_time: Optional[str] = None) -> list:
         """
         Finds list of open restaurants during a given day of the week and time
         Args:
-            df (pd.DataFrame): Processed dataframe with restaurant schedule
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
             day (str): Day of the week in %a format: Mon / Tue / Wed etc 
             input_time (Optional[str], optional): 12 hour time format. Defaults to None.
 
@@ -25,102 +37,343 @@ class QueryProcessor:
             list: Returns the list of open restaurants for a given day and time
         """
         try:
-            mask = (df['day'] == day)
-            if input_time:
-                input_datetime = datetime.strptime(input_time, "%I:%M %p") if ":" in input_time else datetime.strptime(input_time, "%I %p")
-                mask &= (df['open_time'] <= input_datetime) & (df['close_time'] >= input_datetime)
+            # The index is built on the first query against this dataframe and reused afterwards
+            index = ScheduleIndex.for_df(df)
+            minutes = ParserUtils.to_minutes(ParserUtils.parse_time(input_time)) if input_time else None
+            open_restaurants = index.open_restaurants(day, minutes)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return open_restaurants
+
+
+    @metrics.timed('query.get_open_restaurants_batch')
+    def get_open_restaurants_batch(df: Union[pd.DataFrame, CompactSchedule], days: List[str], input_times: List[str], as_pairs: bool = False) -> Union[List[list], tuple]:
+        """
+        Finds open restaurants for many day and time pairs at once.
+        Every distinct time string is parsed once and all queries are answered in one NumPy pass
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            days (List[str]): Day of the week for each query in %a format: Mon / Tue / Wed etc
+            input_times (List[str]): 12 hour time for each query
+            as_pairs (bool, optional): Return (query_id, restaurant_id) pairs instead of name lists. Defaults to False.
+
+        Returns:
+            Union[List[list], tuple]: A list of open restaurants per query, or a pair array and the
+            restaurant names indexed by restaurant_id
+        """
+        try:
+            if len(days) != len(input_times):
+                raise ValueError(f"Got {len(days)} days and {len(input_times)} times")
+
+            if not days:
+                return (np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=object)) if as_pairs else []
 
-            open_restaurants = df[mask]['restaurant_name'].unique().tolist()
+            index = ScheduleIndex.for_df(df)
+            unique_times, inverse = np.unique(np.asarray(input_times, dtype=str), return_inverse=True)
+            unique_minutes = np.array([ParserUtils.to_minutes(ParserUtils.parse_time(value)) for value in unique_times], dtype=np.int64)
+            pairs, names = index.open_restaurants_batch(days, unique_minutes[inverse.reshape(-1)])
+            if as_pairs:
+                return pairs, names
+
+            counts = np.bincount(pairs[:, 0], minlength=len(days))
+            open_restaurants = [chunk.tolist() for chunk in np.split(names[pairs[:, 1]], np.cumsum(counts)[:-1])]
         except Exception as e:
             logger.error(e)
             raise e
         return open_restaurants
 
+    @metrics.timed('query.get_opening_soon')
+    def get_opening_soon(df: Union[pd.DataFrame, CompactSchedule], day: str, input_time: str, within_minutes: int = 30) -> list:
+        """
+        Finds restaurants opening within some minutes of a given day and time, wrapping from Sunday into Monday
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            input_time (str): 12 hour time format
+            within_minutes (int, optional): Window length in minutes. Defaults to 30.
+
+        Returns:
+            list: Restaurants opening in the window, earliest first
+        """
+        try:
+            minutes = ParserUtils.to_minutes(ParserUtils.parse_time(input_time))
+            restaurants = EventIndex.for_df(df).opening_within(day, minutes, within_minutes)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return restaurants
+
+    @metrics.timed('query.get_closing_soon')
+    def get_closing_soon(df: Union[pd.DataFrame, CompactSchedule], day: str, input_time: str, within_minutes: int = 15) -> list:
+        """
+        Finds restaurants closing within some minutes of a given day and time, wrapping from Sunday into Monday.
+        Timings split at midnight count as one closing on the following day
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            input_time (str): 12 hour time format
+            within_minutes (int, optional): Window length in minutes. Defaults to 15.
+
+        Returns:
+            list: Restaurants closing in the window, earliest first
+        """
+        try:
+            minutes = ParserUtils.to_minutes(ParserUtils.parse_time(input_time))
+            restaurants = EventIndex.for_df(df).closing_within(day, minutes, within_minutes)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return restaurants
+
+    @metrics.timed('query.get_next_open')
+    def get_next_open(df: Union[pd.DataFrame, CompactSchedule], restaurant_name: str, day: str, input_time: str) -> Optional[tuple]:
+        """
+        Finds the next opening of a restaurant at or after a given day and time
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            restaurant_name (str): Restaurant name
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            input_time (str): 12 hour time format
+
+        Returns:
+            Optional[tuple]: Day and time of the opening, e.g. ('Tue', '11:00 AM'). None for an unknown
+            restaurant or one open around the clock
+        """
+        try:
+            minutes = ParserUtils.to_minutes(ParserUtils.parse_time(input_time))
+            next_open = EventIndex.for_df(df).next_open(restaurant_name, day, minutes)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return next_open
+
+    def _window(day: str, start_time: str, end_time: str, end_day: Optional[str] = None) -> tuple:
+        """ (start day, start minute, end day, end minute) of a window, ending on the next day when the end time is not after the start """
+        start_minute = ParserUtils.to_minutes(ParserUtils.parse_time(start_time))
+        end_minute = ParserUtils.to_minutes(ParserUtils.parse_time(end_time))
+        if end_day is None:
+            end_day = day if end_minute > start_minute or day not in ParserUtils.days else ParserUtils.days[(ParserUtils.days.index(day) + 1) % 7]
+        return day, start_minute, end_day, end_minute
+
+    @metrics.timed('query.get_open_throughout')
+    def get_open_throughout(df: Union[pd.DataFrame, CompactSchedule], day: str, start_time: str, end_time: str, end_day: Optional[str] = None) -> list:
+        """
+        Finds restaurants open for the whole of a window, e.g. Fri 9 pm - 1 am.
+        Windows are rounded outwards to 15 minute slots
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            day (str): Day of the week the window starts in %a format: Mon / Tue / Wed etc
+            start_time (str): 12 hour time the window starts at
+            end_time (str): 12 hour time the window ends at, not included
+            end_day (Optional[str], optional): Day the window ends. Defaults to None, the same day
+                or the next one when end_time is not after start_time.
+
+        Returns:
+            list: Restaurants open throughout the window
+        """
+        try:
+            restaurants = WeekBitmap.for_df(df).open_throughout(*QueryProcessor._window(day, start_time, end_time, end_day))
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return restaurants
+
+    @metrics.timed('query.get_open_any_time')
+    def get_open_any_time(df: Union[pd.DataFrame, CompactSchedule], day: str, start_time: str, end_time: str, end_day: Optional[str] = None) -> list:
+        """
+        Finds restaurants open at any point of a window, e.g. Mon 2 pm - 4 pm, see get_open_throughout for the arguments
+
+        Returns:
+            list: Restaurants open at some point of the window
+        """
+        try:
+            restaurants = WeekBitmap.for_df(df).open_any_time(*QueryProcessor._window(day, start_time, end_time, end_day))
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return restaurants
+
+    @metrics.timed('query.get_open_together')
+    def get_open_together(df: Union[pd.DataFrame, CompactSchedule], restaurant_names: list, limit: int = 5) -> list:
+        """
+        Finds the first windows of the week, from Mon 12:00 AM, when all the given restaurants are open together
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            restaurant_names (list): Restaurant names
+            limit (int, optional): Maximum number of windows. Defaults to 5.
+
+        Returns:
+            list: (start day, start time, end day, end time) of every window, e.g. ('Fri', '05:00 PM', 'Fri', '10:00 PM')
+        """
+        try:
+            windows = WeekBitmap.for_df(df).open_together(restaurant_names, limit)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        return windows
 
-    def get_restaurant_open_timings(df: pd.DataFrame, restaurant_names: Union[str, list]) -> dict:
+    @metrics.timed('query.get_restaurant_open_timings')
+    def get_restaurant_open_timings(df: Union[pd.DataFrame, CompactSchedule], restaurant_names: Union[str, list]) -> dict:
         """
         Finds open timing for a list of restaurants
 
         Args:
-            df (pd.DataFrame): Processed dataframe with restaurant schedule
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
             restaurant_names (Union[str, list]): A List of restaurants 
 
         Returns:
             dict: Name of restaurant and a list of open-close timings
         """
         try:
-
             if isinstance(restaurant_names, str):
                 restaurant_names = [restaurant_names]
 
-            relevant_data = df[df['restaurant_name'].isin(restaurant_names)]
+            # Rows are grouped by restaurant once per schedule, a lookup only formats its own rows
+            index = NameIndex.for_df(df)
+            timings_dict = {restaurant: index.timings(restaurant) for restaurant in restaurant_names}
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+        return timings_dict
 
+    @metrics.timed('query.search_restaurants')
+    def search_restaurants(df: Union[pd.DataFrame, CompactSchedule], query: str, limit: int = 10) -> list:
+        """
+        Finds restaurants by a partial, case-insensitive name. Prefix matches come first
 
-            timings_dict = {}
-            for restaurant in restaurant_names:
-                restaurant_df = relevant_data[relevant_data['restaurant_name'] == restaurant]
-                timings_list = []
-                for _, row in restaurant_df.iterrows():
-                    timings_list.append(f"{row['day']}: {row['open_time'].strftime('%I:%M %p')} - {row['close_time'].strftime('%I:%M %p')}")
-                timings_dict[restaurant] = timings_list
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            query (str): Partial restaurant name, e.g. "nick's"
+            limit (int, optional): Maximum number of names returned. Defaults to 10.
+
+        Returns:
+            list: Matching restaurant names
+        """
+        try:
+            restaurants = NameIndex.for_df(df).search(query, limit)
         except Exception as e:
             logger.error(e)
             raise e
-        
-        return timings_dict
+        return restaurants
 
-    def generate_insights(df):
+    @metrics.timed('query.generate_insights')
+    def generate_insights(df: Union[pd.DataFrame, CompactSchedule]) -> dict:
         """
-        General Insights and aggregates
+        General Insights and aggregates. Computed on the columnar minutes of the schedule without
+        touching the input, as the partial aggregates of the whole schedule (insight_partials) finalized
 
         Args:
-            df (pd.Dataframe): Processed dataframe with restaurant schedule
+            df (Union[pd.Dataframe, CompactSchedule]): Processed restaurant schedule
 
         Returns:
-            dict: Dictionary of insights
-        """        """"""
+            dict: Dictionary of insights, including 'open_count_per_minute' with the number of
+            open schedule rows for each minute of every day
+        """
         try:
-            insights = {}
-
-            # General Insights
-            insights['total_restaurants'] = df['restaurant_name'].nunique()
-            common_open_time = df['open_time'].mode()[0]
-            common_close_time = df['close_time'].mode()[0]
-            insights['most_common_open_time'] = common_open_time
-            insights['most_common_close_time'] = common_close_time
-
-            df['duration'] = (df['close_time'] - df['open_time']).dt.total_seconds() / 3600
-            insights['average_duration'] = df['duration'].mean()
-
-            # Peak Hours
-            hours = [i for i in range(24)]
-            open_counts = [0 for _ in range(24)]
-
-            for _, row in df.iterrows():
-                for hour in range(int(row['open_time'].hour), int(row['close_time'].hour)):
-                    open_counts[hour] += 1
-
-            peak_hour = hours[open_counts.index(max(open_counts))]
-            insights['most_busy_hour'] = peak_hour
-
-            # Day specific insights
-            weekend_restaurants = df[df['day'].isin(['Sat', 'Sun'])]['restaurant_name'].nunique()
-            insights['weekend_restaurants'] = weekend_restaurants
-            
-            sat_restaurants = df[df['day'].isin(['Sat'])]['restaurant_name'].nunique()
-            insights['sat_restaurants'] = sat_restaurants
-            
-            sun_restaurants = df[df['day'].isin(['Sun'])]['restaurant_name'].nunique()
-            insights['sun_restaurants'] = sun_restaurants
-
-            # Operational consistency
-            consistent_restaurants = df.groupby('restaurant_name').nunique()['open_time']
-            insights['consistent_operating_restaurants'] = consistent_restaurants[consistent_restaurants == 1].count()
+            insights = QueryProcessor.finalize_insights(QueryProcessor.insight_partials(df))
         except Exception as e:
             logger.error(e)
             raise e
         return insights
-    
+
+    def insight_partials(df: Union[pd.DataFrame, CompactSchedule]) -> dict:
+        """
+        Mergeable aggregates behind generate_insights: counts, sums and histograms only. Partials of
+        schedules with disjoint restaurants add up to the partials of the combined schedule.
+        Open counts come from a sweep line: +1 at every open minute and -1 after every close minute
+        over the week, followed by a cumulative sum
+
+        Args:
+            df (Union[pd.Dataframe, CompactSchedule]): Processed restaurant schedule
+
+        Returns:
+            dict: Partial aggregates, combined with merge_insight_partials
+        """
+        # The compact form of a DataFrame is built once, repeated calls only pay for the sweep
+        schedule = df if isinstance(df, CompactSchedule) else cached_for_df(_COMPACT_CACHE, df, lambda: CompactSchedule.from_df(df))
+        restaurant_id = np.asarray(schedule.restaurant_id, dtype=np.int64)
+        day = np.asarray(schedule.day, dtype=np.int64)
+        open_minute = np.asarray(schedule.open_minute, dtype=np.int64)
+        close_minute = np.asarray(schedule.close_minute, dtype=np.int64)
+
+        starts = day * MINUTES_PER_DAY + open_minute
+        ends = day * MINUTES_PER_DAY + close_minute
+        changes = np.bincount(starts, minlength=MINUTES_PER_WEEK + 1) - np.bincount(ends + 1, minlength=MINUTES_PER_WEEK + 1)
+
+        open_time_pairs = np.unique(restaurant_id * MINUTES_PER_DAY + open_minute)
+        open_times_per_restaurant = np.bincount(open_time_pairs // MINUTES_PER_DAY)
+        return {
+            'rows': len(schedule),
+            'total_restaurants': int(np.unique(restaurant_id).size),
+            'open_time_counts': np.bincount(open_minute, minlength=MINUTES_PER_DAY),
+            'close_time_counts': np.bincount(close_minute, minlength=MINUTES_PER_DAY),
+            'duration_minutes': int((close_minute - open_minute).sum()),
+            'open_counts': np.cumsum(changes)[:MINUTES_PER_WEEK],
+            'weekend_restaurants': int(np.unique(restaurant_id[day >= 5]).size),
+            'sat_restaurants': int(np.unique(restaurant_id[day == 5]).size),
+            'sun_restaurants': int(np.unique(restaurant_id[day == 6]).size),
+            'consistent_operating_restaurants': int((open_times_per_restaurant == 1).sum()),
+        }
+
+    def merge_insight_partials(partials: List[dict]) -> dict:
+        """
+        Adds up the partial aggregates of schedules with disjoint restaurants
+
+        Args:
+            partials (List[dict]): insight_partials outputs
+
+        Returns:
+            dict: Partial aggregates of the combined schedule
+        """
+        return {key: sum(partial[key] for partial in partials) for key in partials[0]}
+
+    def finalize_insights(partials: dict) -> dict:
+        """
+        Turns partial aggregates into generate_insights output: modes and the busiest hour are taken
+        from the (merged) histograms
+
+        Args:
+            partials (dict): insight_partials or merge_insight_partials output
+
+        Returns:
+            dict: Dictionary of insights
+        """
+        if not partials['rows']:
+            raise ValueError("No restaurants in the schedule")
+
+        base = pd.Timestamp(1900, 1, 1)
+        insights = {}
+
+        # General Insights
+        insights['total_restaurants'] = partials['total_restaurants']
+        insights['most_common_open_time'] = base + pd.Timedelta(minutes=int(partials['open_time_counts'].argmax()))
+        insights['most_common_close_time'] = base + pd.Timedelta(minutes=int(partials['close_time_counts'].argmax()))
+        insights['average_duration'] = partials['duration_minutes'] / 60 / partials['rows']
+
+        # Peak Hours
+        open_counts = partials['open_counts'].reshape(7, MINUTES_PER_DAY)
+        insights['open_count_per_minute'] = {ParserUtils.days[i]: open_counts[i] for i in range(7)}
+
+        hourly_counts = open_counts.reshape(7, 24, 60).sum(axis=(0, 2))
+        insights['most_busy_hour'] = int(hourly_counts.argmax())
+
+        # Day specific insights
+        insights['weekend_restaurants'] = partials['weekend_restaurants']
+        insights['sat_restaurants'] = partials['sat_restaurants']
+        insights['sun_restaurants'] = partials['sun_restaurants']
+
+        # Operational consistency
+        insights['consistent_operating_restaurants'] = partials['consistent_operating_restaurants']
+        return insights
+
 class TestQueryProcessor(unittest.TestCase):
 
     def setUp(self):
@@ -146,6 +399,16 @@ class TestQueryProcessor(unittest.TestCase):
         result = QueryProcessor.get_open_restaurants(self.df, 'Mon', '10:45 PM')
         self.assertEqual(result, ['Nick\'s Lighthouse'])
 
+    def test_get_open_restaurants_batch(self):
+        days = ['Mon', 'Mon', 'Tue', 'Sat']
+        times = ['11:30 AM', '10:45 PM', '1 AM', '11:30 AM']
+        result = QueryProcessor.get_open_restaurants_batch(self.df, days, times)
+        self.assertEqual(result, [['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'], ['Nick\'s Lighthouse'], ['Nick\'s Lighthouse'], []])
+
+        pairs, names = QueryProcessor.get_open_restaurants_batch(self.df, days, times, as_pairs=True)
+        self.assertEqual([(query_id, names[restaurant_id]) for query_id, restaurant_id in pairs.tolist()],
+                         [(0, 'A-1 Cafe Restaurant'), (0, 'Nick\'s Lighthouse'), (1, 'Nick\'s Lighthouse'), (2, 'Nick\'s Lighthouse')])
+
     def test_get_restaurant_open_timings(self):
         # Test for single restaurant
         result = QueryProcessor.get_restaurant_open_timings(self.df, 'Nick\'s Lighthouse')
@@ -162,5 +425,57 @@ class TestQueryProcessor(unittest.TestCase):
         }
         self.assertEqual(result, expected_result)
 
+    def test_opening_and_closing_soon(self):
+        self.assertEqual(QueryProcessor.get_opening_soon(self.df, 'Mon', '10:30 AM'), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        self.assertEqual(QueryProcessor.get_closing_soon(self.df, 'Mon', '11:50 PM'), [])
+        self.assertEqual(QueryProcessor.get_closing_soon(self.df, 'Tue', '12:50 AM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(QueryProcessor.get_next_open(self.df, 'Nick\'s Lighthouse', 'Mon', '11:30 PM'), ('Tue', '11:00 AM'))
+
+    def test_window_queries(self):
+        self.assertEqual(QueryProcessor.get_open_throughout(self.df, 'Mon', '10:00 PM', '1 AM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(QueryProcessor.get_open_throughout(self.df, 'Mon', '11 AM', '10:15 PM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(QueryProcessor.get_open_any_time(self.df, 'Mon', '10:15 PM', '11 PM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(QueryProcessor.get_open_any_time(self.df, 'Tue', '2 AM', '4 AM'), [])
+        self.assertEqual(QueryProcessor.get_open_together(self.df, ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse']), [('Mon', '11:00 AM', 'Mon', '10:00 PM')])
+
+    def test_search_restaurants(self):
+        self.assertEqual(QueryProcessor.search_restaurants(self.df, "nick's"), ['Nick\'s Lighthouse'])
+        self.assertEqual(QueryProcessor.search_restaurants(self.df, "cafe"), ['A-1 Cafe Restaurant'])
+        self.assertEqual(QueryProcessor.get_restaurant_open_timings(self.df, 'Unknown'), {'Unknown': []})
+
+    def test_generate_insights(self):
+        columns = list(self.df.columns)
+        insights = QueryProcessor.generate_insights(self.df)
+        self.assertEqual(list(self.df.columns), columns)
+
+        self.assertEqual(insights['total_restaurants'], 2)
+        self.assertEqual(insights['most_common_open_time'], datetime.strptime("11:00 AM", "%I:%M %p"))
+        self.assertEqual(insights['most_common_close_time'], datetime.strptime("01:00 AM", "%I:%M %p"))
+        self.assertEqual(insights['most_busy_hour'], 11)
+        self.assertEqual(insights['weekend_restaurants'], 0)
+        self.assertEqual(insights['consistent_operating_restaurants'], 1)
+        self.assertAlmostEqual(insights['average_duration'], (660 + 779 + 60 + 779 + 60) / 5 / 60)
+
+        monday = insights['open_count_per_minute']['Mon']
+        self.assertEqual((monday[659], monday[660], monday[1320], monday[1321], monday[1439]), (0, 2, 2, 1, 1))
+        self.assertEqual((insights['open_count_per_minute']['Wed'][60], insights['open_count_per_minute']['Wed'][61]), (1, 0))
+
+        # The compact form is built on the first call only
+        from unittest import mock
+        with mock.patch.object(CompactSchedule, 'from_df', side_effect=AssertionError("rebuilt")):
+            self.assertEqual(QueryProcessor.generate_insights(self.df)['total_restaurants'], 2)
+
+    def test_query_latency_metrics(self):
+        metrics.reset()
+        QueryProcessor.get_open_restaurants(self.df, 'Mon', '11:30 AM')
+        QueryProcessor.get_open_restaurants(self.df, 'Tue')
+        self.assertEqual(metrics.histogram('query.get_open_restaurants')['count'], 2)
+
+    def test_compact_schedule(self):
+        schedule = CompactSchedule.from_df(self.df)
+        self.assertEqual(QueryProcessor.get_open_restaurants(schedule, 'Mon', '10:45 PM'), ['Nick\'s Lighthouse'])
+        self.assertEqual(QueryProcessor.get_restaurant_open_timings(schedule, 'A-1 Cafe Restaurant'),
+                         {'A-1 Cafe Restaurant': ['Mon: 11:00 AM - 10:00 PM']})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,440 @@
+import logging
+import os
+import weakref
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# Index cache keyed on id() of the processed dataframe, see cached_for_df
+_INDEX_CACHE = {}
+
+
+def cached_for_df(cache: dict, df: Union[pd.DataFrame, CompactSchedule], build: Callable, key: Hashable = None):
+    """
+    Structure over a processed schedule from a per-schedule cache, built on first use. Shared by the
+    for_df of every index. Entries are keyed on id() of the schedule, plus `key` for structures with
+    parameters, and the weakref callback drops them once the schedule is garbage collected so a
+    recycled id can never return a stale structure. Only the row count is checked on a hit, so a
+    schedule edited in place keeping its length gets the structure built before the edit
+
+    Args:
+        cache (dict): Module level cache of the structure
+        df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+        build (Callable): Builds the structure on a miss
+        key (Hashable, optional): Parameters of the structure. Defaults to None.
+
+    Returns:
+        The cached or built structure
+    """
+    cached = cache.get((id(df), key))
+    if cached is not None:
+        ref, value, rows = cached
+        if ref() is df and rows == len(df):
+            return value
+
+    value = build()
+    store_for_df(cache, df, value, key)
+    return value
+
+
+def store_for_df(cache: dict, df: Union[pd.DataFrame, CompactSchedule], value, key: Hashable = None):
+    """ Makes cached_for_df return `value` for the schedule instead of building it """
+    cache_key = (id(df), key)
+    ref = weakref.ref(df, lambda _, cache_key=cache_key, cache=cache: cache.pop(cache_key, None))
+    cache[cache_key] = (ref, value, len(df))
+
+
+class ScheduleIndex:
+    """
+    Interval tree over the processed restaurant schedule keyed on minute-of-week.
+
+    The tree is centered over the fixed domain [0, 10080): every node owns the center of its
+    range and stores the intervals that contain that center, sorted by start and by end.
+    The depth is bounded by log2(10080) ~ 14, so a point query costs O(log n + k).
+    """
+
+    def __init__(self, names: Sequence[str], days: Sequence[str], open_minutes: Sequence[int], close_minutes: Sequence[int]):
+        self._names = []
+        self._starts = []
+        self._ends = []
+        self._day_restaurants = {day: {} for day in ParserUtils.days}
+        self._restaurant_rows = {}
+        self._nodes = {}
+        self._arrays = None
+
+        buckets = {}
+        for name, day, open_minute, close_minute in zip(names, days, open_minutes, close_minutes):
+            row = self._add_row(name, day, int(open_minute), int(close_minute))
+            if row is None:
+                continue
+            buckets.setdefault(self._locate(self._starts[row], self._ends[row]), []).append(row)
+
+        for center, rows in buckets.items():
+            self._nodes[center] = (
+                sorted((self._starts[row], row) for row in rows),
+                sorted((-self._ends[row], row) for row in rows),
+            )
+
+    @staticmethod
+    def from_df(df: Union[pd.DataFrame, CompactSchedule]) -> 'ScheduleIndex':
+        """
+        Build an index from the output of DataProcesser.build_restaurant_df
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+
+        Returns:
+            ScheduleIndex: Index over the schedule
+        """
+        if isinstance(df, CompactSchedule):
+            return ScheduleIndex(df.names[df.restaurant_id], np.asarray(ParserUtils.days)[df.day],
+                                 df.open_minute, df.close_minute)
+
+        schedule = CompactSchedule.from_df(df)
+        return ScheduleIndex(df['restaurant_name'].tolist(), df['day'].tolist(),
+                             schedule.open_minute, schedule.close_minute)
+
+    @staticmethod
+    def for_df(df: Union[pd.DataFrame, CompactSchedule]) -> 'ScheduleIndex':
+        """
+        Returns the index for a processed schedule, building it on first use and reusing it afterwards.
+        The cache checks the identity and row count of the schedule, not its content: a schedule must
+        not be edited in place after its first query. Edit a copy, or call unregister after the edit
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+
+        Returns:
+            ScheduleIndex: Cached index over the schedule
+        """
+        return cached_for_df(_INDEX_CACHE, df, lambda: ScheduleIndex.from_df(df))
+
+    @staticmethod
+    def minute_of_week(day: str, minutes: int) -> int:
+        return ParserUtils.days.index(day) * MINUTES_PER_DAY + minutes
+
+    def _add_row(self, name: str, day: str, open_minute: int, close_minute: int) -> Optional[int]:
+        """ Appends a row, None for a row the tree cannot hold (closing before it opens, unknown day, minute out of range) """
+        row = len(self._names)
+        if day not in self._day_restaurants or not 0 <= open_minute <= close_minute < MINUTES_PER_DAY:
+            logger.warning(f"Skipping schedule row {row} ({name}, {day}, {open_minute} - {close_minute}): "
+                           "close before open, unknown day or minute out of range")
+            # Placeholder like a removed row, keeps the row numbers of the schedule
+            self._names.append(None)
+            self._starts.append(0)
+            self._ends.append(0)
+            return None
+        self._names.append(name)
+        self._starts.append(self.minute_of_week(day, open_minute))
+        self._ends.append(self.minute_of_week(day, close_minute))
+        restaurants = self._day_restaurants[day]
+        restaurants[name] = restaurants.get(name, 0) + 1
+        self._restaurant_rows.setdefault(name, []).append(row)
+        return row
+
+    @staticmethod
+    def _locate(start: int, end: int) -> int:
+        """ Center of the highest node whose center falls inside [start, end] """
+        lo, hi = 0, MINUTES_PER_WEEK
+        while True:
+            center = (lo + hi) // 2
+            if end < center:
+                hi = center
+            elif start > center:
+                lo = center + 1
+            else:
+                return center
+
+    def _stab(self, point: int) -> List[int]:
+        """ Rows whose [start, end] interval contains the point """
+        rows = []
+        lo, hi = 0, MINUTES_PER_WEEK
+        while lo < hi:
+            center = (lo + hi) // 2
+            node = self._nodes.get(center)
+            if point < center:
+                if node:
+                    for start, row in node[0]:
+                        if start > point:
+                            break
+                        rows.append(row)
+                hi = center
+            elif point > center:
+                if node:
+                    for neg_end, row in node[1]:
+                        if -neg_end < point:
+                            break
+                        rows.append(row)
+                lo = center + 1
+            else:
+                if node:
+                    rows.extend(row for _, row in node[0])
+                break
+        return rows
+
+    def open_restaurants(self, day: str, minutes: Optional[int] = None) -> List[str]:
+        """
+        Finds open restaurants for a day and optional minute of the day
+
+        Args:
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            minutes (Optional[int], optional): Minute of the day. Defaults to None.
+
+        Returns:
+            List[str]: Unique restaurant names in schedule order
+        """
+        if day not in self._day_restaurants:
+            return []
+        if minutes is None:
+            return list(self._day_restaurants[day])
+
+        rows = self._stab(self.minute_of_week(day, minutes))
+        rows.sort()
+        return list(dict.fromkeys(self._names[row] for row in rows))
+
+    def first_open_rows(self, day: str, minutes: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Open restaurants like open_restaurants, each with the schedule row of its first matching row.
+        Results of several indexes over parts of a schedule merge into its order by sorting on the rows
+
+        Args:
+            day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            minutes (Optional[int], optional): Minute of the day. Defaults to None.
+
+        Returns:
+            List[Tuple[str, int]]: Restaurant name and row, in schedule order
+        """
+        if day not in self._day_restaurants:
+            return []
+        if minutes is None:
+            day_id = ParserUtils.days.index(day)
+            rows = [row for row, start in enumerate(self._starts) if start // MINUTES_PER_DAY == day_id and self._names[row] is not None]
+        else:
+            rows = self._stab(self.minute_of_week(day, minutes))
+            rows.sort()
+        first_rows = {}
+        for row in rows:
+            first_rows.setdefault(self._names[row], row)
+        return list(first_rows.items())
+
+    @staticmethod
+    def register(df: Union[pd.DataFrame, CompactSchedule], index: 'ScheduleIndex'):
+        """
+        Makes for_df return an existing index for a processed schedule, e.g. one patched in place
+        after an incremental update, instead of building a new one
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            index (ScheduleIndex): Index over exactly that schedule
+        """
+        store_for_df(_INDEX_CACHE, df, index)
+
+    @staticmethod
+    def unregister(df: Union[pd.DataFrame, CompactSchedule]):
+        """ Drops the cached index of a processed schedule, for_df builds a new one on its next call """
+        _INDEX_CACHE.pop((id(df), None), None)
+
+    def add_restaurant(self, name: str, entries: Sequence[Tuple[str, int, int]]):
+        """
+        Inserts the schedule rows of a restaurant into the tree
+
+        Args:
+            name (str): Restaurant name
+            entries (Sequence[Tuple[str, int, int]]): Day of week, open and close minute of the day
+        """
+        for day, open_minute, close_minute in entries:
+            row = self._add_row(name, day, open_minute, close_minute)
+            if row is None:
+                continue
+            start, end = self._starts[row], self._ends[row]
+            starts, ends = self._nodes.setdefault(self._locate(start, end), ([], []))
+            insort(starts, (start, row))
+            insort(ends, (-end, row))
+        self._arrays = None
+
+    def remove_restaurant(self, name: str):
+        """
+        Deletes every schedule row of a restaurant from the tree
+
+        Args:
+            name (str): Restaurant name
+        """
+        for row in self._restaurant_rows.pop(name, []):
+            start, end = self._starts[row], self._ends[row]
+            starts, ends = self._nodes[self._locate(start, end)]
+            del starts[bisect_left(starts, (start, row))]
+            del ends[bisect_left(ends, (-end, row))]
+
+            restaurants = self._day_restaurants[ParserUtils.days[start // MINUTES_PER_DAY]]
+            restaurants[name] -= 1
+            if not restaurants[name]:
+                del restaurants[name]
+            self._names[row] = None
+        self._arrays = None
+
+    def _batch_arrays(self):
+        """ Columnar copy of the live rows used by batch queries, built on first use """
+        if self._arrays is None:
+            rows = np.array([row for row, name in enumerate(self._names) if name is not None], dtype=np.int64)
+            codes, names = pd.factorize(pd.Series([self._names[row] for row in rows], dtype=object))
+            self._arrays = (np.asarray(self._starts, dtype=np.int64)[rows], np.asarray(self._ends, dtype=np.int64)[rows],
+                            codes.astype(np.int64), np.asarray(names, dtype=object), rows)
+        return self._arrays
+
+    def open_restaurants_batch(self, days: Sequence[str], minutes: Sequence[int], with_rows: bool = False) -> (np.ndarray, np.ndarray):
+        """
+        Finds open restaurants for many day / minute pairs in one pass.
+        Queries are sorted once, and every schedule interval selects its contiguous run of
+        matching queries with searchsorted, so the cost is O((n + q) log q + k)
+
+        Args:
+            days (Sequence[str]): Day of the week for each query in %a format
+            minutes (Sequence[int]): Minute of the day for each query
+            with_rows (bool, optional): Add the schedule row of the first matching row as a third column. Defaults to False.
+
+        Returns:
+            np.ndarray: (query_id, restaurant_id) pairs ordered like the single query results
+            np.ndarray: Restaurant names indexed by restaurant_id
+        """
+        starts, ends, codes, names, schedule_rows = self._batch_arrays()
+        day_ids = np.array([ParserUtils.days.index(day) if day in ParserUtils.days else -1 for day in days], dtype=np.int64)
+        points = day_ids * MINUTES_PER_DAY + np.asarray(minutes, dtype=np.int64)
+        # Unknown days never match, same as the single query
+        points[day_ids < 0] = -1
+
+        order = np.argsort(points, kind='stable')
+        sorted_points = points[order]
+        lo = np.searchsorted(sorted_points, starts, side='left')
+        hi = np.searchsorted(sorted_points, ends, side='right')
+        counts = hi - lo
+
+        # Expand every interval into the query ids it covers without a Python loop
+        rows = np.repeat(np.arange(len(starts)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+        query_ids = order[offsets]
+
+        # Order by query then schedule row and keep the first row of every restaurant
+        by_query = np.lexsort((rows, query_ids))
+        query_ids, restaurant_ids = query_ids[by_query], codes[rows[by_query]]
+        _, first = np.unique(query_ids * len(names) + restaurant_ids, return_index=True)
+        first.sort()
+        if with_rows:
+            return np.column_stack((query_ids[first], restaurant_ids[first], schedule_rows[rows[by_query][first]])), names
+        return np.column_stack((query_ids[first], restaurant_ids[first])), names
+
+
+class TestScheduleIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.sample_data = {
+            'restaurant_name': ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse'],
+            'day': ['Mon', 'Mon', 'Tue', 'Tue', 'Wed'],
+            'open_time': [datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("12:00 AM", "%I:%M %p"), datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("12:00 AM", "%I:%M %p")],
+            'close_time': [datetime.strptime("10:00 PM", "%I:%M %p"), datetime.strptime("11:59 PM", "%I:%M %p"), datetime.strptime("01:00 AM", "%I:%M %p"), datetime.strptime("11:59 PM", "%I:%M %p"), datetime.strptime("01:00 AM", "%I:%M %p")]
+        }
+        self.df = pd.DataFrame(self.sample_data)
+
+    def test_open_restaurants(self):
+        index = ScheduleIndex.from_df(self.df)
+        self.assertEqual(index.open_restaurants('Mon', 11 * 60), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Mon', 22 * 60), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Mon', 22 * 60 + 1), ['Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Tue', 60), ['Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Tue', 61), [])
+        self.assertEqual(index.open_restaurants('Wed'), ['Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Sun'), [])
+
+    def test_matches_mask(self):
+        index = ScheduleIndex.from_df(self.df)
+        for day in ParserUtils.days:
+            for minutes in range(0, MINUTES_PER_DAY, 7):
+                point = datetime(1900, 1, 1, minutes // 60, minutes % 60)
+                mask = (self.df['day'] == day) & (self.df['open_time'] <= point) & (self.df['close_time'] >= point)
+                self.assertEqual(index.open_restaurants(day, minutes), self.df[mask]['restaurant_name'].unique().tolist())
+
+    def test_open_restaurants_batch(self):
+        index = ScheduleIndex.from_df(self.df)
+        days = ['Mon', 'Tue', 'Mon', 'Sun', 'Funday', 'Wed']
+        minutes = [11 * 60, 60, 23 * 60, 12 * 60, 11 * 60, 0]
+        pairs, names = index.open_restaurants_batch(days, minutes)
+        results = [[] for _ in days]
+        for query_id, restaurant_id in pairs:
+            results[query_id].append(names[restaurant_id])
+        self.assertEqual(results, [index.open_restaurants(day, minute) for day, minute in zip(days, minutes)])
+        pairs, names = index.open_restaurants_batch(days, minutes, with_rows=True)
+        results = [[] for _ in days]
+        for query_id, restaurant_id, row in pairs:
+            results[query_id].append((names[restaurant_id], row))
+        self.assertEqual(results, [index.first_open_rows(day, minute) for day, minute in zip(days, minutes)])
+        self.assertEqual(index.first_open_rows('Tue'), [('Nick\'s Lighthouse', 2)])
+
+    def test_close_before_open_row(self):
+        df = pd.DataFrame({
+            'restaurant_name': ['Night Owl', 'A-1 Cafe Restaurant'],
+            'day': ['Mon', 'Mon'],
+            'open_time': [datetime(1900, 1, 1, 22), datetime(1900, 1, 1, 11)],
+            'close_time': [datetime(1900, 1, 1, 2), datetime(1900, 1, 1, 23)],
+        })
+        with self.assertLogs(logger, 'WARNING'):
+            index = ScheduleIndex.from_df(df)
+        self.assertEqual(index.open_restaurants('Mon', 23 * 60 + 30), [])
+        self.assertEqual(index.first_open_rows('Mon', 22 * 60), [('A-1 Cafe Restaurant', 1)])
+        pairs, names = index.open_restaurants_batch(['Mon', 'Mon'], [23 * 60 + 30, 22 * 60], with_rows=True)
+        self.assertEqual(pairs.tolist(), [[1, 0, 1]])
+        with self.assertLogs(logger, 'WARNING'):
+            index.add_restaurant('Night Owl', [('Tue', 22 * 60, 2 * 60)])
+        self.assertEqual(index.open_restaurants('Tue'), [])
+
+    def test_compact_schedule(self):
+        index = ScheduleIndex.from_df(CompactSchedule.from_df(self.df))
+        self.assertEqual(index.open_restaurants('Mon', 22 * 60 + 1), ['Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Wed'), ['Nick\'s Lighthouse'])
+
+    def test_add_remove_restaurant(self):
+        index = ScheduleIndex.from_df(self.df)
+        index.remove_restaurant('Nick\'s Lighthouse')
+        self.assertEqual(index.open_restaurants('Mon', 23 * 60 + 30), [])
+        self.assertEqual(index.open_restaurants('Wed'), [])
+
+        index.add_restaurant('Nick\'s Lighthouse', [('Mon', 11 * 60, 23 * 60 + 30)])
+        self.assertEqual(index.open_restaurants('Mon', 23 * 60), ['Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Mon', 12 * 60), ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse'])
+        self.assertEqual(index.open_restaurants('Tue', 60), [])
+        pairs, names = index.open_restaurants_batch(['Mon'], [23 * 60])
+        self.assertEqual([names[restaurant_id] for restaurant_id in pairs[:, 1]], ['Nick\'s Lighthouse'])
+
+    def test_for_df_reuses_index(self):
+        self.assertIs(ScheduleIndex.for_df(self.df), ScheduleIndex.for_df(self.df))
+        self.assertIsNot(ScheduleIndex.for_df(self.df), ScheduleIndex.for_df(self.df.copy()))
+
+    def test_cached_for_df(self):
+        cache, built = {}, []
+        build = lambda: built.append(len(built)) or len(built)
+        df = self.df.copy()
+        self.assertEqual([cached_for_df(cache, df, build), cached_for_df(cache, df, build), cached_for_df(cache, df, build, key=15)], [1, 1, 2])
+        del df
+        self.assertEqual(cache, {})
+
+    def test_unregister_after_in_place_edit(self):
+        df = self.df.copy()
+        self.assertEqual(ScheduleIndex.for_df(df).open_restaurants('Sun'), [])
+        df.loc[0, 'day'] = 'Sun'
+        ScheduleIndex.unregister(df)
+        self.assertEqual(ScheduleIndex.for_df(df).open_restaurants('Sun'), ['A-1 Cafe Restaurant'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+import logging
+import os
+from functools import lru_cache
+from typing import List, Tuple
+import unittest
+
+from constants import PARSE_CACHE_SIZE
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+MINUTES_PER_DAY = 24 * 60
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+FULL_DAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Lower case abbreviations and full names to day ids
+DAY_IDS = {**{day.lower(): i for i, day in enumerate(DAY_NAMES)}, **{day: i for i, day in enumerate(FULL_DAY_NAMES)}}
+
+# (day id, open minute, close minute) entries and the reasons segments were rejected
+ParseResult = Tuple[Tuple[Tuple[int, int, int], ...], Tuple[str, ...]]
+
+
+class ScheduleSyntaxError(ValueError):
+    """ Raised inside a segment, carries the reason it was rejected """
+
+
+class ScheduleParser:
+    """
+    Hand written single pass parser for the timings grammar:
+
+        timings  := segment ("/" segment)*
+        segment  := days time ("-" | "to") time
+        days     := day ("-" day)? ("," day ("-" day)?)*
+        time     := hour (":" minute)? ("am" | "pm")
+
+    Days are abbreviations or full names in any case. Times go straight to minutes of the day, a
+    close before the open time continues into the next day. A segment that does not follow the
+    grammar is skipped with a reason and parsing resumes at the next "/".
+    """
+
+    def __init__(self, text: str):
+        self.text = text.lower()
+        self.pos = 0
+
+    def _skip_spaces(self):
+        text, pos = self.text, self.pos
+        while pos < len(text) and text[pos] in ' \t':
+            pos += 1
+        self.pos = pos
+
+    def _peek(self) -> str:
+        return self.text[self.pos] if self.pos < len(self.text) else ''
+
+    def _word(self) -> str:
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos].isalpha():
+            self.pos += 1
+        return self.text[start:self.pos]
+
+    def _day(self) -> int:
+        self._skip_spaces()
+        word = self._word()
+        if word not in DAY_IDS:
+            if word:
+                raise ScheduleSyntaxError(f"unknown day '{word}'")
+            raise ScheduleSyntaxError(f"expected a day at '{self._rest()}'" if self._rest() else "missing day")
+        return DAY_IDS[word]
+
+    def _days(self) -> List[int]:
+        days = []
+        while True:
+            first = self._day()
+            self._skip_spaces()
+            if self._peek() == '-':
+                self.pos += 1
+                last = self._day()
+                self._skip_spaces()
+                days.extend((first + i) % 7 for i in range((last - first) % 7 + 1))
+            else:
+                days.append(first)
+            if self._peek() != ',':
+                return days
+            self.pos += 1
+            self._skip_spaces()
+            # "Mon-Fri, 11 am - 10 pm": a comma before the times ends the day list
+            if self._peek().isdigit():
+                return days
+
+    def _number(self, max_digits: int) -> Tuple[int, int]:
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos].isdigit() and self.pos - start < max_digits:
+            self.pos += 1
+        return (int(self.text[start:self.pos]) if self.pos > start else -1), self.pos - start
+
+    def _time(self) -> int:
+        self._skip_spaces()
+        start = self.pos
+        hour, digits = self._number(2)
+        if not digits:
+            raise ScheduleSyntaxError(f"expected a time at '{self._rest()}'" if self._rest() else "missing time")
+        minute = 0
+        if self._peek() == ':':
+            self.pos += 1
+            minute, digits = self._number(2)
+            if digits != 2:
+                raise ScheduleSyntaxError(f"invalid time '{self.text[start:self.pos]}'")
+        self._skip_spaces()
+        meridiem = self._word()
+        if meridiem not in ('am', 'pm') or not 1 <= hour <= 12 or minute > 59:
+            raise ScheduleSyntaxError(f"invalid time '{self.text[start:self.pos]}'")
+        return (hour % 12) * 60 + minute + (12 * 60 if meridiem == 'pm' else 0)
+
+    def _time_range(self) -> Tuple[int, int]:
+        open_minute = self._time()
+        self._skip_spaces()
+        if self._peek() in ('-', '–'):
+            self.pos += 1
+        elif self.text.startswith('to', self.pos):
+            self.pos += 2
+        else:
+            raise ScheduleSyntaxError(f"expected '-' between the times at '{self._rest()}'")
+        close_minute = self._time()
+        self._skip_spaces()
+        return open_minute, close_minute
+
+    def _segment(self) -> List[Tuple[int, int, int]]:
+        days = self._days()
+        open_minute, close_minute = self._time_range()
+        if self._peek() not in ('', '/'):
+            raise ScheduleSyntaxError(f"unexpected '{self._rest()}' after the time range")
+
+        if close_minute < open_minute:
+            # Past midnight: open until 11:59 PM and from 12:00 AM on the next day
+            entries = []
+            for day in days:
+                entries.append((day, open_minute, MINUTES_PER_DAY - 1))
+                entries.append(((day + 1) % 7, 0, close_minute))
+            return entries
+        return [(day, open_minute, close_minute) for day in days]
+
+    def _rest(self) -> str:
+        end = self.text.find('/', self.pos)
+        return self.text[self.pos:end if end >= 0 else len(self.text)].strip()
+
+    def parse_all(self) -> ParseResult:
+        entries = []
+        reasons = []
+        while True:
+            start = self.pos
+            try:
+                entries.extend(self._segment())
+            except ScheduleSyntaxError as e:
+                end = self.text.find('/', self.pos)
+                self.pos = end if end >= 0 else len(self.text)
+                reasons.append(f"{e} in '{self.text[start:self.pos].strip()}'")
+            if self.pos >= len(self.text):
+                break
+            # At a "/", the next segment starts after it
+            self.pos += 1
+        return tuple(entries), tuple(reasons)
+
+    @staticmethod
+    @lru_cache(maxsize=PARSE_CACHE_SIZE)
+    def parse(timings: str) -> ParseResult:
+        """
+        Parses a timings string into minutes. Timings repeat heavily across restaurants, so the result
+        is cached on the string and every distinct schedule is parsed once per run
+
+        Args:
+            timings (str): Timings string (Mon-Thu, Sun 11:30 am - 10 pm  / Fri-Sat 11:30 am - 11 pm)
+
+        Returns:
+            ParseResult: (day id, open minute, close minute) entries and a reason for every rejected segment
+        """
+        return ScheduleParser(timings).parse_all()
+
+    @staticmethod
+    def parse_time(time_str: str) -> int:
+        """
+        Parses one 12 hour time (11 am / 11:30 PM)
+
+        Args:
+            time_str (str): 12 hour time
+
+        Raises:
+            ValueError: The string is not a single valid time
+
+        Returns:
+            int: Minute of the day
+        """
+        parser = ScheduleParser(time_str)
+        minute = parser._time()
+        parser._skip_spaces()
+        if parser._peek():
+            raise ScheduleSyntaxError(f"unexpected '{parser._rest()}' after the time")
+        return minute
+
+    @staticmethod
+    def parse_time_range(time_str: str) -> Tuple[int, int]:
+        """
+        Parses an open - close time range (11:00 am - 11 pm)
+
+        Args:
+            time_str (str): Time range
+
+        Raises:
+            ValueError: The string is not a valid time range
+
+        Returns:
+            Tuple[int, int]: Open and close minute of the day
+        """
+        parser = ScheduleParser(time_str)
+        open_minute, close_minute = parser._time_range()
+        if parser._peek():
+            raise ScheduleSyntaxError(f"unexpected '{parser._rest()}' after the time range")
+        return open_minute, close_minute
+
+
+class TestScheduleParser(unittest.TestCase):
+
+    def test_parse(self):
+        entries, reasons = ScheduleParser.parse("Mon-Thu, Sun 11:30 am - 10 pm / Fri-Sat 11:30 am - 11 pm")
+        self.assertEqual(reasons, ())
+        self.assertEqual(entries, ((0, 690, 1320), (1, 690, 1320), (2, 690, 1320), (3, 690, 1320), (6, 690, 1320), (4, 690, 1380), (5, 690, 1380)))
+
+    def test_past_midnight_and_wrapping_ranges(self):
+        self.assertEqual(ScheduleParser.parse("Sat-Sun 5 pm - 1:30 am")[0],
+                         ((5, 1020, 1439), (6, 0, 90), (6, 1020, 1439), (0, 0, 90)))
+        self.assertEqual(ScheduleParser.parse("Fri-Mon 12 pm - 12 am")[0][:2], ((4, 720, 1439), (5, 0, 0)))
+
+    def test_lenient_forms(self):
+        self.assertEqual(ScheduleParser.parse("MONDAY, wed 9AM to 5:15PM")[0], ((0, 540, 1035), (2, 540, 1035)))
+        self.assertEqual(ScheduleParser.parse("Mon-Fri, 11 am - 10 pm")[0][0], (0, 660, 1320))
+
+    def test_quarantine_reasons(self):
+        entries, reasons = ScheduleParser.parse("Mon 11:30 ma - 9:00 pm / Tue 11 am - 10 pm / Mo 9 am - 5 pm / Wed 13 pm - 2 pm / Thu 9 am")
+        self.assertEqual(entries, ((1, 660, 1320),))
+        self.assertEqual(len(reasons), 4)
+        self.assertIn("invalid time '11:30 ma'", reasons[0])
+        self.assertIn("unknown day 'mo'", reasons[1])
+        self.assertIn("invalid time '13 pm'", reasons[2])
+        self.assertIn("expected '-' between the times", reasons[3])
+        self.assertEqual(ScheduleParser.parse("")[1], ("missing day in ''",))
+        self.assertEqual(ScheduleParser.parse("Mon-Fri")[1], ("missing time in 'mon-fri'",))
+
+    def test_parse_time(self):
+        self.assertEqual(ScheduleParser.parse_time("12 am"), 0)
+        self.assertEqual(ScheduleParser.parse_time("12:30 PM"), 750)
+        self.assertEqual(ScheduleParser.parse_time_range("9 pm -11:59 am"), (1260, 719))
+        for invalid in ["25 pm", "11:3 am", "11 am junk", "noon"]:
+            with self.assertRaises(ValueError):
+                ScheduleParser.parse_time(invalid)
+
+if __name__ == '__main__':
+    unittest.main()
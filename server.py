@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+import unittest
+
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from data_processor import DataProcesser
+from data_reader import DataReader
+from event_index import EventIndex
+from instrumentation import Metrics, metrics
+from name_index import NameIndex
+from query_processor import QueryProcessor
+from schedule_index import ScheduleIndex
+from snapshot import ScheduleSnapshot
+from utils import to_json
+from watcher import ScheduleWatcher
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+class QueryServer:
+    """
+    Long running HTTP server over an in-memory schedule. The schedule and its index are built once
+    at startup, or kept up to date by a ScheduleWatcher, and every request is answered from memory:
+
+        GET /open?day=Mon&time=11:30 AM
+        GET /timings?name=A-1 Cafe Restaurant&name=Nick's Lighthouse
+        GET /search?q=nick's&limit=5
+        GET /insights
+        GET /metrics (request latency histograms and errors per endpoint, plus the process metrics)
+    """
+
+    def __init__(self, df: Optional[Union[pd.DataFrame, CompactSchedule]] = None, watcher: Optional[ScheduleWatcher] = None):
+        self._df = df
+        self.watcher = watcher
+        self.metrics = Metrics()
+        self._insights = (None, None)
+        self._server = None
+        # Build the query indexes before the first request instead of on the event loop inside it, like
+        # ScheduleWatcher.build does for its snapshots. Search needs the trigram index as well
+        if df is not None:
+            ScheduleIndex.for_df(df)
+            NameIndex.for_df(df)._trigram_index()
+            EventIndex.for_df(df)
+
+    @property
+    def df(self) -> Union[pd.DataFrame, CompactSchedule]:
+        return self.watcher.df if self.watcher else self._df
+
+    @staticmethod
+    def from_files(filenames: List[str], watch_interval: Optional[float] = None, snapshot_dir: Optional[str] = None) -> 'QueryServer':
+        if watch_interval:
+            return QueryServer(watcher=ScheduleWatcher(filenames, watch_interval).start())
+        if snapshot_dir:
+            # Memory-mapped schedule, the files are only read and parsed when they changed since the snapshot
+            return QueryServer(ScheduleSnapshot.load_or_build(filenames, snapshot_dir))
+        reader = DataReader(filenames)
+        return QueryServer(DataProcesser.build_restaurant_df(reader.get_restaurants_df()))
+
+    async def _insights_result(self, df: pd.DataFrame) -> dict:
+        # Insights only change with the schedule, compute them once per schedule off the event loop
+        insights_df, insights = self._insights
+        if insights_df is not df:
+            loop = asyncio.get_running_loop()
+            insights = await loop.run_in_executor(None, QueryProcessor.generate_insights, df)
+            self._insights = (df, insights)
+        return insights
+
+    async def handle(self, path: str) -> Tuple[int, object]:
+        """
+        Answers one request path
+
+        Args:
+            path (str): Request path with query string
+
+        Returns:
+            Tuple[int, object]: HTTP status and JSON payload
+        """
+        url = urlsplit(path)
+        params = parse_qs(url.query)
+        # One snapshot for the whole request, a reload swaps in a new DataFrame instead of changing this one
+        df = self.df
+        if url.path == '/open':
+            if 'day' not in params:
+                return 400, {'error': "Missing 'day' parameter"}
+            return 200, QueryProcessor.get_open_restaurants(df, params['day'][0], params.get('time', [None])[0])
+        if url.path == '/timings':
+            return 200, QueryProcessor.get_restaurant_open_timings(df, params.get('name', []))
+        if url.path == '/search':
+            limit = int(params.get('limit', ['10'])[0])
+            return 200, QueryProcessor.search_restaurants(df, params.get('q', [''])[0], limit)
+        if url.path == '/insights':
+            return 200, await self._insights_result(df)
+        if url.path == '/metrics':
+            return 200, {'server': self.metrics.snapshot(), 'process': metrics.snapshot()}
+        return 404, {'error': f"Unknown endpoint {url.path}"}
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                started = time.perf_counter()
+                parts = request_line.decode('latin-1').split()
+                endpoint = urlsplit(parts[1]).path if len(parts) >= 2 else ''
+                try:
+                    if len(parts) < 2 or parts[0] != 'GET':
+                        status, payload = 405, {'error': "Only GET requests are supported"}
+                    else:
+                        status, payload = await self.handle(parts[1])
+                except Exception as e:
+                    logger.error(e)
+                    status, payload = 400, {'error': str(e)}
+                body = to_json(payload).encode()
+                self.metrics.observe(f"request{endpoint}", time.perf_counter() - started)
+                if status >= 400:
+                    self.metrics.increment(f"request{endpoint}.errors")
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError as e:
+            logger.debug(e)
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        logger.info(f"Serving on {', '.join(str(sock.getsockname()) for sock in self._server.sockets)}")
+        return self._server
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8080):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve restaurant schedule queries over HTTP")
+    parser.add_argument('files', nargs='+', help="Input CSV files")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="Poll the input files every SECONDS and reload them when they change")
+    parser.add_argument('--snapshot', metavar='DIR', help="Load the processed schedule from this snapshot directory, rebuilding it when the files changed")
+    parser.add_argument('--debug', action='store_true', help="Enable debug logging")
+    options = parser.parse_args(args)
+    if options.snapshot and options.watch:
+        parser.error("--snapshot cannot be combined with --watch, the watcher rebuilds the schedule from the files")
+
+    logging.basicConfig(level=logging.DEBUG if options.debug else logging.INFO, format='%(name)s - %(levelname)s - %(message)s')
+    server = QueryServer.from_files(options.files, options.watch, options.snapshot)
+    asyncio.run(server.serve_forever(options.host, options.port))
+
+
+class TestQueryServer(unittest.TestCase):
+
+    def setUp(self):
+        self.sample_data = {
+            'restaurant_name': ['A-1 Cafe Restaurant', 'Nick\'s Lighthouse', 'Nick\'s Lighthouse'],
+            'day': ['Mon', 'Mon', 'Tue'],
+            'open_time': [datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("11:00 AM", "%I:%M %p"), datetime.strptime("12:00 AM", "%I:%M %p")],
+            'close_time': [datetime.strptime("10:00 PM", "%I:%M %p"), datetime.strptime("11:59 PM", "%I:%M %p"), datetime.strptime("01:00 AM", "%I:%M %p")]
+        }
+        self.server = QueryServer(pd.DataFrame(self.sample_data))
+
+    async def _get(self, port: int, paths: List[str]) -> List[Tuple[int, object]]:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        responses = []
+        for i, path in enumerate(paths):
+            connection = 'close' if i == len(paths) - 1 else 'keep-alive'
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: {connection}\r\n\r\n".encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length'):
+                    length = int(line.split(b':')[1])
+            responses.append((status, json.loads(await reader.readexactly(length))))
+        writer.close()
+        return responses
+
+    def test_indexes_built_up_front(self):
+        # The first /search and /timings requests must find the name index and its trigrams ready
+        df = self.server.df
+        name_index = NameIndex.for_df(df)
+        self.assertIsNotNone(name_index._trigrams)
+        asyncio.run(self.server.handle('/search?q=nick'))
+        self.assertIs(NameIndex.for_df(df), name_index)
+        self.assertIs(EventIndex.for_df(df), EventIndex.for_df(df))
+
+    def test_endpoints(self):
+        async def run():
+            server = await self.server.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await self._get(port, [
+                    '/open?day=Mon&time=10:45%20PM', '/timings?name=A-1%20Cafe%20Restaurant',
+                    '/insights', '/open', '/metrics', '/search?q=nick'
+                ])
+
+        responses = asyncio.run(run())
+        self.assertEqual(responses[0], (200, ['Nick\'s Lighthouse']))
+        self.assertEqual(responses[1], (200, {'A-1 Cafe Restaurant': ['Mon: 11:00 AM - 10:00 PM']}))
+        self.assertEqual(responses[2][1]['total_restaurants'], 2)
+        self.assertEqual(responses[3][0], 400)
+        server_metrics = responses[4][1]['server']
+        self.assertEqual(server_metrics['timers']['request/open']['count'], 2)
+        self.assertEqual(server_metrics['counters']['request/open.errors'], 1)
+        self.assertIn('query.get_open_restaurants', responses[4][1]['process']['timers'])
+        self.assertEqual(responses[5], (200, ['Nick\'s Lighthouse']))
+
+    def test_watcher_reload(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "schedule.csv")
+            with open(path, 'w') as schedule_file:
+                schedule_file.write('"Kushi Tsuru","Mon-Sun 11:30 am - 9 pm"\n')
+            server = QueryServer(watcher=ScheduleWatcher([path], interval=0.01, registry=Metrics()))
+            self.assertEqual(asyncio.run(server.handle('/insights'))[1]['total_restaurants'], 1)
+            with open(path, 'a') as schedule_file:
+                schedule_file.write('"Nick\'s Lighthouse","Mon-Sun 11 am - 10:30 pm"\n')
+            server.watcher.check()
+            self.assertTrue(server.watcher.check())
+        self.assertEqual(asyncio.run(server.handle('/open?day=Mon&time=10:00%20PM')), (200, ["Nick's Lighthouse"]))
+        self.assertEqual(asyncio.run(server.handle('/insights'))[1]['total_restaurants'], 2)
+
+    def test_snapshot(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "schedule.csv")
+            with open(path, 'w') as schedule_file:
+                schedule_file.write('"Kushi Tsuru","Mon-Sun 11:30 am - 9 pm"\n"Nick\'s Lighthouse","Mon-Sun 11 am - 10:30 pm"\n')
+            snapshot_dir = os.path.join(directory, "snapshot")
+            QueryServer.from_files([path], snapshot_dir=snapshot_dir)
+            server = QueryServer.from_files([path], snapshot_dir=snapshot_dir)
+        self.assertIsInstance(server.df, CompactSchedule)
+        self.assertEqual(asyncio.run(server.handle('/open?day=Mon&time=10:00%20PM')), (200, ["Nick's Lighthouse"]))
+        self.assertEqual(asyncio.run(server.handle('/timings?name=Kushi%20Tsuru'))[1]['Kushi Tsuru'][0], 'Mon: 11:30 AM - 09:00 PM')
+        self.assertEqual(asyncio.run(server.handle('/insights'))[1]['total_restaurants'], 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import logging
+import multiprocessing
+import os
+import zlib
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Tuple, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from query_processor import QueryProcessor
+from schedule_index import ScheduleIndex
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+
+def shard_of(restaurant_name: str, shards: int) -> int:
+    """ Shard owning a restaurant. crc32 instead of hash() so every process agrees """
+    return zlib.crc32(restaurant_name.encode()) % shards
+
+
+def _open_rows(df: pd.DataFrame, positions: np.ndarray, day: str, input_time: Optional[str] = None) -> List[Tuple[str, int]]:
+    """ Open restaurants of a shard with the position of their first matching row in the whole schedule """
+    minutes = ParserUtils.to_minutes(ParserUtils.parse_time(input_time)) if input_time else None
+    return [(name, int(positions[row])) for name, row in ScheduleIndex.for_df(df).first_open_rows(day, minutes)]
+
+
+def _open_rows_batch(df: pd.DataFrame, positions: np.ndarray, days: List[str], input_times: List[str]) -> List[List[Tuple[str, int]]]:
+    """ _open_rows for many day and time pairs in one batch pass """
+    unique_times, inverse = np.unique(np.asarray(input_times, dtype=str), return_inverse=True)
+    unique_minutes = np.array([ParserUtils.to_minutes(ParserUtils.parse_time(value)) for value in unique_times], dtype=np.int64)
+    pairs, names = ScheduleIndex.for_df(df).open_restaurants_batch(days, unique_minutes[inverse.reshape(-1)], with_rows=True)
+    results = [[] for _ in days]
+    for query_id, restaurant_id, row in pairs.tolist():
+        results[query_id].append((names[restaurant_id], int(positions[row])))
+    return results
+
+
+# Shard requests answered with schedule positions instead of a QueryProcessor call, so the parent can merge in order
+SHARD_QUERIES = {'open_rows': _open_rows, 'open_rows_batch': _open_rows_batch}
+
+
+def _serve_shard(df: pd.DataFrame, positions: np.ndarray, connection: Connection):
+    """ Worker loop: answers (method, args) requests with QueryProcessor calls on its partition """
+    ScheduleIndex.for_df(df)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        method, args = request
+        try:
+            query = SHARD_QUERIES.get(method)
+            connection.send(('ok', query(df, positions, *args) if query else getattr(QueryProcessor, method)(df, *args)))
+        except Exception as e:
+            connection.send(('error', e))
+    connection.close()
+
+
+class ShardedQueryProcessor:
+    """
+    Scatter-gather query execution over a processed schedule partitioned by restaurant hash.
+
+    Every shard is a worker process holding the rows of its restaurants and answering QueryProcessor
+    calls over a pipe. Day / time queries and searches fan out to every shard and are merged in the
+    parent; restaurant lookups go to the owning shard only. Results match QueryProcessor on the whole
+    schedule, including the order of the restaurants.
+    """
+
+    def __init__(self, df: pd.DataFrame, shards: int = 4):
+        self.shards = shards
+        self._connections = []
+        self._processes = []
+
+        owners = self.owners(df, shards)
+        for shard, shard_df in enumerate(self.partition(df, shards)):
+            # Position of every shard row in the whole schedule, to merge shard results back into schedule order
+            positions = np.flatnonzero(owners == shard)
+            parent_connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(shard_df, positions, child_connection), daemon=True)
+            process.start()
+            child_connection.close()
+            self._connections.append(parent_connection)
+            self._processes.append(process)
+        logger.info(f"Started {shards} shards over {len(df)} schedule rows")
+
+    @staticmethod
+    def partition(df: pd.DataFrame, shards: int) -> List[pd.DataFrame]:
+        """
+        Splits a processed schedule by restaurant hash, all rows of a restaurant land in the same shard
+
+        Args:
+            df (pd.DataFrame): Processed restaurant schedule
+            shards (int): Number of shards
+
+        Returns:
+            List[pd.DataFrame]: One DataFrame per shard, rows in schedule order
+        """
+        owners = ShardedQueryProcessor.owners(df, shards)
+        return [df[owners == shard].reset_index(drop=True) for shard in range(shards)]
+
+    @staticmethod
+    def owners(df: pd.DataFrame, shards: int) -> np.ndarray:
+        """ Shard of every schedule row """
+        return np.fromiter((shard_of(name, shards) for name in df['restaurant_name']), dtype=np.int64, count=len(df))
+
+    def _gather(self, requests: Dict[int, Tuple[str, tuple]]) -> List:
+        """ Sends every shard its request before waiting for any answer, so the shards work in parallel """
+        for shard, request in requests.items():
+            self._connections[shard].send(request)
+        results, error = [], None
+        for shard in requests:
+            status, result = self._connections[shard].recv()
+            if status == 'error':
+                error = error or result
+            results.append(result)
+        if error is not None:
+            logger.error(error)
+            raise error
+        return results
+
+    def _scatter(self, method: str, *args) -> List:
+        return self._gather({shard: (method, args) for shard in range(self.shards)})
+
+    @staticmethod
+    def _merge_names(groups: List[List[Tuple[str, int]]]) -> List[str]:
+        # A restaurant lives in one shard, ordering on its first matching row gives the single process order
+        return [name for name, _ in sorted((entry for group in groups for entry in group), key=lambda entry: entry[1])]
+
+    def get_open_restaurants(self, day: str, input_time: Optional[str] = None) -> list:
+        """ Union of the open restaurants of every shard, see QueryProcessor.get_open_restaurants """
+        return self._merge_names(self._scatter('open_rows', day, input_time))
+
+    def get_open_restaurants_batch(self, days: List[str], input_times: List[str]) -> List[list]:
+        """ Per query union of the open restaurants of every shard, see QueryProcessor.get_open_restaurants_batch """
+        if len(days) != len(input_times):
+            raise ValueError(f"Got {len(days)} days and {len(input_times)} times")
+        if not days:
+            return []
+        results = self._scatter('open_rows_batch', days, input_times)
+        return [self._merge_names(groups) for groups in zip(*results)]
+
+    def get_restaurant_open_timings(self, restaurant_names: Union[str, list]) -> dict:
+        """ Timings from the shard owning each restaurant, see QueryProcessor.get_restaurant_open_timings """
+        if isinstance(restaurant_names, str):
+            restaurant_names = [restaurant_names]
+        requests = {}
+        for name in restaurant_names:
+            requests.setdefault(shard_of(name, self.shards), []).append(name)
+        timings = {}
+        for result in self._gather({shard: ('get_restaurant_open_timings', (names,)) for shard, names in requests.items()}):
+            timings.update(result)
+        return {name: timings[name] for name in restaurant_names}
+
+    def search_restaurants(self, query: str, limit: int = 10) -> list:
+        """ Best matches across the shards, see QueryProcessor.search_restaurants """
+        prefix = " ".join(query.lower().split())
+        names = set().union(*self._scatter('search_restaurants', query, limit))
+        return sorted(names, key=lambda name: (not name.lower().startswith(prefix), name.lower()))[:limit]
+
+    def get_next_open(self, restaurant_name: str, day: str, input_time: str) -> Optional[tuple]:
+        """ Next opening from the shard owning the restaurant, see QueryProcessor.get_next_open """
+        return self._gather({shard_of(restaurant_name, self.shards): ('get_next_open', (restaurant_name, day, input_time))})[0]
+
+    def generate_insights(self) -> dict:
+        """ Insights from the summed partial aggregates of every shard, see QueryProcessor.generate_insights """
+        return QueryProcessor.finalize_insights(QueryProcessor.merge_insight_partials(self._scatter('insight_partials')))
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._connections, self._processes = [], []
+
+    def __enter__(self) -> 'ShardedQueryProcessor':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TestShardedQueryProcessor(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rows = []
+        for i in range(40):
+            name = f"Restaurant {i:02d}"
+            for day in ['Mon', 'Tue', 'Sat', 'Sun'][:1 + i % 4]:
+                rows.append((name, day, f"{8 + i % 5:02d}:00", '23:59' if i % 3 == 0 else f"{17 + i % 6:02d}:30"))
+        cls.df = pd.DataFrame({
+            'restaurant_name': [row[0] for row in rows],
+            'day': [row[1] for row in rows],
+            'open_time': pd.to_datetime([f"1900-01-01 {row[2]}" for row in rows]),
+            'close_time': pd.to_datetime([f"1900-01-01 {row[3]}" for row in rows]),
+        })
+        cls.processor = ShardedQueryProcessor(cls.df, shards=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.processor.close()
+
+    def test_partition(self):
+        shards = ShardedQueryProcessor.partition(self.df, 3)
+        self.assertEqual(sum(len(shard) for shard in shards), len(self.df))
+        self.assertTrue(all(len(shard) for shard in shards))
+        owners = [set(shard['restaurant_name']) for shard in shards]
+        self.assertEqual(set().union(*owners), set(self.df['restaurant_name']))
+        self.assertEqual(sum(len(names) for names in owners), self.df['restaurant_name'].nunique())
+
+    def test_open_restaurants(self):
+        for day, input_time in [('Mon', '09:30 AM'), ('Sat', '10:45 PM'), ('Sun', None), ('Wed', '11:00 AM')]:
+            self.assertEqual(self.processor.get_open_restaurants(day, input_time), QueryProcessor.get_open_restaurants(self.df, day, input_time))
+        days, times = ['Mon', 'Tue', 'Sun'], ['11:00 AM', '06:00 PM', '11:59 PM']
+        self.assertEqual(self.processor.get_open_restaurants_batch(days, times), QueryProcessor.get_open_restaurants_batch(self.df, days, times))
+
+    def test_order_of_first_matching_row(self):
+        # A's first row does not match at 11:30, so B (its first row matches earlier) comes first
+        df = pd.DataFrame({
+            'restaurant_name': ['A', 'B', 'A'],
+            'day': ['Mon', 'Mon', 'Mon'],
+            'open_time': pd.to_datetime(['1900-01-01 09:00', '1900-01-01 08:00', '1900-01-01 11:00']),
+            'close_time': pd.to_datetime(['1900-01-01 10:00', '1900-01-01 12:00', '1900-01-01 12:00']),
+        })
+        self.assertNotEqual(shard_of('A', 3), shard_of('B', 3))
+        with ShardedQueryProcessor(df, shards=3) as processor:
+            self.assertEqual(processor.get_open_restaurants('Mon', '11:30 AM'), QueryProcessor.get_open_restaurants(df, 'Mon', '11:30 AM'))
+            self.assertEqual(processor.get_open_restaurants('Mon', '11:30 AM'), ['B', 'A'])
+            days, times = ['Mon', 'Mon', 'Tue'], ['11:30 AM', '09:30 AM', '11:30 AM']
+            self.assertEqual(processor.get_open_restaurants_batch(days, times), QueryProcessor.get_open_restaurants_batch(df, days, times))
+
+    def test_lookups(self):
+        names = ['Restaurant 07', 'Unknown', 'Restaurant 30']
+        self.assertEqual(self.processor.get_restaurant_open_timings(names), QueryProcessor.get_restaurant_open_timings(self.df, names))
+        self.assertEqual(self.processor.search_restaurants('restaurant 1', 5), QueryProcessor.search_restaurants(self.df, 'restaurant 1', 5))
+        self.assertEqual(self.processor.get_next_open('Restaurant 05', 'Tue', '11:00 PM'), QueryProcessor.get_next_open(self.df, 'Restaurant 05', 'Tue', '11:00 PM'))
+
+    def test_generate_insights(self):
+        expected = QueryProcessor.generate_insights(self.df)
+        insights = self.processor.generate_insights()
+        for day, counts in expected.pop('open_count_per_minute').items():
+            self.assertEqual(insights['open_count_per_minute'][day].tolist(), counts.tolist())
+        insights.pop('open_count_per_minute')
+        self.assertEqual(insights, expected)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.processor.get_open_restaurants('Mon', 'not a time')
+        self.assertEqual(self.processor.get_open_restaurants('Mon', '09:30 AM'), QueryProcessor.get_open_restaurants(self.df, 'Mon', '09:30 AM'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from data_processor import DataProcesser
+from data_reader import DataReader
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+SNAPSHOT_VERSION = 1
+MANIFEST = 'manifest.json'
+ARRAYS = ['restaurant_id', 'day', 'open_minute', 'close_minute']
+
+
+def begin_save(directory: str):
+    """
+    Prepares a directory for a save. The old manifest is removed first and write_manifest writes the
+    new one last, so an interrupted save leaves no manifest and the directory does not load
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def save_names(directory: str, schedule: CompactSchedule):
+    # Fixed width unicode keeps the name table memory-mappable
+    np.save(os.path.join(directory, "names.npy"), np.asarray(schedule.names.tolist(), dtype=str))
+
+
+def write_manifest(directory: str, manifest: Dict):
+    """ Writes the manifest through a temporary file, so it is either complete or missing """
+    manifest_path = os.path.join(directory, MANIFEST)
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+class ScheduleSnapshot:
+    """
+    Saves the processed schedule as .npy files next to a manifest of the input files, so a cold
+    start on unchanged inputs memory-maps the arrays instead of re-reading and re-parsing the CSVs.
+    """
+
+    @staticmethod
+    def _file_hash(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _fingerprint(file_path: str) -> Dict:
+        stat = os.stat(file_path)
+        return {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'sha256': ScheduleSnapshot._file_hash(file_path)}
+
+    @staticmethod
+    def _is_unchanged(file_path: str, fingerprint: Dict) -> bool:
+        """ Size and mtime are checked first, the content hash only when the mtime moved """
+        if os.path.abspath(file_path) != fingerprint['path'] or not os.path.exists(file_path):
+            return False
+        stat = os.stat(file_path)
+        if stat.st_size != fingerprint['size']:
+            return False
+        return stat.st_mtime_ns == fingerprint['mtime_ns'] or ScheduleSnapshot._file_hash(file_path) == fingerprint['sha256']
+
+    @staticmethod
+    def save(schedule: Union[pd.DataFrame, CompactSchedule], directory: str, filenames: List[str]):
+        """
+        Writes the schedule arrays and the input fingerprints. The manifest is written last, so an
+        interrupted save leaves no manifest and is rebuilt on the next load
+
+        Args:
+            schedule (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            directory (str): Snapshot directory
+            filenames (List[str]): Input files the schedule was built from
+        """
+        if not isinstance(schedule, CompactSchedule):
+            schedule = CompactSchedule.from_df(schedule)
+
+        begin_save(directory)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(schedule, name))
+        save_names(directory, schedule)
+        write_manifest(directory, {'version': SNAPSHOT_VERSION, 'inputs': [ScheduleSnapshot._fingerprint(file_path) for file_path in filenames]})
+
+    @staticmethod
+    def load(directory: str, filenames: List[str]) -> Optional[CompactSchedule]:
+        """
+        Memory-maps a saved schedule if it was built from the same, unchanged input files
+
+        Args:
+            directory (str): Snapshot directory
+            filenames (List[str]): Input files of the current run
+
+        Returns:
+            Optional[CompactSchedule]: Saved schedule, or None if missing or stale
+        """
+        manifest_path = os.path.join(directory, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        inputs = manifest.get('inputs', [])
+        if manifest.get('version') != SNAPSHOT_VERSION or len(inputs) != len(filenames):
+            logger.info(f"Snapshot {directory} is stale")
+            return None
+        if not all(ScheduleSnapshot._is_unchanged(file_path, fingerprint) for file_path, fingerprint in zip(filenames, inputs)):
+            logger.info(f"Input files changed since snapshot {directory}")
+            return None
+
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}
+        names = np.load(os.path.join(directory, "names.npy"), mmap_mode='r')
+        return CompactSchedule(names=np.asarray(names.tolist(), dtype=object), **arrays)
+
+    @staticmethod
+    def load_or_build(filenames: List[str], directory: str) -> CompactSchedule:
+        """
+        Loads the snapshot for the input files, rebuilding and saving it when missing or stale
+
+        Args:
+            filenames (List[str]): Input files
+            directory (str): Snapshot directory
+
+        Returns:
+            CompactSchedule: Processed restaurant schedule
+        """
+        schedule = ScheduleSnapshot.load(directory, filenames)
+        if schedule is not None:
+            logger.info(f"Loaded schedule snapshot {directory}")
+            return schedule
+
+        reader = DataReader(filenames)
+        schedule = DataProcesser.build_restaurant_df(reader.get_restaurants_df(), compact=True)
+        ScheduleSnapshot.save(schedule, directory, filenames)
+        return schedule
+
+
+class TestScheduleSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.sample_path = os.path.join(self.temp_dir.name, "sample.csv")
+        self.snapshot_dir = os.path.join(self.temp_dir.name, "snapshot")
+        with open(self.sample_path, "w") as f:
+            f.write("Kushi Tsuru,Mon-Sun 11:30 am - 9 pm\n")
+            f.write("Marrakech Moroccan Restaurant,Mon-Sun 5:30 pm - 2 am\n")
+
+    def test_load_or_build(self):
+        built = ScheduleSnapshot.load_or_build([self.sample_path], self.snapshot_dir)
+        loaded = ScheduleSnapshot.load(self.snapshot_dir, [self.sample_path])
+        self.assertIsInstance(loaded.open_minute, np.memmap)
+        self.assertEqual(loaded.names.tolist(), built.names.tolist())
+        for name in ARRAYS:
+            self.assertEqual(getattr(loaded, name).tolist(), getattr(built, name).tolist())
+
+    def test_invalidated_by_change(self):
+        ScheduleSnapshot.load_or_build([self.sample_path], self.snapshot_dir)
+        with open(self.sample_path, "a") as f:
+            f.write("Mifune Restaurant,Mon-Sun 11 am - 10 pm\n")
+        self.assertIsNone(ScheduleSnapshot.load(self.snapshot_dir, [self.sample_path]))
+        self.assertEqual(len(ScheduleSnapshot.load_or_build([self.sample_path], self.snapshot_dir).names), 3)
+
+    def test_touch_without_change(self):
+        ScheduleSnapshot.load_or_build([self.sample_path], self.snapshot_dir)
+        stat = os.stat(self.sample_path)
+        os.utime(self.sample_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNotNone(ScheduleSnapshot.load(self.snapshot_dir, [self.sample_path]))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
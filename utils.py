@@ -1,17 +1,43 @@
+import importlib
+import json
 import logging
 import os
 from pathlib import Path
-import pandas as pd
-import re
 from datetime import datetime, time
 from typing import List, Dict, Optional, Union
 import unittest
 
+from constants import DAY_TIMES
+from schedule_parser import ScheduleParser
+
 filename = os.path.basename(__file__)
 
-logging.basicConfig( level=logging.DEBUG, format='%(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(filename)
 
+class LazyModule:
+    """
+    Stand-in for a heavy module (pandas, numpy) that imports it on first attribute access, so modules
+    used by the lightweight path can refer to `pd.DataFrame` without paying its import on startup
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attribute: str):
+        return getattr(importlib.import_module(self._name), attribute)
+
+def to_json(value) -> str:
+    """ JSON encoder for query results: numpy scalars / arrays and schedule times. numpy is never imported here """
+    def default(item):
+        # pd.Timestamp is a datetime
+        if isinstance(item, datetime):
+            return item.strftime('%I:%M %p')
+        # numpy arrays and scalars
+        if hasattr(item, 'tolist'):
+            return item.tolist()
+        raise TypeError(f"Cannot serialize {type(item).__name__}")
+    return json.dumps(value, default=default)
+
 class ParserUtils:
 
     days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
@@ -62,21 +88,50 @@ class ParserUtils:
         Args:
             time_str (str): Timing string (11:00 am - 11 pm)
 
+        Raises:
+            ValueError: The string is not an open - close time range
+
         Returns:
             datetime: Open time
             datetime: Closing time
 
         """
-        # Extract timings using regex
-        times = re.findall(r'(\d{1,2}(?::\d{2})?\s*[apm]{2})', time_str, re.IGNORECASE)
-
         try:
-            open_time = datetime.strptime(times[0], "%I:%M %p") if ":" in times[0] else datetime.strptime(times[0], "%I %p")
-            close_time = datetime.strptime(times[1], "%I:%M %p") if ":" in times[1] else datetime.strptime(times[1], "%I %p")
+            open_minute, close_minute = ScheduleParser.parse_time_range(time_str)
         except ValueError as ve:
             logger.error("Failed to parse time %s %s", time_str, ve)
-        return open_time, close_time
-    
+            raise ve
+        return DAY_TIMES[open_minute], DAY_TIMES[close_minute]
+
+    @staticmethod
+    def parse_time(time_str: str) -> datetime:
+        """
+        Parse a 12 hour time string with optional minutes (11 am / 11:30 AM)
+
+        Args:
+            time_str (str): 12 hour time format
+
+        Raises:
+            ValueError: The string is not a valid time
+
+        Returns:
+            datetime: Time anchored at 1900-01-01
+        """
+        return DAY_TIMES[ScheduleParser.parse_time(time_str)]
+
+    @staticmethod
+    def to_minutes(value: datetime) -> int:
+        """
+        Minutes elapsed since midnight for a parsed time
+
+        Args:
+            value (datetime): Parsed time
+
+        Returns:
+            int: Minute of the day (0 - 1439)
+        """
+        return value.hour * 60 + value.minute
+
     @staticmethod
     def clean_string(input_str: str) -> (str):
         return input_str.strip(' ",')
@@ -127,11 +182,27 @@ class TestParserUtils(unittest.TestCase):
         # Test mixed minutes
         self.assertEqual(ParserUtils.extract_time('9 pm -11:59 am'), (datetime.strptime('9:00 PM', "%I:%M %p"), datetime.strptime('11:59 AM', "%I:%M %p")))
 
+        # Test invalid timings
+        for invalid in ['11:30 ma - 9:00 pm', '11 am', '']:
+            with self.assertRaises(ValueError):
+                ParserUtils.extract_time(invalid)
+
     def test_clean_string(self):
         # Test basic timings
         self.assertEqual(ParserUtils.clean_string('"Mon -Fri 11 am - 1 pm,'), "Mon -Fri 11 am - 1 pm")
         self.assertEqual(ParserUtils.clean_string('Mon -Fri 11 am - 1 pm",'), "Mon -Fri 11 am - 1 pm")
 
+    def test_lazy_module(self):
+        lazy_json = LazyModule('json')
+        self.assertEqual(lazy_json.dumps([1]), '[1]')
+
+    def test_to_json(self):
+        import numpy as np
+        value = {'count': np.int64(3), 'curve': np.array([1, 2]), 'opens': datetime(1900, 1, 1, 23, 30)}
+        self.assertEqual(to_json(value), '{"count": 3, "curve": [1, 2], "opens": "11:30 PM"}')
+        with self.assertRaises(TypeError):
+            to_json({'bad': object()})
+
     def test_is_valid_csv(self):
         self.assertFalse(ParserUtils.is_valid_csv("input_files\empty_file.csv"))
         self.assertFalse(ParserUtils.is_valid_csv("input_files\invalid_file.csv"))
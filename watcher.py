@@ -0,0 +1,294 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+import unittest
+
+import pandas as pd
+
+from data_processor import DataProcesser
+from data_reader import DataReader
+from event_index import EventIndex
+from instrumentation import Metrics, metrics
+from name_index import NameIndex
+from query_processor import QueryProcessor
+from schedule_index import ScheduleIndex
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+# (path, mtime in ns, size) of every input file, -1 / -1 for a missing file
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+class ScheduleVersion:
+    """
+    One build of the processed schedule and the signature of the files it was read from. A snapshot
+    is never modified after it is built, a reload builds a new one.
+    """
+
+    def __init__(self, df: pd.DataFrame, version: int, signature: Signature, loaded_at: float, quarantine: list):
+        self.df = df
+        self.version = version
+        self.signature = signature
+        self.loaded_at = loaded_at
+        self.quarantine = quarantine
+
+
+class ScheduleWatcher:
+    """
+    Polls the input files and rebuilds the processed schedule when they change.
+
+    The new schedule, its interval tree, name index and event index are built on the watcher thread
+    while queries keep using the current snapshot. The finished snapshot is then swapped in with a
+    single reference assignment: a query that took the snapshot before the swap finishes on the
+    previous build, which stays alive as long as it is referenced, and readers never take a lock.
+
+    A change is loaded once the files look the same on two polls in a row, so a file that is still
+    being written is not read half way. A failed reload keeps the current snapshot.
+
+    Metrics: `watcher.reload` timer, `watcher.reloads` and `watcher.reload_failures` counters,
+    `watcher.staleness_seconds` (how long the files have been newer than the snapshot) and
+    `watcher.snapshot_age_seconds` gauges.
+    """
+
+    def __init__(self, filenames: List[str], interval: float = 1.0, registry: Metrics = metrics):
+        self.filenames = list(filenames)
+        self.interval = interval
+        self.metrics = registry
+        self._snapshot = None
+        self._pending = None
+        self._failed = None
+        self._stale_since = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.reload()
+
+    @property
+    def snapshot(self) -> ScheduleVersion:
+        """ Current snapshot. Take it once per query and use it throughout """
+        return self._snapshot
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._snapshot.df
+
+    def signature(self) -> Signature:
+        """ (path, mtime in ns, size) of every input file """
+        signature = []
+        for path in self.filenames:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, -1, -1))
+        return tuple(signature)
+
+    def build(self, signature: Signature) -> ScheduleVersion:
+        """
+        Reads and processes the input files and builds the query structures of the new schedule
+
+        Args:
+            signature (Signature): Signature of the files taken before reading them
+
+        Raises:
+            Exception: An input file is missing or empty
+
+        Returns:
+            ScheduleVersion: Snapshot ready to be swapped in
+        """
+        # DataReader logs a missing or empty file and keeps the rows read so far, which would swap in a
+        # partial schedule. Every file has to be readable, or the reload fails and the snapshot is kept
+        invalid = [path for path in self.filenames if not ParserUtils.is_valid_csv(path)]
+        if invalid:
+            raise Exception(f"Invalid input files {invalid}")
+
+        quarantine = []
+        reader = DataReader(self.filenames, quarantine=quarantine)
+        df = DataProcesser.build_restaurant_df(reader.get_restaurants_df(), quarantine=quarantine)
+        # Build the indexes here so the first queries on the new snapshot do not pay for them
+        ScheduleIndex.for_df(df)
+        NameIndex.for_df(df)
+        EventIndex.for_df(df)
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        return ScheduleVersion(df, version, signature, time.time(), quarantine)
+
+    def reload(self) -> ScheduleVersion:
+        """
+        Rebuilds the schedule from the files and swaps it in
+
+        Raises:
+            Exception: The files could not be read or processed, the current snapshot is kept
+
+        Returns:
+            ScheduleVersion: The new snapshot
+        """
+        signature = self.signature()
+        try:
+            with self.metrics.timer('watcher.reload'):
+                snapshot = self.build(signature)
+        except Exception as e:
+            self.metrics.increment('watcher.reload_failures')
+            self._failed = signature
+            logger.error(e)
+            raise e
+
+        self._snapshot = snapshot
+        self._pending = self._failed = None
+        if self.signature() == signature:
+            self._stale_since = None
+        self.metrics.increment('watcher.reloads')
+        self._update_gauges()
+        logger.info(f"Loaded schedule version {snapshot.version}: {len(snapshot.df)} rows, {len(snapshot.quarantine)} quarantined")
+        return snapshot
+
+    def staleness(self) -> float:
+        """ Seconds the files have been newer than the current snapshot, 0 when it is up to date """
+        return max(time.time() - self._stale_since, 0.0) if self._stale_since is not None else 0.0
+
+    def _update_gauges(self):
+        self.metrics.set_gauge('watcher.staleness_seconds', self.staleness())
+        self.metrics.set_gauge('watcher.snapshot_age_seconds', time.time() - self._snapshot.loaded_at)
+
+    def check(self) -> bool:
+        """
+        One poll of the input files, reloading when they changed and then stayed the same since the previous poll
+
+        Returns:
+            bool: A new snapshot was swapped in
+        """
+        signature = self.signature()
+        if signature == self._snapshot.signature:
+            self._pending = None
+            self._stale_since = None
+            self._update_gauges()
+            return False
+
+        if self._stale_since is None:
+            changed = [entry[1] / 1e9 for entry in set(signature) - set(self._snapshot.signature) if entry[1] >= 0]
+            self._stale_since = min(changed + [time.time()])
+        settled = signature == self._pending
+        self._pending = signature
+        reloaded = False
+        if settled and signature != self._failed:
+            try:
+                self.reload()
+                reloaded = True
+            except Exception:
+                # Logged by reload, keep serving the current snapshot until the files change again
+                pass
+        self._update_gauges()
+        return reloaded
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(e)
+
+    def start(self) -> 'ScheduleWatcher':
+        """ Starts polling on a daemon thread """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='schedule-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def query(self, method: str, *args):
+        """
+        Runs a QueryProcessor method on the current snapshot, e.g. watcher.query('get_open_restaurants', 'Mon', '11:30 AM')
+
+        Args:
+            method (str): QueryProcessor method name
+            *args: Arguments after the DataFrame
+
+        Returns:
+            The result of the QueryProcessor call
+        """
+        return getattr(QueryProcessor, method)(self._snapshot.df, *args)
+
+    def __enter__(self) -> 'ScheduleWatcher':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class TestScheduleWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "schedule.csv")
+        self.write('"Kushi Tsuru","Mon-Sun 11:30 am - 9 pm"\n')
+        self.registry = Metrics()
+        self.watcher = ScheduleWatcher([self.path], interval=0.01, registry=self.registry)
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.directory.cleanup()
+
+    def write(self, text: str):
+        with open(self.path, 'w') as schedule_file:
+            schedule_file.write(text)
+
+    def test_reload_after_change_settles(self):
+        old = self.watcher.snapshot
+        self.assertFalse(self.watcher.check())
+        self.write('"Kushi Tsuru","Mon-Sun 11:30 am - 9 pm"\n"Nick\'s Lighthouse","Mon-Sun 11 am - 10:30 pm"\n')
+        self.assertFalse(self.watcher.check())
+        self.assertIsNotNone(self.watcher._stale_since)
+        self.assertTrue(self.watcher.check())
+
+        self.assertEqual(self.watcher.snapshot.version, 2)
+        self.assertEqual(self.watcher.query('get_open_restaurants', 'Mon', '10:00 PM'), ["Nick's Lighthouse"])
+        # A query holding the previous snapshot still sees the previous schedule
+        self.assertEqual(QueryProcessor.get_open_restaurants(old.df, 'Mon', '10:00 PM'), [])
+        self.assertIs(ScheduleIndex.for_df(self.watcher.df), ScheduleIndex.for_df(self.watcher.df))
+        self.assertEqual(self.registry.counter('watcher.reloads'), 2)
+        self.assertEqual(self.registry.histogram('watcher.reload')['count'], 2)
+        self.assertEqual(self.registry.gauge('watcher.staleness_seconds'), 0)
+
+    def test_failed_reload_keeps_snapshot(self):
+        snapshot = self.watcher.snapshot
+        os.remove(self.path)
+        self.assertFalse(self.watcher.check())
+        self.assertFalse(self.watcher.check())
+        self.assertFalse(self.watcher.check())
+        self.assertIs(self.watcher.snapshot, snapshot)
+        self.assertEqual(self.registry.counter('watcher.reload_failures'), 1)
+        self.assertEqual(self.watcher.query('get_open_restaurants', 'Mon', '12:00 PM'), ['Kushi Tsuru'])
+
+    def test_missing_file_keeps_snapshot(self):
+        other_path = os.path.join(self.directory.name, "other.csv")
+        with open(other_path, 'w') as schedule_file:
+            schedule_file.write('"Bow Hon Restaurant","Mon-Sun 11 am - 10 pm"\n')
+        watcher = ScheduleWatcher([self.path, other_path], interval=0.01, registry=self.registry)
+        snapshot = watcher.snapshot
+        os.remove(other_path)
+        for _ in range(3):
+            self.assertFalse(watcher.check())
+        self.assertIs(watcher.snapshot, snapshot)
+        self.assertEqual(self.registry.counter('watcher.reload_failures'), 1)
+        self.assertEqual(watcher.query('get_open_restaurants', 'Mon', '12:00 PM'), ['Kushi Tsuru', 'Bow Hon Restaurant'])
+
+    def test_background_thread(self):
+        with self.watcher:
+            self.write('"Bow Hon Restaurant","Mon-Sun 11 am - 10 pm"\n')
+            deadline = time.time() + 5
+            while self.watcher.snapshot.version == 1 and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(self.watcher.query('get_open_restaurants', 'Tue', '12:00 PM'), ['Bow Hon Restaurant'])
+
+if __name__ == '__main__':
+    unittest.main()
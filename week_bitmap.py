@@ -0,0 +1,246 @@
+import logging
+import os
+from typing import List, Sequence, Tuple, Union
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from compact_schedule import CompactSchedule
+from constants import TIME_LABELS
+from event_index import EventIndex
+from schedule_index import MINUTES_PER_DAY, MINUTES_PER_WEEK, ScheduleIndex, cached_for_df
+from utils import ParserUtils
+
+filename = os.path.basename(__file__)
+
+logger = logging.getLogger(filename)
+
+DEFAULT_SLOT_MINUTES = 15
+
+# Set bits of every byte value
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int32)
+
+# Week bitmap cache keyed on id() of the processed dataframe and the slot length, see cached_for_df
+_WEEK_BITMAP_CACHE = {}
+
+
+class WeekBitmap:
+    """
+    One bit per slot of the week (672 fifteen minute or 10080 one minute slots) for every
+    restaurant, packed with np.packbits into a (restaurants, slots / 8) uint8 matrix.
+
+    Two bitmaps are kept: `full` has the bit of a slot set when the restaurant is open for every
+    minute of it, `partial` when it is open for any minute of it. A window query turns the window
+    into a packed slot mask and answers for all restaurants at once: open throughout is
+    popcount(full & mask) == popcount(mask), open at any point is any(partial & mask), and open
+    together is the AND of the restaurants' full bitmaps.
+
+    Windows are [start, end) in minutes and rounded outwards to the slot grid, so times on the grid
+    (every 15 minutes by default) are exact.
+    """
+
+    def __init__(self, schedule: CompactSchedule, slot_minutes: int = DEFAULT_SLOT_MINUTES):
+        if slot_minutes <= 0 or MINUTES_PER_DAY % slot_minutes:
+            raise ValueError(f"Slot length {slot_minutes} does not divide a day")
+        self.names = schedule.names
+        self.slot_minutes = slot_minutes
+        self.slots = MINUTES_PER_WEEK // slot_minutes
+        self._ids = {name: i for i, name in enumerate(self.names.tolist())}
+
+        restaurant_id = np.asarray(schedule.restaurant_id, dtype=np.int64)
+        day = np.asarray(schedule.day, dtype=np.int64)
+        starts = day * MINUTES_PER_DAY + np.asarray(schedule.open_minute, dtype=np.int64)
+        ends = day * MINUTES_PER_DAY + np.asarray(schedule.close_minute, dtype=np.int64)
+        # Rows split at midnight would leave the slots around 12:00 AM partly open, merge them first
+        run_restaurant, run_start, run_end = EventIndex.merge_runs(restaurant_id, starts, ends)
+
+        # Runs cover [start, end] minutes: every slot they touch is partly open, the slots inside them fully
+        self.partial = self._pack(run_restaurant, run_start // slot_minutes, run_end // slot_minutes + 1)
+        first_full = -(-run_start // slot_minutes)
+        last_full = (run_end + 1) // slot_minutes
+        inside = first_full < last_full
+        self.full = self._pack(run_restaurant[inside], first_full[inside], last_full[inside])
+
+    def _pack(self, restaurant_id: np.ndarray, first_slot: np.ndarray, end_slot: np.ndarray) -> np.ndarray:
+        """ Packed bitmap with slots [first_slot, end_slot) of every restaurant set """
+        width = self.slots + 1
+        coverage = np.zeros(len(self.names) * width, dtype=np.int32)
+        np.add.at(coverage, restaurant_id * width + first_slot, 1)
+        np.add.at(coverage, restaurant_id * width + end_slot, -1)
+        coverage = np.cumsum(coverage.reshape(len(self.names), width)[:, :self.slots], axis=1)
+        return np.packbits(coverage > 0, axis=1)
+
+    @staticmethod
+    def from_df(df: Union[pd.DataFrame, CompactSchedule], slot_minutes: int = DEFAULT_SLOT_MINUTES) -> 'WeekBitmap':
+        """
+        Build week bitmaps from the output of DataProcesser.build_restaurant_df
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            slot_minutes (int, optional): Slot length, dividing a day. Defaults to 15.
+
+        Returns:
+            WeekBitmap: Bitmaps of every restaurant
+        """
+        return WeekBitmap(df if isinstance(df, CompactSchedule) else CompactSchedule.from_df(df), slot_minutes)
+
+    @staticmethod
+    def for_df(df: Union[pd.DataFrame, CompactSchedule], slot_minutes: int = DEFAULT_SLOT_MINUTES) -> 'WeekBitmap':
+        """
+        Returns the week bitmaps of a processed schedule, building them on first use and reusing them afterwards
+
+        Args:
+            df (Union[pd.DataFrame, CompactSchedule]): Processed restaurant schedule
+            slot_minutes (int, optional): Slot length, dividing a day. Defaults to 15.
+
+        Returns:
+            WeekBitmap: Cached bitmaps of every restaurant
+        """
+        return cached_for_df(_WEEK_BITMAP_CACHE, df, lambda: WeekBitmap.from_df(df, slot_minutes), key=slot_minutes)
+
+    def window_mask(self, start_day: str, start_minute: int, end_day: str, end_minute: int) -> np.ndarray:
+        """
+        Packed mask of the slots overlapping [start, end), wrapping past Sun 11:59 PM
+
+        Args:
+            start_day (str): Day of the week in %a format: Mon / Tue / Wed etc
+            start_minute (int): Minute of the day the window starts at
+            end_day (str): Day of the window end
+            end_minute (int): Minute of the day the window ends at, not included
+
+        Raises:
+            ValueError: Unknown day or an empty window
+
+        Returns:
+            np.ndarray: Packed uint8 mask, as wide as a bitmap row
+        """
+        if start_day not in ParserUtils.days or end_day not in ParserUtils.days:
+            raise ValueError(f"Unknown day in {start_day} - {end_day}")
+        start = ScheduleIndex.minute_of_week(start_day, start_minute)
+        length = (ScheduleIndex.minute_of_week(end_day, end_minute) - start) % MINUTES_PER_WEEK
+        if not length:
+            raise ValueError(f"Empty window {start_day} {TIME_LABELS[start_minute]} - {end_day} {TIME_LABELS[end_minute]}")
+        first_slot = start // self.slot_minutes
+        end_slot = -(-(start + length) // self.slot_minutes)
+        mask = np.zeros(self.slots, dtype=bool)
+        mask[np.arange(first_slot, end_slot) % self.slots] = True
+        return np.packbits(mask)
+
+    def _restaurants(self, selected: np.ndarray) -> List[str]:
+        return self.names[np.flatnonzero(selected)].tolist()
+
+    def open_throughout(self, start_day: str, start_minute: int, end_day: str, end_minute: int) -> List[str]:
+        """
+        Restaurants open for the whole window, see window_mask for the arguments
+
+        Returns:
+            List[str]: Restaurant names in schedule order
+        """
+        mask = self.window_mask(start_day, start_minute, end_day, end_minute)
+        return self._restaurants(POPCOUNT[self.full & mask].sum(axis=1) == POPCOUNT[mask].sum())
+
+    def open_any_time(self, start_day: str, start_minute: int, end_day: str, end_minute: int) -> List[str]:
+        """
+        Restaurants open at some point of the window, see window_mask for the arguments
+
+        Returns:
+            List[str]: Restaurant names in schedule order
+        """
+        mask = self.window_mask(start_day, start_minute, end_day, end_minute)
+        return self._restaurants((self.partial & mask).any(axis=1))
+
+    def open_together(self, names: Sequence[str], limit: int = 5) -> List[Tuple[str, str, str, str]]:
+        """
+        First windows of the week, from Mon 12:00 AM, when all the restaurants are open together
+
+        Args:
+            names (Sequence[str]): Restaurant names
+            limit (int, optional): Maximum number of windows. Defaults to 5.
+
+        Returns:
+            List[Tuple[str, str, str, str]]: Start day, start time, end day and end time of every
+            window, end not included. Empty when a restaurant is unknown or they never overlap
+        """
+        if not names or any(name not in self._ids for name in names):
+            return []
+        together = np.bitwise_and.reduce(self.full[[self._ids[name] for name in names]], axis=0)
+        slots = np.unpackbits(together)[:self.slots].astype(bool)
+        if slots.all():
+            return [('Mon', TIME_LABELS[0], 'Mon', TIME_LABELS[0])]
+
+        edges = np.diff(slots.astype(np.int8), prepend=0, append=0)
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if len(starts) > 1 and starts[0] == 0 and ends[-1] == self.slots:
+            # Open through Sun 11:59 PM into Mon 12:00 AM: one window starting on Sunday
+            starts, ends = starts[1:], np.append(ends[1:-1], ends[0] + self.slots)
+
+        windows = []
+        for start, end in zip(starts[:limit].tolist(), ends[:limit].tolist()):
+            start_minute, end_minute = start * self.slot_minutes, end * self.slot_minutes % MINUTES_PER_WEEK
+            windows.append((ParserUtils.days[start_minute // MINUTES_PER_DAY], TIME_LABELS[start_minute % MINUTES_PER_DAY],
+                            ParserUtils.days[end_minute // MINUTES_PER_DAY], TIME_LABELS[end_minute % MINUTES_PER_DAY]))
+        return windows
+
+
+class TestWeekBitmap(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        A-1 Cafe Restaurant     Mon-Sun 11 am - 10 pm
+        Nick's Lighthouse       Fri-Sat 5 pm - 1 am
+        Night Owl               Sun 8 pm - 2 am
+        Early Bird              Mon 6:10 am - 2:05 pm
+        '''
+        rows = [('A-1 Cafe Restaurant', day, '11:00', '22:00') for day in ParserUtils.days] + [
+            ('Nick\'s Lighthouse', 'Fri', '17:00', '23:59'), ('Nick\'s Lighthouse', 'Sat', '00:00', '01:00'),
+            ('Nick\'s Lighthouse', 'Sat', '17:00', '23:59'), ('Nick\'s Lighthouse', 'Sun', '00:00', '01:00'),
+            ('Night Owl', 'Sun', '20:00', '23:59'), ('Night Owl', 'Mon', '00:00', '02:00'),
+            ('Early Bird', 'Mon', '06:10', '14:05'),
+        ]
+        self.df = pd.DataFrame({
+            'restaurant_name': [row[0] for row in rows],
+            'day': [row[1] for row in rows],
+            'open_time': pd.to_datetime([f"1900-01-01 {row[2]}" for row in rows]),
+            'close_time': pd.to_datetime([f"1900-01-01 {row[3]}" for row in rows]),
+        })
+        self.bitmap = WeekBitmap.from_df(self.df)
+
+    def test_packed_bits(self):
+        self.assertEqual(self.bitmap.full.shape, (4, 84))
+        # Early Bird is partly open in the 6:00 and 2:00 PM slots only
+        early = np.unpackbits(self.bitmap.partial[3]).astype(bool) & ~np.unpackbits(self.bitmap.full[3]).astype(bool)
+        self.assertEqual(np.flatnonzero(early).tolist(), [24, 56])
+
+    def test_open_throughout(self):
+        self.assertEqual(self.bitmap.open_throughout('Fri', 21 * 60, 'Sat', 60), ['Nick\'s Lighthouse'])
+        self.assertEqual(self.bitmap.open_throughout('Fri', 21 * 60, 'Sat', 61), [])
+        self.assertEqual(self.bitmap.open_throughout('Sun', 23 * 60, 'Mon', 60), ['Night Owl'])
+        self.assertEqual(self.bitmap.open_throughout('Mon', 12 * 60, 'Mon', 14 * 60), ['A-1 Cafe Restaurant', 'Early Bird'])
+
+    def test_open_any_time(self):
+        self.assertEqual(self.bitmap.open_any_time('Mon', 14 * 60, 'Mon', 16 * 60), ['A-1 Cafe Restaurant', 'Early Bird'])
+        self.assertEqual(self.bitmap.open_any_time('Tue', 2 * 60, 'Tue', 4 * 60), [])
+        self.assertEqual(self.bitmap.open_any_time('Sat', 22 * 60 + 30, 'Sat', 23 * 60), ['Nick\'s Lighthouse'])
+        with self.assertRaises(ValueError):
+            self.bitmap.open_any_time('Mon', 60, 'Mon', 60)
+
+    def test_open_together(self):
+        self.assertEqual(self.bitmap.open_together(['A-1 Cafe Restaurant', 'Nick\'s Lighthouse']),
+                         [('Fri', '05:00 PM', 'Fri', '10:00 PM'), ('Sat', '05:00 PM', 'Sat', '10:00 PM')])
+        self.assertEqual(self.bitmap.open_together(['A-1 Cafe Restaurant', 'Early Bird'], limit=1), [('Mon', '11:00 AM', 'Mon', '02:00 PM')])
+        self.assertEqual(self.bitmap.open_together(['Night Owl']), [('Sun', '08:00 PM', 'Mon', '02:00 AM')])
+        self.assertEqual(self.bitmap.open_together(['Night Owl', 'Unknown']), [])
+
+    def test_one_minute_slots_match_point_queries(self):
+        bitmap = WeekBitmap.for_df(self.df, slot_minutes=1)
+        self.assertIs(WeekBitmap.for_df(self.df, slot_minutes=1), bitmap)
+        index = ScheduleIndex.from_df(self.df)
+        for day in ParserUtils.days:
+            for minute in range(0, MINUTES_PER_DAY, 7):
+                expected = index.open_restaurants(day, minute)
+                end_day = ParserUtils.days[(ParserUtils.days.index(day) + (minute + 1) // MINUTES_PER_DAY) % 7]
+                self.assertEqual(sorted(bitmap.open_throughout(day, minute, end_day, (minute + 1) % MINUTES_PER_DAY)), sorted(expected))
+
+if __name__ == '__main__':
+    unittest.main()